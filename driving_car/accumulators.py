@@ -0,0 +1,151 @@
+"""
+Driving Car Simulation - Occupancy Accumulators
+
+Fleet engine observers that answer "which cells are visited most" and "how
+much of the field has been covered" without logging positions:
+
+- Heatmap counts visits per tile in a flat array: a car visits the cell it
+  starts on (or is spawned on) and every cell it moves into.
+- Coverage keeps one bitset of visited tiles per fleet (a group of cars).
+
+Both work at cell level (tile=1) or on square tiles of `tile` x `tile`
+cells, and cost one index computation per moved car and tick. Only the
+cell a car ends a tick on is counted, not the cells a fast car sweeps over
+on the way. Cells outside the field bounds are ignored.
+"""
+
+import csv
+from array import array
+
+
+class TileGrid(object):
+    """Mapping from cells to flat tile indices over a bounded field."""
+
+    def __init__(self, field_bounds, tile=1):
+        if tile < 1:
+            raise ValueError(f"Tile size must be a positive number of cells. Invalid tile size: '{tile}'")
+        width, height = field_bounds
+        self.tile = tile
+        self.columns = (width + tile - 1) // tile
+        self.rows = (height + tile - 1) // tile
+        self.width = width
+        self.height = height
+
+    def index(self, x, y):
+        """Return the tile index of a cell, or -1 outside the field."""
+        if x < 0 or y < 0 or x >= self.width or y >= self.height:
+            return -1
+        return (y // self.tile) * self.columns + x // self.tile
+
+    def moved_indices(self, engine, moved, old_xs, old_ys):
+        """Return (slot, tile index) for the cars that moved this tick and ended on the field."""
+        xs = engine.xs
+        ys = engine.ys
+        tile = self.tile
+        columns = self.columns
+        width = self.width
+        height = self.height
+        return [(slot, (new_y // tile) * columns + new_x // tile)
+                for slot, x, y, new_x, new_y in zip(moved, old_xs, old_ys, [xs[slot] for slot in moved],
+                                                    [ys[slot] for slot in moved])
+                if (new_x != x or new_y != y) and 0 <= new_x < width and 0 <= new_y < height]
+
+
+class Heatmap(TileGrid):
+    """Visit counts per tile."""
+
+    def __init__(self, field_bounds, tile=1):
+        super().__init__(field_bounds, tile)
+        self.counts = array('l', [0]) * (self.columns * self.rows)
+
+    def place(self, engine, slots):
+        """Count the start cells of cars placed on the field."""
+        for slot in slots:
+            index = self.index(engine.xs[slot], engine.ys[slot])
+            if index >= 0:
+                self.counts[index] += 1
+
+    def observe(self, engine, moved, old_xs, old_ys):
+        """Count the cells moved into on the engine's current tick."""
+        counts = self.counts
+        for _, index in self.moved_indices(engine, moved, old_xs, old_ys):
+            counts[index] += 1
+
+    def grid(self):
+        """Return the counts as rows of tiles, row 0 holding the tiles with the smallest y."""
+        return [list(self.counts[row * self.columns:(row + 1) * self.columns]) for row in range(self.rows)]
+
+    def hottest(self, count=10):
+        """Return the `count` most visited tiles as ((tile_x, tile_y), visits), most visited first."""
+        ranked = sorted(range(len(self.counts)), key=lambda index: -self.counts[index])[:count]
+        return [((index % self.columns, index // self.columns), self.counts[index])
+                for index in ranked if self.counts[index]]
+
+    def save_csv(self, path):
+        """Write the heatmap as tile_x, tile_y, visits rows."""
+        with open(path, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['tile_x', 'tile_y', 'visits'])
+            for index, visits in enumerate(self.counts):
+                if visits:
+                    writer.writerow([index % self.columns, index // self.columns, visits])
+
+
+class Coverage(TileGrid):
+    """Visited-tile bitsets, one per fleet.
+
+    fleet_of maps a car name to its fleet; by default all cars form the
+    fleet 'all'.
+    """
+
+    def __init__(self, field_bounds, tile=1, fleet_of=None):
+        super().__init__(field_bounds, tile)
+        self.fleet_of = fleet_of or (lambda car_name: 'all')
+        self.bitsets = {}
+        # Bitset of the fleet of the car in each slot, set when the car is placed
+        self.slot_bits = {}
+
+    def bitset(self, fleet):
+        """Return the bitset of a fleet, creating it when needed."""
+        bits = self.bitsets.get(fleet)
+        if bits is None:
+            bits = self.bitsets[fleet] = bytearray((self.columns * self.rows + 7) // 8)
+        return bits
+
+    def place(self, engine, slots):
+        """Mark the start cells of cars placed on the field."""
+        for slot in slots:
+            bits = self.slot_bits[slot] = self.bitset(self.fleet_of(engine.names[slot]))
+            index = self.index(engine.xs[slot], engine.ys[slot])
+            if index >= 0:
+                bits[index >> 3] |= 1 << (index & 7)
+
+    def observe(self, engine, moved, old_xs, old_ys):
+        """Mark the cells moved into on the engine's current tick."""
+        slot_bits = self.slot_bits
+        for slot, index in self.moved_indices(engine, moved, old_xs, old_ys):
+            slot_bits[slot][index >> 3] |= 1 << (index & 7)
+
+    def covered(self, fleet=None):
+        """Return the number of tiles visited by a fleet, or by any fleet when fleet is None."""
+        if fleet is not None:
+            bits = self.bitsets.get(fleet, b'')
+            return bin(int.from_bytes(bits, 'little')).count('1')
+        union = 0
+        for bits in self.bitsets.values():
+            union |= int.from_bytes(bits, 'little')
+        return bin(union).count('1')
+
+    def fraction(self, fleet=None):
+        """Return the fraction of tiles visited by a fleet (or by any fleet)."""
+        return self.covered(fleet) / (self.columns * self.rows)
+
+    def covered_tiles(self, fleet):
+        """Return the (tile_x, tile_y) tiles visited by a fleet."""
+        value = int.from_bytes(self.bitsets.get(fleet, b''), 'little')
+        return [(index % self.columns, index // self.columns)
+                for index in range(self.columns * self.rows) if value >> index & 1]
+
+    def export(self):
+        """Return {fleet: bitset bytes}, bit i (little-endian) set when tile i was visited."""
+        return {fleet: bytes(bits) for fleet, bits in self.bitsets.items()}
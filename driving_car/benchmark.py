@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark script comparing the simulation engines on random scenarios.
+
+Every engine runs on its own copy of the same fleet; the script checks that
+all engines agree with the reference engine before reporting timings.
+
+Usage: python benchmark.py [cars] [steps] [size] [random|highway]
+"""
+
+import os
+import random
+import sys
+import time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from car import Car
+from simulation import ENGINES, COMPASS, simulate, copy_fleet, get_outcome, letter_name
+
+
+def random_scenario(num_cars, num_steps, size, seed=0, forward_bias=0.6):
+    """Build a random fleet of cars with command sequences on a size x size field."""
+    rng = random.Random(seed)
+    field_bounds = (size, size)
+    cars_with_commands = []
+    for index in range(num_cars):
+        name = letter_name(index)
+        car = Car(name, (rng.randrange(size), rng.randrange(size)), rng.choice(COMPASS), field_bounds)
+        length = rng.randint(1, num_steps)
+        commands = ''.join(
+            'F' if rng.random() < forward_bias else rng.choice('LR') for _ in range(length))
+        cars_with_commands.append({
+            'car': car,
+            'name': name,
+            'position': car.get_car_position(),
+            'facing': car.get_facing(),
+            'commands': [commands],
+        })
+    return cars_with_commands
+
+
+def highway_scenario(num_cars, run_length, seed=0):
+    """Build cars driving long straight runs on parallel lanes, with some lane changes."""
+    rng = random.Random(seed)
+    size = run_length + 2
+    field_bounds = (size, size)
+    cars_with_commands = []
+    for index in range(num_cars):
+        name = letter_name(index)
+        lane = rng.randrange(num_cars)
+        if index % 2:
+            car = Car(name, (0, lane), 'E', field_bounds)
+        else:
+            car = Car(name, (lane, 0), 'N', field_bounds)
+        split = rng.randrange(1, run_length)
+        commands = 'F' * split + rng.choice('LR') + 'F' * rng.randrange(run_length - split + 1)
+        cars_with_commands.append({
+            'car': car,
+            'name': name,
+            'position': car.get_car_position(),
+            'facing': car.get_facing(),
+            'commands': [commands],
+        })
+    return cars_with_commands
+
+
+def benchmark_engines(cars_with_commands, engines=None, repeat=3):
+    """Time each engine on copies of a fleet and check it matches the reference engine."""
+    engines = engines or sorted(ENGINES)
+    reference = copy_fleet(cars_with_commands)
+    expected = get_outcome(reference, simulate(reference, 'reference', verbose=False))
+    timings = {}
+    for engine in engines:
+        best = None
+        for _ in range(repeat):
+            fleet = copy_fleet(cars_with_commands)
+            start = time.perf_counter()
+            result = simulate(fleet, engine, verbose=False)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        if get_outcome(fleet, result) != expected:
+            raise AssertionError(f"Engine {engine} does not match the reference engine")
+        timings[engine] = best
+    return timings
+
+
+def main():
+    num_cars = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    num_steps = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    size = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    scenario = sys.argv[4] if len(sys.argv) > 4 else 'random'
+
+    if scenario == 'highway':
+        print(f"Benchmark: {num_cars} cars on highway lanes, runs of {num_steps} cells")
+        cars_with_commands = highway_scenario(num_cars, num_steps)
+    else:
+        print(f"Benchmark: {num_cars} cars, up to {num_steps} steps, {size} x {size} field")
+        cars_with_commands = random_scenario(num_cars, num_steps, size)
+    timings = benchmark_engines(cars_with_commands)
+    for engine, elapsed in sorted(timings.items(), key=lambda item: item[1]):
+        print(f"  {engine:<12} {elapsed * 1000:10.2f} ms  ({timings['reference'] / elapsed:.1f}x vs reference)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
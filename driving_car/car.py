@@ -1,15 +1,72 @@
 from dataclasses import replace
 
+# Footprints list the cells of a vehicle as (ahead, right) offsets from its
+# anchor cell, in the vehicle's own frame, so they rotate with its heading.
+FOOTPRINTS = {
+    'car': ((0, 0),),
+    'truck': ((0, 0), (-1, 0)),
+    'bus': ((0, 0), (-1, 0), (-2, 0)),
+    'trailer': ((0, 0), (-1, 0), (-2, 0), (-3, 0)),
+}
+
+
+def footprint_cells(x, y, heading, footprint):
+    """Return the cells covered by a footprint anchored at (x, y) facing COMPASS[heading]."""
+    vectors = [(0, 1), (1, 0), (0, -1), (-1, 0)]  # N, E, S, W movement vectors
+    fx, fy = vectors[heading]
+    rx, ry = vectors[(heading + 1) % 4]
+    return [(x + ahead * fx + right * rx, y + ahead * fy + right * ry) for ahead, right in footprint]
+
+
+def sweep_room(cells, dx, dy, field_bounds=None):
+    """Return (room, cell): how far a group of cells can advance together, and the cell that limits it.
+
+    room is None when the way is unlimited for every cell.
+    """
+    best_room, best_cell = None, None
+    for x, y in cells:
+        room = cells_to_edge(x, y, dx, dy, field_bounds)
+        if room is not None and (best_room is None or room < best_room):
+            best_room, best_cell = room, (x, y)
+    return best_room, best_cell
+
+
+def cells_to_edge(x, y, dx, dy, field_bounds=None):
+    """Return how many cells a car at (x, y) can advance along (dx, dy) before its first invalid position.
+
+    Returns None when the way is unlimited (no field bounds in that direction).
+    """
+    new_x, new_y = x + dx, y + dy
+    if new_x < 0 or new_y < 0 or (field_bounds and (new_x >= field_bounds[0] or new_y >= field_bounds[1])):
+        return 0
+    if dx > 0 or dy > 0:
+        if not field_bounds:
+            return None
+        width, height = field_bounds
+        return width - 1 - x if dx > 0 else height - 1 - y
+    return x if dx < 0 else y
+
+
 class Car(object):
-    def __init__(self, name, position, direction, field_bounds=None):
+    def __init__(self, name, position, direction, field_bounds=None, speed=1, footprint=None):
         # Validate car name - only letters allowed
         if not name or not str(name).isalpha():
             raise ValueError(f"Car name must contain only letters. Invalid name: '{name}'")
+        # Validate speed - whole cells per tick
+        if not isinstance(speed, int) or speed < 1:
+            raise ValueError(f"Car speed must be a positive whole number of cells per tick. Invalid speed: '{speed}'")
+        # Validate footprint - distinct (ahead, right) offsets including the anchor cell
+        footprint = FOOTPRINTS['car'] if footprint is None else FOOTPRINTS.get(footprint, footprint)
+        footprint = tuple(tuple(offset) for offset in footprint)
+        if (0, 0) not in footprint or len(set(footprint)) != len(footprint):
+            raise ValueError(f"Car footprint must list distinct cells including the anchor (0, 0). Invalid footprint: '{footprint}'")
         
         self.name = str(name)
         self.position = tuple(position) if isinstance(position, list) else position
         self.direction = str(direction)
         self.field_bounds = field_bounds
+        self.speed = speed
+        self.footprint = footprint
         
     def get_car_name(self) -> str:
         return str(self.name)
@@ -31,6 +88,11 @@ class Car(object):
             # Return default position if position is not properly set
             return (0, 0)
         
+    def get_footprint_cells(self) -> list:
+        """Return every cell the car covers; the anchor cell (get_car_position) comes first for single-cell cars."""
+        x, y = self.get_car_position()
+        return footprint_cells(x, y, ['N', 'E', 'S', 'W'].index(self.direction), self.footprint)
+
     def _is_valid_position(self, new_position):
         """Check if a position is valid."""
         x, y = new_position
@@ -47,35 +109,46 @@ class Car(object):
                 
         return True
 
+    def _boundary_error(self, new_position):
+        """Describe why a position is outside the field."""
+        new_x, new_y = new_position
+        if new_x < 0 or new_y < 0:
+            return f"Car {self.name} cannot move to negative coordinates: ({new_x}, {new_y})"
+        elif self.field_bounds:
+            width, height = self.field_bounds
+            return f"Car {self.name} cannot move outside field bounds: ({new_x}, {new_y}) exceeds ({width-1}, {height-1})"
+        else:
+            return f"Car {self.name} cannot move to invalid position: ({new_x}, {new_y})"
+
     def move(self, commands):
         compass = ['N', 'E', 'S', 'W']
         vectors = [(0, 1), (1, 0), (0, -1), (-1, 0)]  # N, E, S, W movement vectors
         current = compass.index(self.direction)
         
-        if commands == 'R':
-            # Turn right: move clockwise in compass
-            self.direction = compass[(current + 1) % 4]
-        elif commands == 'L':
-            # Turn left: move counter-clockwise in compass
-            self.direction = compass[(current - 1) % 4]
+        if commands in ('R', 'L'):
+            # Turn right: move clockwise in compass; turn left: counter-clockwise
+            heading = (current + 1) % 4 if commands == 'R' else (current - 1) % 4
+            # A multi-cell vehicle swings its footprint; every cell must stay on the field
+            if len(self.footprint) > 1:
+                x, y = self.position
+                for cell in footprint_cells(x, y, heading, self.footprint):
+                    if not self._is_valid_position(cell):
+                        raise ValueError(self._boundary_error(cell))
+            self.direction = compass[heading]
         elif commands == 'F':
-            # Move forward in current direction
+            # Move forward in current direction, `speed` cells at once
             dx, dy = vectors[current]
-            new_x = self.position[0] + dx
-            new_y = self.position[1] + dy
-            new_position = (new_x, new_y)
+            x, y = self.position
+            if len(self.footprint) > 1:
+                room, limit = sweep_room(self.get_footprint_cells(), dx, dy, self.field_bounds)
+            else:
+                room, limit = cells_to_edge(x, y, dx, dy, self.field_bounds), (x, y)
             
-            # Check if the new position is valid
-            if self._is_valid_position(new_position):
-                self.position = new_position
+            # Check if every swept cell is valid; report the first invalid one
+            if room is None or room >= self.speed:
+                self.position = (x + dx * self.speed, y + dy * self.speed)
             else:
-                if new_x < 0 or new_y < 0:
-                    raise ValueError(f"Car {self.name} cannot move to negative coordinates: ({new_x}, {new_y})")
-                elif self.field_bounds:
-                    width, height = self.field_bounds
-                    raise ValueError(f"Car {self.name} cannot move outside field bounds: ({new_x}, {new_y}) exceeds ({width-1}, {height-1})")
-                else:
-                    raise ValueError(f"Car {self.name} cannot move to invalid position: ({new_x}, {new_y})")
+                raise ValueError(self._boundary_error((limit[0] + dx * (room + 1), limit[1] + dy * (room + 1))))
         else:
             raise ValueError(f"Invalid command: {commands}. Use 'F' for forward, 'L' for left, 'R' for right.")
             
@@ -0,0 +1,221 @@
+"""
+Driving Car Simulation - Divergence Bisection
+
+Finds the first step on which two runs of a scenario stop agreeing, for
+instance after one car's commands were edited or the field was resized,
+without keeping or diffing their trajectories.
+
+bisect_runs steps two fleet engines side by side and compares a fingerprint
+of their states every `every` steps, keeping one in-memory checkpoint
+(snapshot.capture) of each engine at the last step where they agreed.
+A fingerprint is an order-independent 64-bit sum of the hashes of every
+car's (name, cell, heading, status), so it does not depend on which slot
+a car holds, plus the hash of the run's history: a rolling sum, kept as
+the engines are stepped, of the spawn and despawn counts on every tick
+where they change and of every collision and violation event. Once the
+fingerprints differ, the step is bisected between the checkpoint and the
+mismatch: a probe that still agrees becomes the new checkpoint and the
+engines carry on from it, while a probe that disagrees restores both
+engines from the checkpoint. Bisection takes O(log every) fingerprints and
+at most 2 * every extra steps. Finally the two states are compared on the
+divergent step to name the cars involved.
+
+Fingerprints are compared at intervals. The history keeps a divergence
+that spawns, despawns, collides or violates a boundary on a different
+step from being lost when the runs end up in the same state before the
+next comparison. Two runs whose cars only take different routes between
+two comparisons and come back to the same cells are still reported at a
+later divergence, if any.
+
+    python divergence.py 1000 200 100
+
+times the bisection of a random scenario against a copy with one car's
+commands edited.
+"""
+
+import sys
+import time
+
+from benchmark import random_scenario
+from fleet import FleetEngine, DESPAWNED
+from simulation import COMPASS, copy_fleet
+from snapshot import capture, restore
+
+FINGERPRINT_MASK = (1 << 64) - 1
+STATUS_NAMES = ('active', 'finished', 'collided', 'off field', 'despawned')
+
+
+def fingerprint(engine, history=None):
+    """Return a 64-bit hash of the cars on the field that does not depend on their slots.
+
+    With a history (new_history) kept by advance, the hash also covers the
+    spawns, despawns, collisions and violations of the steps so far.
+    """
+    names, xs, ys, headings, status = engine.names, engine.xs, engine.ys, engine.headings, engine.status
+    total = sum(hash((names[slot], xs[slot], ys[slot], headings[slot], status[slot]))
+                for slot in range(engine.size) if status[slot] != DESPAWNED)
+    total += hash(counters(engine))
+    if history is not None:
+        total += history[-1]
+    return total & FINGERPRINT_MASK
+
+
+def counters(engine):
+    """Return the numbers of spawns, despawns, collisions and violations of a run so far."""
+    return (engine.spawned, engine.despawned, len(engine.result['collision_events']),
+            len(engine.result['boundary_events']))
+
+
+def new_history(engine):
+    """Return the history of a run from its current step on: its counters and a rolling hash."""
+    return list(counters(engine)) + [0]
+
+
+def record_history(engine, history):
+    """Fold the spawns, despawns and events of the step the engine is on into the history of its run."""
+    current = counters(engine)
+    if current == tuple(history[:-1]):
+        return
+    _, _, collisions, violations, total = history
+    total += hash((engine.step_number, engine.spawned, engine.despawned))
+    total += sum(map(hash, engine.result['collision_events'][collisions:]))
+    total += sum(map(hash, engine.result['boundary_events'][violations:]))
+    history[:] = list(current) + [total & FINGERPRINT_MASK]
+
+
+def car_states(engine):
+    """Return {name: ((x, y), heading, status name)} of the cars on the field."""
+    return {engine.names[slot]: ((engine.xs[slot], engine.ys[slot]), COMPASS[engine.headings[slot]],
+                                 STATUS_NAMES[engine.status[slot]])
+            for slot in range(engine.size) if engine.status[slot] != DESPAWNED}
+
+
+def step_events(engine, step_number):
+    """Return the set of collision and violation events of a step."""
+    collisions = {('collision',) + tuple(event[1:]) for event in engine.result['collision_events']
+                  if event[0] == step_number}
+    violations = {('violation',) + tuple(event[1:]) for event in engine.result['boundary_events']
+                  if event[0] == step_number}
+    return collisions | violations
+
+
+def advance(engine, step_number, history=None):
+    """Step an engine until its state is the state after `step_number`.
+
+    The engine stops before a tick later than the step, so scheduled runs
+    that skip steps are not carried past it. A history (new_history) is
+    brought up to date after every tick.
+    """
+    while engine.step_number < step_number and engine.pending():
+        if engine.scheduler is not None:
+            ticks = [tick for tick in (engine.scheduler.peek(), engine.next_source_tick()) if tick is not None]
+            if min(ticks) > step_number:
+                return
+        engine.step()
+        if history is not None:
+            record_history(engine, history)
+
+
+def bisect_runs(first, second, every=64, max_steps=None):
+    """Return the first step on which the states of two engines differ, or None if the runs agree.
+
+    Both engines are stepped from where they are (normally step 0) to the
+    end of their runs, or to `max_steps`. A divergence is returned as
+    {'step': step, 'cars': {name: (state in first, state in second)}} with
+    the states of the cars that differ as in car_states (None where a car is
+    not on the field), including the cars of collisions or violations only
+    one run has on that step. The engines are stepped by the search, which
+    may go on with restored copies, so they are not meant to be run on.
+    """
+    if every < 1:
+        raise ValueError(f"Fingerprints need a positive interval. Invalid interval: '{every}'")
+    engines = [first, second]
+    for engine in engines:
+        if engine.sources:
+            engine.spawn_due()
+    low = max(first.step_number, second.step_number)
+    for engine in engines:
+        advance(engine, low)
+    if fingerprint(first) != fingerprint(second):
+        return divergence(first, second, low)
+    histories = [new_history(engine) for engine in engines]
+    checkpoints = [capture(engine) for engine in engines]
+    saved = [list(history) for history in histories]
+    high = None
+    while high is None and (first.pending() or second.pending()) and (max_steps is None or low < max_steps):
+        target = low + every if max_steps is None else min(low + every, max_steps)
+        for engine, history in zip(engines, histories):
+            advance(engine, target, history)
+        if fingerprint(first, histories[0]) != fingerprint(second, histories[1]):
+            high = target
+        else:
+            low = target
+            checkpoints = [capture(engine, checkpoint) for engine, checkpoint in zip(engines, checkpoints)]
+            saved = [list(history) for history in histories]
+    if high is None:
+        return None
+    # The engines are on `high`; the checkpoints on the last step where the runs agreed
+    position = high
+    while high - low > 1:
+        middle = (low + high) // 2
+        if position > middle:
+            engines = [restore(checkpoint) for checkpoint in checkpoints]
+            histories = [list(history) for history in saved]
+        for engine, history in zip(engines, histories):
+            advance(engine, middle, history)
+        position = middle
+        if fingerprint(engines[0], histories[0]) == fingerprint(engines[1], histories[1]):
+            low = middle
+            checkpoints = [capture(engine, checkpoint) for engine, checkpoint in zip(engines, checkpoints)]
+            saved = [list(history) for history in histories]
+        else:
+            high = middle
+    if position != high:
+        for engine in engines:
+            advance(engine, high)
+    return divergence(engines[0], engines[1], high)
+
+
+def divergence(first, second, step_number):
+    """Return the divergence report of two engines on a step where their states differ."""
+    first_states = car_states(first)
+    second_states = car_states(second)
+    names = {name for name in first_states.keys() | second_states.keys()
+             if first_states.get(name) != second_states.get(name)}
+    for event in step_events(first, step_number) ^ step_events(second, step_number):
+        names.update(name for name in event[1:-1])
+    return {'step': step_number,
+            'cars': {name: (first_states.get(name), second_states.get(name)) for name in sorted(names)}}
+
+
+def main():
+    num_cars = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    num_steps = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    size = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    every = int(sys.argv[4]) if len(sys.argv) > 4 else 64
+    fleet = random_scenario(num_cars, num_steps, size)
+    edited = copy_fleet(fleet)
+    # Turn the first car around halfway through its commands
+    commands = edited[0]['commands'][0]
+    half = len(commands) // 2
+    edited[0]['commands'] = [commands[:half] + "RR" + commands[half + 2:]]
+    print(f"Divergence bisection: {num_cars} cars, {num_steps} steps, field {size}x{size}, fingerprints every "
+          f"{every} steps")
+    start = time.perf_counter()
+    FleetEngine(copy_fleet(fleet)).run()
+    run_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    report = bisect_runs(FleetEngine(fleet), FleetEngine(edited), every)
+    bisect_seconds = time.perf_counter() - start
+    print(f"  one run: {run_seconds:.2f} s, bisection: {bisect_seconds:.2f} s")
+    if report is None:
+        print("  The runs agree on every step")
+        return 0
+    print(f"  First divergence on step {report['step']}:")
+    for name, (first_state, second_state) in report['cars'].items():
+        print(f"  - {name}: {first_state} / {second_state}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
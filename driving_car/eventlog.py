@@ -0,0 +1,484 @@
+"""
+Driving Car Simulation - Binary Event Log
+
+Compact record of a fleet run, written by an EventLogWriter observer and
+read back lazily by EventLogReader. Where the verbose text output takes
+about 60 bytes per car and step, a command here takes one to three bytes
+before compression.
+
+File layout: the magic ``DCEL``, a version byte, a codec byte (none, zlib
+or lzma) and the varint step at which recording started, followed by
+frames. A frame is a little-endian (compressed length, raw length) uint32
+pair and a block of records compressed on its own, so the writer holds
+one block in memory and the reader decompresses one block at a time.
+
+Records start with a kind byte:
+
+- TICK: varint step delta and varint count of the cars that acted, then
+  columns over those cars: a mode byte (the same cars as on the previous
+  tick, new cars, or the cars of the previous tick whose status is still
+  active) and, for new cars, the varint first slot and zigzag deltas of
+  the others; a flags byte per car (command code in bits 0-1: F, L, R or 3
+  for any other command; bit 2 unused; status code in bits 3-5; heading
+  in bits 6-7); the varint code points of the other commands; and zigzag
+  x deltas then zigzag y deltas of the cars whose command is F, the only
+  command that changes a car's cell. Columns let the writer do its
+  per-car work in map and itemgetter calls, and pack the flag bytes of all
+  cars as big ints.
+- PLACE: varint slot, name, zigzag x and y, heading byte.
+- REMOVE: varint slot (a car despawned between ticks; a car despawned
+  during a tick shows up with the DESPAWNED status in the tick).
+- COLLISION: two names and zigzag x and y.
+- VIOLATION: a name and zigzag x and y.
+- KEYFRAME: varint step and varint count of the cars on the field, then
+  per car its varint slot, name, zigzag x and y and heading byte. It
+  replaces the state built up so far and always starts a frame, so a
+  reader can start decoding at a keyframe (see replay.py).
+
+Names are a varint byte length and UTF-8 bytes. Collisions and violations
+belong to the step of the last tick.
+"""
+
+import lzma
+import struct
+import zlib
+from itertools import compress
+from operator import itemgetter, sub
+
+from fleet import ACTIVE, DESPAWNED
+from simulation import COMPASS
+
+MAGIC = b'DCEL'
+FORMAT_VERSION = 2
+CODECS = ('none', 'zlib', 'lzma')
+FRAME_HEADER = struct.Struct('<II')
+
+# Record kinds
+TICK = 0
+PLACE = 1
+REMOVE = 2
+COLLISION = 3
+VIOLATION = 4
+KEYFRAME = 5
+
+COMMAND_CODES = {'F': 0, 'L': 1, 'R': 2}
+COMMANDS = 'FLR'
+OTHER_COMMAND = 3
+
+# Slot column modes of a tick
+SAME_SLOTS = 0
+NEW_SLOTS = 1
+ACTIVE_SLOTS = 2
+
+# Zigzag codes of the signed values that fit in one varint byte
+SMALL_ZIGZAG = {value: value << 1 if value >= 0 else (-value << 1) - 1 for value in range(-64, 64)}
+# Command code -> 1 for F, to find the cars that may have changed cell
+FORWARD = bytes([1]) + bytes(255)
+# Flags byte -> 1 if its status is active, to find the cars of a tick that act again on the next
+STILL_ACTIVE = bytes(int(flag >> 3 & 7 == ACTIVE) for flag in range(256))
+# Latin-1 command character -> command code
+COMMAND_TABLE = bytes(COMMAND_CODES.get(chr(code), OTHER_COMMAND) for code in range(256))
+
+
+def put_varint(out, value):
+    """Append an unsigned LEB128 varint to a bytearray."""
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def put_signed(out, value):
+    """Append a zigzag-encoded signed varint to a bytearray."""
+    put_varint(out, value << 1 if value >= 0 else (-value << 1) - 1)
+
+
+def put_signed_column(out, values):
+    """Append zigzag varints of a list of signed values, one byte each when they are small."""
+    try:
+        out += bytes(map(SMALL_ZIGZAG.__getitem__, values))
+    except KeyError:
+        for value in values:
+            code = SMALL_ZIGZAG.get(value)
+            if code is None:
+                put_signed(out, value)
+            else:
+                out.append(code)
+
+
+def put_name(out, name):
+    """Append a length-prefixed UTF-8 name to a bytearray."""
+    encoded = name.encode('utf-8')
+    if len(encoded) < 0x80:
+        out.append(len(encoded))
+    else:
+        put_varint(out, len(encoded))
+    out += encoded
+
+
+def put_cell(out, x, y):
+    """Append the zigzag x and y of a cell, without the varint loop while both fit in two bytes."""
+    x = x << 1 if x >= 0 else (-x << 1) - 1
+    y = y << 1 if y >= 0 else (-y << 1) - 1
+    if x < 0x4000 and y < 0x4000:
+        out += (bytes((x,)) if x < 0x80 else bytes((x & 0x7f | 0x80, x >> 7)))
+        out += (bytes((y,)) if y < 0x80 else bytes((y & 0x7f | 0x80, y >> 7)))
+    else:
+        put_varint(out, x)
+        put_varint(out, y)
+
+
+def get_varint(data, offset):
+    """Return (value, next offset) of the varint at `offset`."""
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def get_signed(data, offset):
+    """Return (value, next offset) of the zigzag varint at `offset`."""
+    value, offset = get_varint(data, offset)
+    return (value >> 1) ^ -(value & 1), offset
+
+
+def get_name(data, offset):
+    """Return (name, next offset) of the name at `offset`."""
+    length, offset = get_varint(data, offset)
+    return bytes(data[offset:offset + length]).decode('utf-8'), offset + length
+
+
+def compressor(codec, level=1):
+    """Return the function compressing a frame with a codec at a compression level."""
+    if codec == 'zlib':
+        return lambda block: zlib.compress(block, level)
+    if codec == 'lzma':
+        return lambda block: lzma.compress(block, preset=level)
+    return bytes
+
+
+def decompressor(codec):
+    """Return the function decompressing a frame with a codec."""
+    if codec == 'zlib':
+        return zlib.decompress
+    if codec == 'lzma':
+        return lzma.decompress
+    return bytes
+
+
+class EventLogWriter(object):
+    """Observer that writes a fleet run to a binary event log."""
+
+    def __init__(self, path, codec='zlib', frame_bytes=1 << 18, level=1):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec: {codec}. Choose from: {', '.join(CODECS)}")
+        self.path = path
+        self.codec = codec
+        # The fastest levels keep compression well below the cost of the run
+        self.compress = compressor(codec, level)
+        self.frame_bytes = frame_bytes
+        self.file = None
+        self.buffer = bytearray()
+        self.step = 0
+        self.collisions_seen = 0
+        self.violations_seen = 0
+        self.bytes_written = 0
+        self.last_moved = None
+        self.last_flags = b''
+        # Per slot, an iterator over the command codes of the car's program
+        # from its next command on; a car executes one command each time it acts
+        self.next_codes = []
+
+    def start(self, engine):
+        """Open the log and write its header."""
+        self.file = open(self.path, 'wb')
+        header = bytearray(MAGIC)
+        header.append(FORMAT_VERSION)
+        header.append(CODECS.index(self.codec))
+        put_varint(header, engine.step_number)
+        self.file.write(header)
+        self.bytes_written = len(header)
+        self.step = engine.step_number
+        self.collisions_seen = len(engine.result['collision_events'])
+        self.violations_seen = len(engine.result['boundary_events'])
+
+    def place(self, engine, slots):
+        """Write the cars placed on the field."""
+        if self.file is None:
+            self.start(engine)
+        self.next_codes.extend([None] * (len(engine.programs) - len(self.next_codes)))
+        out = self.buffer
+        for slot in slots:
+            self.follow_program(engine, slot)
+            out.append(PLACE)
+            put_varint(out, slot)
+            put_name(out, engine.names[slot])
+            put_signed(out, engine.xs[slot])
+            put_signed(out, engine.ys[slot])
+            out.append(engine.headings[slot])
+
+    def remove(self, engine, slot):
+        """Write a car despawned between ticks."""
+        if not engine.stepping:
+            self.buffer.append(REMOVE)
+            put_varint(self.buffer, slot)
+
+    def follow_program(self, engine, slot):
+        """Point a slot's command code iterator at the next command of its car."""
+        program = engine.programs[slot]
+        try:
+            codes = program.encode('latin-1').translate(COMMAND_TABLE)
+        except (AttributeError, UnicodeEncodeError):
+            # Despawned, or with commands outside Latin-1: the codes are worked out from the program
+            self.next_codes[slot] = None
+            return
+        self.next_codes[slot] = iter(codes[engine.cursors[slot]:])
+
+    def observe(self, engine, moved, old_xs, old_ys):
+        """Write the commands, collisions and violations of the engine's current tick."""
+        out = self.buffer
+        count = len(moved)
+        out.append(TICK)
+        put_varint(out, engine.step_number - self.step)
+        self.step = engine.step_number
+        put_varint(out, count)
+        if count:
+            self.write_columns(engine, out, moved, old_xs, old_ys)
+        collisions = engine.result['collision_events']
+        if len(collisions) > self.collisions_seen:
+            for _, car1_name, car2_name, (x, y) in collisions[self.collisions_seen:]:
+                out.append(COLLISION)
+                put_name(out, car1_name)
+                put_name(out, car2_name)
+                put_cell(out, x, y)
+            self.collisions_seen = len(collisions)
+        violations = engine.result['boundary_events']
+        if len(violations) > self.violations_seen:
+            for _, car_name, (x, y) in violations[self.violations_seen:]:
+                out.append(VIOLATION)
+                put_name(out, car_name)
+                put_cell(out, x, y)
+            self.violations_seen = len(violations)
+        if len(out) >= self.frame_bytes:
+            self.write_frame()
+
+    def write_columns(self, engine, out, moved, old_xs, old_ys):
+        """Write the columns of a tick; the per-car work is done by map, itemgetter and big-int packing."""
+        if moved == self.last_moved:
+            out.append(SAME_SLOTS)
+        elif (self.last_moved is not None
+              and moved == list(compress(self.last_moved, self.last_flags.translate(STILL_ACTIVE)))):
+            # Cars that stopped dropped out, as the engine drops them when it runs every car on every tick
+            out.append(ACTIVE_SLOTS)
+            self.last_moved = list(moved)
+        else:
+            out.append(NEW_SLOTS)
+            self.last_moved = list(moved)
+            # The first slot is usually the only large value of the column
+            put_varint(out, moved[0])
+            put_signed_column(out, list(map(sub, self.last_moved[1:], self.last_moved)))
+        if len(moved) > 1:
+            pick = itemgetter(*moved)
+        else:
+            def pick(values):
+                return (values[moved[0]],)
+        others = []
+        try:
+            codes = bytes(map(next, pick(self.next_codes)))
+        except (TypeError, IndexError):
+            codes = b''
+        if len(codes) != len(moved) or OTHER_COMMAND in codes:
+            codes = []
+            for slot, program, cursor in zip(moved, pick(engine.programs), pick(engine.cursors)):
+                # Only a forward move despawns a car, and it takes the program along
+                command = program[cursor - 1] if program is not None else 'F'
+                code = COMMAND_CODES.get(command, OTHER_COMMAND)
+                if code == OTHER_COMMAND:
+                    others.append(ord(command))
+                codes.append(code)
+                self.follow_program(engine, slot)
+            codes = bytes(codes)
+        # The flags are packed one car per byte into big ints, so each shift and or covers every moved car
+        flags = (int.from_bytes(codes, 'little') | int.from_bytes(bytes(pick(engine.status)), 'little') << 3
+                 | int.from_bytes(bytes(pick(engine.headings)), 'little') << 6)
+        self.last_flags = flags.to_bytes(len(moved), 'little')
+        out += self.last_flags
+        for code_point in others:
+            put_varint(out, code_point)
+        # Only a forward move changes a car's cell, so the deltas cover the cars whose command is F
+        forward = codes.translate(FORWARD)
+        if 0 in forward:
+            forward_slots = list(compress(moved, forward))
+            old_xs = compress(old_xs, forward)
+            old_ys = compress(old_ys, forward)
+            if len(forward_slots) > 1:
+                pick = itemgetter(*forward_slots)
+            else:
+                def pick(values):
+                    return [values[slot] for slot in forward_slots]
+        put_signed_column(out, list(map(sub, pick(engine.xs), old_xs)))
+        put_signed_column(out, list(map(sub, pick(engine.ys), old_ys)))
+
+    def write_frame(self):
+        """Compress the buffered records into a frame."""
+        if not self.buffer:
+            return
+        block = self.compress(self.buffer)
+        self.file.write(FRAME_HEADER.pack(len(block), len(self.buffer)))
+        self.file.write(block)
+        self.bytes_written += FRAME_HEADER.size + len(block)
+        self.buffer = bytearray()
+
+    def close(self):
+        """Write the last frame and close the log."""
+        if self.file is not None:
+            self.write_frame()
+            self.file.close()
+            self.file = None
+
+
+class EventLogReader(object):
+    """Lazy iterator over the events of a binary event log.
+
+    Yields ('place', step, name, (x, y), heading),
+    ('command', step, name, command, (x, y), heading, status),
+    ('remove', step, name), ('collision', step, name1, name2, (x, y)) and
+    ('violation', step, name, (x, y)) tuples.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def read_header(self, log_file):
+        """Return (decompress function, start step) from the header of an open log."""
+        header = log_file.read(len(MAGIC) + 2)
+        if header[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path} is not a driving car event log")
+        if header[len(MAGIC)] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported event log version: {header[len(MAGIC)]}")
+        decompress = decompressor(CODECS[header[len(MAGIC) + 1]])
+        start = bytearray()
+        while not start or start[-1] >= 0x80:
+            start += log_file.read(1)
+        return decompress, get_varint(start, 0)[0]
+
+    def frames(self, log_file, decompress):
+        """Yield the decompressed blocks of an open log, after its header."""
+        while True:
+            frame_header = log_file.read(FRAME_HEADER.size)
+            if not frame_header:
+                return
+            length, raw_length = FRAME_HEADER.unpack(frame_header)
+            block = decompress(log_file.read(length))
+            if len(block) != raw_length:
+                raise ValueError(f"Corrupt frame in {self.path}")
+            yield block
+
+    def __iter__(self):
+        with open(self.path, 'rb') as log_file:
+            decompress, step_number = self.read_header(log_file)
+            yield from self.events(self.frames(log_file, decompress), step_number, {})
+
+    def events(self, blocks, step_number, cars, until=None):
+        """Yield the events of decompressed blocks, starting on `step_number`.
+
+        cars maps slot -> [name, x, y, heading] and is updated in place as the
+        records are decoded. With `until`, decoding stops before the first
+        tick after that step.
+        """
+        slots = []
+        flags = b''
+        for block in blocks:
+            offset = 0
+            end = len(block)
+            while offset < end:
+                kind = block[offset]
+                offset += 1
+                if kind == TICK:
+                    delta, offset = get_varint(block, offset)
+                    step_number += delta
+                    if until is not None and step_number > until:
+                        return
+                    count, offset = get_varint(block, offset)
+                    if not count:
+                        continue
+                    mode = block[offset]
+                    offset += 1
+                    if mode == NEW_SLOTS:
+                        slot, offset = get_varint(block, offset)
+                        slots = [slot]
+                        for _ in range(count - 1):
+                            delta, offset = get_signed(block, offset)
+                            slot += delta
+                            slots.append(slot)
+                    elif mode == ACTIVE_SLOTS:
+                        slots = [slot for slot, flag in zip(slots, flags) if flag >> 3 & 7 == ACTIVE]
+                    flags = block[offset:offset + count]
+                    offset += count
+                    commands = []
+                    for flag in flags:
+                        code = flag & 3
+                        if code == OTHER_COMMAND:
+                            code_point, offset = get_varint(block, offset)
+                            commands.append(chr(code_point))
+                        else:
+                            commands.append(COMMANDS[code])
+                    moving = sum(1 for flag in flags if not flag & 3)
+                    deltas = []
+                    for _ in range(2 * moving):
+                        delta, offset = get_signed(block, offset)
+                        deltas.append(delta)
+                    move = 0
+                    for slot, flag, command in zip(slots, flags, commands):
+                        car = cars[slot]
+                        if not flag & 3:
+                            car[1] += deltas[move]
+                            car[2] += deltas[moving + move]
+                            move += 1
+                        car[3] = flag >> 6
+                        status = flag >> 3 & 7
+                        yield ('command', step_number, car[0], command, (car[1], car[2]), COMPASS[car[3]],
+                               status)
+                        if status == DESPAWNED:
+                            del cars[slot]
+                elif kind == PLACE:
+                    slot, offset = get_varint(block, offset)
+                    name, offset = get_name(block, offset)
+                    x, offset = get_signed(block, offset)
+                    y, offset = get_signed(block, offset)
+                    heading = block[offset]
+                    offset += 1
+                    cars[slot] = [name, x, y, heading]
+                    yield ('place', step_number, name, (x, y), COMPASS[heading])
+                elif kind == REMOVE:
+                    slot, offset = get_varint(block, offset)
+                    yield ('remove', step_number, cars.pop(slot)[0])
+                elif kind == COLLISION:
+                    car1_name, offset = get_name(block, offset)
+                    car2_name, offset = get_name(block, offset)
+                    x, offset = get_signed(block, offset)
+                    y, offset = get_signed(block, offset)
+                    yield ('collision', step_number, car1_name, car2_name, (x, y))
+                elif kind == VIOLATION:
+                    car_name, offset = get_name(block, offset)
+                    x, offset = get_signed(block, offset)
+                    y, offset = get_signed(block, offset)
+                    yield ('violation', step_number, car_name, (x, y))
+                elif kind == KEYFRAME:
+                    step_number, offset = get_varint(block, offset)
+                    count, offset = get_varint(block, offset)
+                    cars.clear()
+                    for _ in range(count):
+                        slot, offset = get_varint(block, offset)
+                        name, offset = get_name(block, offset)
+                        x, offset = get_signed(block, offset)
+                        y, offset = get_signed(block, offset)
+                        cars[slot] = [name, x, y, block[offset]]
+                        offset += 1
+                else:
+                    raise ValueError(f"Unknown record kind {kind} in {self.path}")
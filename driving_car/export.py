@@ -0,0 +1,315 @@
+"""
+Driving Car Simulation - Columnar Export
+
+Writes the trajectories and events of a run as columns that load straight
+into NumPy or pandas, instead of parsing printed lines:
+
+- export_npy writes one ``.npy`` file per column into a directory, and
+  export_npz zips the same files into one ``.npz`` archive (what
+  numpy.savez and numpy.savez_compressed write).
+- export_trajectories_csv and export_events_csv write CSV with a header
+  row.
+
+Trajectory columns are car_id, step, x, y and heading, one row per car on
+the field per recorded step; events are collisions and violations, with
+columns kind, step, car_id, other_car_id, x and y. In the arrays, car ids
+index the ``cars`` array of car names, headings index COMPASS (N, E, S, W),
+event kinds index EVENT_KINDS and other_car_id is -1 for a violation. The
+CSV files give names and compass letters instead.
+
+Trajectories come from a trajectory.TrajectoryFile, a retention.Retention
+or an eventlog.EventLogReader (which only has rows for the steps a car
+acted on); events come from an engine result or an EventLogReader. Rows
+are produced and written in chunks of `chunk_rows`, and ``.npy`` headers
+are patched with the final length on close, so memory is bounded by the
+chunk size however long the run is.
+"""
+
+import ast
+import csv
+import os
+import struct
+import tempfile
+import zipfile
+from array import array
+from itertools import compress, repeat
+from operator import itemgetter, ne
+
+from eventlog import EventLogReader
+from fleet import DESPAWNED
+from retention import Retention
+from simulation import COMPASS
+from trajectory import BYTE_ORDER, dtype_of
+
+CHUNK_ROWS = 1 << 16
+TRAJECTORY_COLUMNS = (('car_id', 'l'), ('step', 'q'), ('x', 'l'), ('y', 'l'), ('heading', 'b'))
+EVENT_COLUMNS = (('kind', 'b'), ('step', 'q'), ('car_id', 'l'), ('other_car_id', 'l'), ('x', 'l'), ('y', 'l'))
+EVENT_KINDS = ('collision', 'violation')
+
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+# Header bytes reserved up front, so the final length can be written in place
+NPY_HEADER_BYTES = 128
+
+
+def npy_header(descr, length):
+    """Return a version 1.0 ``.npy`` header of a 1-D array, padded to NPY_HEADER_BYTES."""
+    header = repr({'descr': descr, 'fortran_order': False, 'shape': (length,)})
+    padding = NPY_HEADER_BYTES - len(NPY_MAGIC) - 2 - len(header) - 1
+    return NPY_MAGIC + struct.pack('<H', NPY_HEADER_BYTES - len(NPY_MAGIC) - 2) + \
+        header.encode('latin1') + b' ' * padding + b'\n'
+
+
+def read_npy(path):
+    """Return (descr, raw data bytes) of a 1-D ``.npy`` file written by NpyWriter or write_names."""
+    with open(path, 'rb') as npy_file:
+        if npy_file.read(len(NPY_MAGIC)) != NPY_MAGIC:
+            raise ValueError(f"{path} is not a version 1.0 .npy file")
+        header_length, = struct.unpack('<H', npy_file.read(2))
+        header = ast.literal_eval(npy_file.read(header_length).decode('latin1'))
+        return header['descr'], npy_file.read()
+
+
+class NpyWriter(object):
+    """Append-only ``.npy`` file of a 1-D integer array, written in chunks."""
+
+    def __init__(self, path, typecode):
+        self.path = path
+        self.descr = dtype_of(typecode)
+        self.length = 0
+        self.file = open(path, 'wb')
+        self.file.write(npy_header(self.descr, 0))
+
+    def write(self, values):
+        """Append an array of values."""
+        values.tofile(self.file)
+        self.length += len(values)
+
+    def close(self):
+        """Write the final length into the header and close the file."""
+        if self.file is not None:
+            self.file.seek(0)
+            self.file.write(npy_header(self.descr, self.length))
+            self.file.close()
+            self.file = None
+
+
+def write_names(path, names):
+    """Write car names as a ``.npy`` array of fixed-width unicode strings."""
+    width = max((len(name) for name in names), default=1)
+    encoding = 'utf-32-le' if BYTE_ORDER == '<' else 'utf-32-be'
+    with open(path, 'wb') as npy_file:
+        npy_file.write(npy_header(f"{BYTE_ORDER}U{width}", len(names)))
+        for name in names:
+            npy_file.write(name.ljust(width, '\0').encode(encoding))
+
+
+class CarIds(object):
+    """Car ids in order of first appearance."""
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+
+    def __getitem__(self, name):
+        car_id = self.ids.get(name)
+        if car_id is None:
+            car_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return car_id
+
+
+def new_columns(columns):
+    """Return {name: empty array} of (name, typecode) columns."""
+    return {name: array(typecode) for name, typecode in columns}
+
+
+def last_rows(rows):
+    """Yield the last of every run of (views, row, step) rows with the same step."""
+    previous = None
+    for current in rows:
+        if previous is not None and previous[2] != current[2]:
+            yield previous
+        previous = current
+    if previous is not None:
+        yield previous
+
+
+def recorded_rows(source):
+    """Return ((views, row, step) rows, slot tenancies) of a TrajectoryFile or Retention."""
+    if isinstance(source, Retention):
+        if source.spill is None:
+            return source.retained_rows(), source.tenancies
+        source = source.recording()
+    # A spawn rewrites its tick's row in a new chunk when the engine grows
+    return last_rows(source.rows()), source.tenancies
+
+
+def row_chunks(source, car_ids, chunk_rows):
+    """Yield trajectory column chunks of the rows of a TrajectoryFile or Retention."""
+    rows, tenancies = recorded_rows(source)
+    starts = sorted(tenancies.cars, key=itemgetter(2))
+    started = 0
+    owners = {}
+    columns = new_columns(TRAJECTORY_COLUMNS)
+    for views, row, step_number in rows:
+        while started < len(starts) and starts[started][2] <= step_number:
+            name, slot, _, _ = starts[started]
+            owners[slot] = car_ids[name]
+            started += 1
+        width = views['width']
+        start = row * width
+        live = list(compress(range(width), map(ne, views['status'][start:start + width], repeat(DESPAWNED))))
+        if not live:
+            continue
+        if len(live) > 1:
+            pick = itemgetter(*live)
+        else:
+            def pick(values):
+                return (values[live[0]],)
+        columns['car_id'].extend(pick(owners))
+        columns['step'].extend(repeat(step_number, len(live)))
+        columns['x'].extend(pick(views['xs'][start:start + width]))
+        columns['y'].extend(pick(views['ys'][start:start + width]))
+        columns['heading'].extend(pick(views['headings'][start:start + width]))
+        if len(columns['step']) >= chunk_rows:
+            yield columns
+            columns = new_columns(TRAJECTORY_COLUMNS)
+    if columns['step']:
+        yield columns
+
+
+def event_log_chunks(reader, car_ids, chunk_rows):
+    """Yield trajectory column chunks of the places and commands of an event log."""
+    columns = new_columns(TRAJECTORY_COLUMNS)
+    for event in reader:
+        if event[0] == 'place':
+            _, step_number, name, (x, y), heading = event
+        elif event[0] == 'command' and event[6] != DESPAWNED:
+            _, step_number, name, _, (x, y), heading, _ = event
+        else:
+            continue
+        columns['car_id'].append(car_ids[name])
+        columns['step'].append(step_number)
+        columns['x'].append(x)
+        columns['y'].append(y)
+        columns['heading'].append(COMPASS.index(heading))
+        if len(columns['step']) >= chunk_rows:
+            yield columns
+            columns = new_columns(TRAJECTORY_COLUMNS)
+    if columns['step']:
+        yield columns
+
+
+def trajectory_chunks(source, car_ids, chunk_rows=CHUNK_ROWS):
+    """Yield {column: array} chunks of about `chunk_rows` trajectory rows, adding car names to `car_ids`."""
+    if chunk_rows < 1:
+        raise ValueError(f"Chunks must hold at least one row. Invalid chunk size: '{chunk_rows}'")
+    if isinstance(source, EventLogReader):
+        return event_log_chunks(source, car_ids, chunk_rows)
+    return row_chunks(source, car_ids, chunk_rows)
+
+
+def events_of(events):
+    """Yield ('collision', step, name1, name2, (x, y)) and ('violation', step, name, (x, y)) tuples
+    of an engine result or an EventLogReader."""
+    if isinstance(events, EventLogReader):
+        for event in events:
+            if event[0] in EVENT_KINDS:
+                yield event
+    else:
+        for collision in events['collision_events']:
+            yield ('collision',) + tuple(collision)
+        for violation in events['boundary_events']:
+            yield ('violation',) + tuple(violation)
+
+
+def event_chunks(events, car_ids, chunk_rows=CHUNK_ROWS):
+    """Yield {column: array} chunks of about `chunk_rows` events, adding car names to `car_ids`."""
+    columns = new_columns(EVENT_COLUMNS)
+    for event in events_of(events):
+        if event[0] == 'collision':
+            _, step_number, car1_name, car2_name, (x, y) = event
+            other_car_id = car_ids[car2_name]
+        else:
+            _, step_number, car1_name, (x, y) = event
+            other_car_id = -1
+        columns['kind'].append(EVENT_KINDS.index(event[0]))
+        columns['step'].append(step_number)
+        columns['car_id'].append(car_ids[car1_name])
+        columns['other_car_id'].append(other_car_id)
+        columns['x'].append(x)
+        columns['y'].append(y)
+        if len(columns['step']) >= chunk_rows:
+            yield columns
+            columns = new_columns(EVENT_COLUMNS)
+    if columns['step']:
+        yield columns
+
+
+def write_columns(directory, prefix, columns, chunks):
+    """Stream column chunks into ``prefix + name + '.npy'`` files; return the file names."""
+    writers = {name: NpyWriter(os.path.join(directory, f"{prefix}{name}.npy"), typecode)
+               for name, typecode in columns}
+    try:
+        for chunk in chunks:
+            for name, values in chunk.items():
+                writers[name].write(values)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return [os.path.basename(writer.path) for writer in writers.values()]
+
+
+def export_npy(directory, trajectories=None, events=None, chunk_rows=CHUNK_ROWS):
+    """Write trajectory and event columns as ``.npy`` files into a directory.
+
+    Writes car_id, step, x, y and heading for the trajectories,
+    event_kind, event_step, event_car_id, event_other_car_id, event_x and
+    event_y for the events, and cars with the car names. Returns the file
+    names.
+    """
+    os.makedirs(directory, exist_ok=True)
+    car_ids = CarIds()
+    files = []
+    if trajectories is not None:
+        files += write_columns(directory, '', TRAJECTORY_COLUMNS,
+                               trajectory_chunks(trajectories, car_ids, chunk_rows))
+    if events is not None:
+        files += write_columns(directory, 'event_', EVENT_COLUMNS, event_chunks(events, car_ids, chunk_rows))
+    write_names(os.path.join(directory, 'cars.npy'), car_ids.names)
+    return files + ['cars.npy']
+
+
+def export_npz(path, trajectories=None, events=None, chunk_rows=CHUNK_ROWS, compressed=False):
+    """Write the columns of export_npy into one ``.npz`` archive, deflated if `compressed`."""
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as directory:
+        files = export_npy(directory, trajectories, events, chunk_rows)
+        method = zipfile.ZIP_DEFLATED if compressed else zipfile.ZIP_STORED
+        with zipfile.ZipFile(path, 'w', method, allowZip64=True) as archive:
+            for file_name in files:
+                archive.write(os.path.join(directory, file_name), file_name)
+
+
+def export_trajectories_csv(path, trajectories, chunk_rows=CHUNK_ROWS):
+    """Write car_id, step, x, y, heading rows to a CSV file, a chunk at a time."""
+    car_ids = CarIds()
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow([name for name, _ in TRAJECTORY_COLUMNS])
+        for chunk in trajectory_chunks(trajectories, car_ids, chunk_rows):
+            writer.writerows(zip(map(car_ids.names.__getitem__, chunk['car_id']), chunk['step'], chunk['x'],
+                                 chunk['y'], map(COMPASS.__getitem__, chunk['heading'])))
+
+
+def export_events_csv(path, events, chunk_rows=CHUNK_ROWS):
+    """Write kind, step, car_id, other_car_id, x, y rows to a CSV file, a chunk at a time."""
+    car_ids = CarIds()
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow([name for name, _ in EVENT_COLUMNS])
+        for chunk in event_chunks(events, car_ids, chunk_rows):
+            # other_car_id -1 reads as an empty name
+            names = car_ids.names + ['']
+            writer.writerows(zip(map(EVENT_KINDS.__getitem__, chunk['kind']), chunk['step'],
+                                 map(names.__getitem__, chunk['car_id']),
+                                 map(names.__getitem__, chunk['other_car_id']), chunk['x'], chunk['y']))
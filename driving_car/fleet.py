@@ -0,0 +1,676 @@
+"""
+Driving Car Simulation - Fleet Engine
+
+Step engine that keeps the fleet in parallel per-car arrays. Only cars in
+the active set are visited on each step; cars that collide or run out of
+commands are compacted out of it and stay behind in the occupancy index,
+where moving cars are checked against them. The run ends as soon as the
+active set is empty.
+
+Cars whose entries carry 'start' (ticks before the first command),
+'period' (ticks between commands) or 'pauses' ((first_tick, duration)
+windows) are driven by a discrete-event scheduler instead of the lockstep
+loop. On a shared tick every due car executes its command first, then the
+cells of the due cars are checked against all cars on the field, so a
+waiting car is an obstacle just like a stopped one. A car with a start
+offset enters the field on its first tick.
+
+Cars with a speed above one sweep several cells per forward move; every
+swept cell is checked for collisions, not only the cell the car ends on.
+
+Multi-cell vehicles (trucks, buses) put every footprint cell into the
+occupancy index, so an overlap is found by looking up the cells the moving
+vehicles cover, never by comparing footprints pairwise. Their footprint
+rotates on turns, and a turn that would swing it off the field is a
+boundary violation.
+
+Before the run, precheck.precheck_fleet finds each car's first command that
+would leave the field; moves before it skip the bounds check.
+
+The collision policy decides which cars stop when cells are shared: 'stop'
+stops every car involved, 'later' only the car(s) that arrived last in the
+shared cell, and 'ghost' records the collision and lets everyone drive
+through. The boundary policy decides what a move off the field does:
+'skip' drops the command and the car carries on, 'stop' also stops the car,
+'clamp' advances the car up to the last valid cell and 'wrap' brings it
+back in on the opposite side of the field, and 'despawn' treats the field
+edges as sinks that remove the car.
+
+Cars can also be spawned mid-run, by hand (spawn) or by sources that place
+a car every k ticks (add_source), and despawned (despawn or the 'despawn'
+boundary policy). Freed slots go on a free list and are reused by the next
+spawn, so the per-car arrays only grow
+(by doubling) when more cars are live at once than ever before.
+
+Observers (add_observer) see every tick as the list of cars that acted and
+their cells before the tick, after collisions have been resolved; flow
+counters and other accumulators build on this hook.
+"""
+
+from array import array
+from operator import itemgetter
+
+from car import Car, cells_to_edge, footprint_cells, sweep_room
+from precheck import precheck_fleet
+from scheduler import EventScheduler, next_tick
+from simulation import (COMPASS, VECTORS, ACTIONS, COLLISION_POLICIES, BOUNDARY_POLICIES,
+                        new_result, add_collision, add_boundary_violation, get_program, letter_name)
+
+# Car status codes
+ACTIVE = 0
+FINISHED = 1
+COLLIDED = 2
+OFF_FIELD = 3
+DESPAWNED = 4
+
+# Per-car arrays and the value of a free slot
+SLOT_ARRAYS = (('speeds', 1), ('checked_from', 0), ('xs', 0), ('ys', 0), ('headings', 0), ('cursors', 0),
+               ('arrivals', 0), ('status', DESPAWNED), ('starts', 0), ('periods', 1))
+SLOT_LISTS = ('cars', 'names', 'programs', 'bounds', 'footprints', 'pauses')
+
+
+def check_timing(car_data):
+    """Raise ValueError for a start tick or period the scheduler cannot run."""
+    period = car_data.get('period', 1)
+    if period < 1:
+        raise ValueError(f"A car needs a positive period. Invalid period: '{period}'")
+    start = car_data.get('start', 0)
+    if start < 0:
+        raise ValueError(f"A car cannot start before tick 0. Invalid start: '{start}'")
+
+
+class FleetEngine(object):
+    """Step engine over per-car arrays with an explicit active set."""
+
+    def __init__(self, cars_with_commands, verbose=False, collision_policy='stop', boundary_policy='skip',
+                 capacity=0):
+        if collision_policy not in COLLISION_POLICIES:
+            raise ValueError(f"Unknown collision policy: {collision_policy}. Choose from: {', '.join(COLLISION_POLICIES)}")
+        if boundary_policy not in BOUNDARY_POLICIES:
+            raise ValueError(f"Unknown boundary policy: {boundary_policy}. Choose from: {', '.join(BOUNDARY_POLICIES)}")
+        for car_data in cars_with_commands:
+            check_timing(car_data)
+        self.cars_with_commands = cars_with_commands
+        self.verbose = verbose
+        self.collision_policy = collision_policy
+        self.boundary_policy = boundary_policy
+        self.cars = [car_data['car'] for car_data in cars_with_commands]
+        self.names = [car.get_car_name() for car in self.cars]
+        self.programs = [get_program(car_data) for car_data in cars_with_commands]
+        self.bounds = [car.field_bounds for car in self.cars]
+        if boundary_policy == 'wrap' and not all(self.bounds):
+            raise ValueError("The wrap boundary policy needs field bounds on every car")
+        # None for single-cell cars, which keep the one-cell fast path
+        self.footprints = [car.footprint if len(car.footprint) > 1 else None for car in self.cars]
+        if boundary_policy == 'wrap' and any(self.footprints):
+            raise ValueError("The wrap boundary policy only supports single-cell cars")
+        self.speeds = array('l', (car.speed for car in self.cars))
+        self.checked_from = array('l', precheck_fleet(cars_with_commands, self.programs))
+        self.swept = {}
+        self.xs = array('l', (car.get_car_position()[0] for car in self.cars))
+        self.ys = array('l', (car.get_car_position()[1] for car in self.cars))
+        self.headings = array('b', (COMPASS.index(car.get_facing()) for car in self.cars))
+        self.cursors = array('l', [0]) * len(self.cars)
+        self.arrivals = array('l', [0]) * len(self.cars)
+        self.status = array('b', (ACTIVE if program else FINISHED for program in self.programs))
+        self.active = [slot for slot in range(len(self.cars)) if self.status[slot] == ACTIVE]
+        # Set while a snapshot holds on to the active list, which is then copied before it is changed in place
+        self.active_shared = False
+        self.slots = {name: slot for slot, name in enumerate(self.names)}
+        self.starts = array('l', (car_data.get('start', 0) for car_data in cars_with_commands))
+        self.periods = array('l', (car_data.get('period', 1) for car_data in cars_with_commands))
+        self.pauses = [sorted(car_data.get('pauses', ())) for car_data in cars_with_commands]
+        self.occupancy = {}
+        for slot in range(len(self.cars)):
+            if self.starts[slot] == 0:
+                self.occupy(slot)
+        self.step_number = 0
+        self.result = new_result()
+        # (names, cell) of the recorded collisions, so a collision is found without scanning the messages
+        self.recorded = set()
+        self.scheduler = None
+        self.size = len(self.cars)
+        self.free = []
+        self.leaving = []
+        self.stepping = False
+        self.sources = []
+        self.spawned = 0
+        self.despawned = 0
+        self.observers = []
+        if capacity > self.size:
+            self.grow(capacity)
+        if any(key in car_data for car_data in cars_with_commands for key in ('start', 'period', 'pauses')):
+            self.use_scheduler()
+
+    def use_scheduler(self):
+        """Switch from the lockstep active set to the discrete-event scheduler."""
+        if self.scheduler is not None:
+            return
+        self.scheduler = EventScheduler()
+        for slot in self.active:
+            tick = max(self.step_number, self.starts[slot])
+            self.scheduler.schedule(slot, next_tick(tick, 1, self.pauses[slot]))
+        self.active = []
+        self.active_shared = False
+
+    def own_active(self):
+        """Return the active list, copied first if a snapshot holds on to it."""
+        if self.active_shared:
+            self.active = self.active[:]
+            self.active_shared = False
+        return self.active
+
+    def grow(self, capacity):
+        """Extend the per-car arrays to `capacity` slots."""
+        extra = capacity - len(self.xs)
+        for name, value in SLOT_ARRAYS:
+            getattr(self, name).extend([value] * extra)
+        for name in SLOT_LISTS:
+            getattr(self, name).extend([None] * extra)
+
+    def allocate(self):
+        """Return a free slot, reusing despawned slots first and doubling the arrays when full."""
+        if self.free:
+            return self.free.pop()
+        if self.size == len(self.xs):
+            self.grow(max(2 * self.size, 8))
+        self.size += 1
+        return self.size - 1
+
+    def spawn(self, car_data):
+        """Place a new car entry on the field; it executes its first command on the next tick.
+
+        A car entry with a 'start' tick later than the current one waits off
+        the field and enters on the tick after it, like the cars the engine
+        starts with. Returns the car's slot.
+        """
+        car = car_data['car']
+        name = car.get_car_name()
+        if name in self.slots:
+            raise ValueError(f"Car {name} is already on the field")
+        if self.boundary_policy == 'wrap' and (not car.field_bounds or len(car.footprint) > 1):
+            raise ValueError("The wrap boundary policy needs field bounds and single-cell cars")
+        check_timing(car_data)
+        program = get_program(car_data)
+        slot = self.allocate()
+        self.cars[slot] = car
+        self.names[slot] = name
+        self.programs[slot] = program
+        self.bounds[slot] = car.field_bounds
+        self.footprints[slot] = car.footprint if len(car.footprint) > 1 else None
+        self.pauses[slot] = sorted(car_data.get('pauses', ()))
+        self.speeds[slot] = car.speed
+        self.checked_from[slot] = precheck_fleet([car_data], [program])[0]
+        self.xs[slot], self.ys[slot] = car.get_car_position()
+        self.headings[slot] = COMPASS.index(car.get_facing())
+        self.cursors[slot] = 0
+        self.arrivals[slot] = self.step_number
+        self.status[slot] = ACTIVE if program else FINISHED
+        start = car_data.get('start', 0)
+        self.starts[slot] = start if start > self.step_number else 0
+        self.periods[slot] = car_data.get('period', 1)
+        self.slots[name] = slot
+        if not self.starts[slot]:
+            self.occupy(slot)
+        self.spawned += 1
+        for observer in self.observers:
+            if hasattr(observer, 'place'):
+                observer.place(self, [slot])
+        if 'period' in car_data or 'pauses' in car_data or self.starts[slot]:
+            self.use_scheduler()
+        if program:
+            if self.scheduler is None:
+                self.own_active().append(slot)
+            else:
+                tick = max(self.step_number, self.starts[slot])
+                self.scheduler.schedule(slot, next_tick(tick, 1, self.pauses[slot]))
+        return slot
+
+    def despawn(self, car_name):
+        """Remove a car from the field and free its slot."""
+        self.remove(self.slots[car_name])
+
+    def remove(self, slot):
+        """Take a car off the field; the slot is reused once the current step is over."""
+        car = self.cars[slot]
+        car.position = (self.xs[slot], self.ys[slot])
+        car.direction = COMPASS[self.headings[slot]]
+        # A car still waiting for its start tick has not taken its cells yet
+        if not self.starts[slot]:
+            self.vacate(slot)
+        self.starts[slot] = 0
+        if self.scheduler is not None:
+            self.scheduler.cancel(slot)
+        self.status[slot] = DESPAWNED
+        del self.slots[self.names[slot]]
+        self.cars[slot] = self.programs[slot] = None
+        self.despawned += 1
+        for observer in self.observers:
+            if hasattr(observer, 'remove'):
+                observer.remove(self, slot)
+        if self.stepping:
+            self.leaving.append(slot)
+            return
+        if self.scheduler is None and slot in self.active:
+            self.own_active().remove(slot)
+        self.free.append(slot)
+
+    def add_source(self, position, direction, commands, every, field_bounds=None, first_tick=None, count=None,
+                   speed=1, footprint=None, prefix='S'):
+        """Spawn a car with `commands` at `position` every `every` ticks.
+
+        Spawned cars are named `prefix` + the letter name of the number of
+        cars spawned before them, or of the next index whose name is free, so
+        no two source cars share a name even when they share a slot. A source places its first car on
+        `first_tick` (default `every`) and stops after `count` cars; a tick on
+        which the cell is taken is skipped.
+        """
+        if every < 1:
+            raise ValueError(f"A source needs a positive spawn interval. Invalid interval: '{every}'")
+        self.sources.append({
+            'position': tuple(position),
+            'facing': direction,
+            'commands': commands,
+            'every': every,
+            'field_bounds': field_bounds,
+            'next_tick': every if first_tick is None else first_tick,
+            'remaining': count,
+            'speed': speed,
+            'footprint': footprint,
+            'prefix': prefix,
+            'blocked': 0,
+        })
+
+    def spawn_due(self):
+        """Let every source due on the current tick place its car."""
+        exhausted = False
+        for source in self.sources:
+            if source['next_tick'] > self.step_number:
+                continue
+            source['next_tick'] = self.step_number + source['every']
+            # Skip the names of cars already on the field, such as a user car named like a source car
+            index = self.spawned
+            while source['prefix'] + letter_name(index) in self.slots:
+                index += 1
+            car = Car(source['prefix'] + letter_name(index), source['position'], source['facing'],
+                      source['field_bounds'], source['speed'], source['footprint'])
+            if any(cell in self.occupancy for cell in car.get_footprint_cells()):
+                source['blocked'] += 1
+                continue
+            self.spawn({'car': car, 'commands': [source['commands']]})
+            if source['remaining'] is not None:
+                source['remaining'] -= 1
+                exhausted = exhausted or source['remaining'] <= 0
+        if exhausted:
+            self.sources = [source for source in self.sources if source['remaining'] is None or source['remaining'] > 0]
+
+    def next_source_tick(self):
+        """Return the next tick on which a source spawns, or None."""
+        return min((source['next_tick'] for source in self.sources), default=None)
+
+    def add_observer(self, observer):
+        """Call observer.observe(engine, moved, old_xs, old_ys) after every tick.
+
+        moved lists the slots that acted on the tick; old_xs and old_ys hold
+        their cells before it, in the same order. An observer with a
+        place(engine, slots) method is also told about the cars already on
+        the field and about every car spawned later, and one with a
+        remove(engine, slot) method about every car despawned. One with a
+        settle(engine) method is called at the end of every step, once the
+        sources have spawned, when the engine's state is complete between
+        two ticks.
+        """
+        self.observers.append(observer)
+        if hasattr(observer, 'place'):
+            observer.place(self, [slot for slot in range(self.size) if self.status[slot] != DESPAWNED])
+
+    def pause(self, car_name, ticks):
+        """Keep a car from acting during the next `ticks` ticks."""
+        slot = self.slots[car_name]
+        self.use_scheduler()
+        tick = self.scheduler.scheduled_tick(slot)
+        if tick is not None:
+            self.scheduler.schedule(slot, max(tick, self.step_number + ticks + 1))
+
+    def enter(self, slot):
+        """Place a car with a start offset on the field."""
+        self.starts[slot] = 0
+        self.arrivals[slot] = self.step_number
+        self.occupy(slot)
+
+    def cells_at(self, slot, x, y, heading):
+        """Return the cells a car covers when anchored at (x, y) with the given heading."""
+        footprint = self.footprints[slot]
+        if footprint is None:
+            return [(x, y)]
+        return footprint_cells(x, y, heading, footprint)
+
+    def occupy(self, slot):
+        """Add the cells a car covers to the occupancy index."""
+        for cell in self.cells_at(slot, self.xs[slot], self.ys[slot], self.headings[slot]):
+            self.occupancy.setdefault(cell, []).append(slot)
+
+    def vacate(self, slot):
+        """Remove the cells a car covers from the occupancy index."""
+        for cell in self.cells_at(slot, self.xs[slot], self.ys[slot], self.headings[slot]):
+            occupants = self.occupancy[cell]
+            if len(occupants) == 1:
+                del self.occupancy[cell]
+            else:
+                occupants.remove(slot)
+
+    def move_to(self, slot, x, y):
+        """Move a car to a new cell and keep the occupancy index in sync."""
+        if self.footprints[slot] is not None:
+            self.vacate(slot)
+            self.xs[slot] = x
+            self.ys[slot] = y
+            self.arrivals[slot] = self.step_number
+            self.occupy(slot)
+            return
+        cell = (self.xs[slot], self.ys[slot])
+        occupants = self.occupancy[cell]
+        if len(occupants) == 1:
+            del self.occupancy[cell]
+        else:
+            occupants.remove(slot)
+        self.occupancy.setdefault((x, y), []).append(slot)
+        self.xs[slot] = x
+        self.ys[slot] = y
+        self.arrivals[slot] = self.step_number
+
+    def turn_to(self, slot, command, heading):
+        """Turn a multi-cell vehicle, swinging its footprint if it stays on the field."""
+        x = self.xs[slot]
+        y = self.ys[slot]
+        for cell in self.cells_at(slot, x, y, heading):
+            if cell[0] < 0 or cell[1] < 0 or (self.bounds[slot] and (cell[0] >= self.bounds[slot][0] or cell[1] >= self.bounds[slot][1])):
+                self.reject(slot, command, cell, self.cars[slot]._boundary_error(cell))
+                if self.boundary_policy == 'stop':
+                    self.stop_off_field(slot)
+                return False
+        self.vacate(slot)
+        self.headings[slot] = heading
+        self.arrivals[slot] = self.step_number
+        self.occupy(slot)
+        return True
+
+    def reject(self, slot, command, position, message):
+        """Record a command that could not be executed; the car keeps its position."""
+        add_boundary_violation(self.result, self.names[slot], position, self.step_number)
+        if self.verbose:
+            car_name = self.names[slot]
+            print(f"  Step {self.step_number}: {car_name} - {command} - BOUNDARY VIOLATION!")
+            print(f"    Error: {message}")
+            print(f"    Car {car_name} has been stopped.")
+
+    def execute(self, slot):
+        """Execute the next command of a car."""
+        cursor = self.cursors[slot]
+        command = self.programs[slot][cursor]
+        self.cursors[slot] = cursor + 1
+        heading = self.headings[slot]
+        if command == 'F':
+            dx, dy = VECTORS[heading]
+            x = self.xs[slot]
+            y = self.ys[slot]
+            speed = self.speeds[slot]
+            if self.footprints[slot] is not None:
+                # The footprint cell closest to the wall limits the move
+                room, limit = sweep_room(self.cells_at(slot, x, y, heading), dx, dy, self.bounds[slot])
+                if room is not None and room < speed:
+                    speed = self.leave_field(slot, command, limit, dx, dy, room)
+                    if not speed:
+                        return
+            elif cursor >= self.checked_from[slot]:
+                if speed == 1:
+                    bounds = self.bounds[slot]
+                    if x + dx < 0 or y + dy < 0 or (bounds and (x + dx >= bounds[0] or y + dy >= bounds[1])):
+                        room = 0
+                    else:
+                        room = None
+                else:
+                    # Find the first invalid cell of the sweep without walking it
+                    room = cells_to_edge(x, y, dx, dy, self.bounds[slot])
+                if room is not None and room < speed:
+                    speed = self.leave_field(slot, command, (x, y), dx, dy, room)
+                    if not speed:
+                        return
+            if speed > 1:
+                self.swept[slot] = [(x + dx * i, y + dy * i) for i in range(1, speed)]
+            self.move_to(slot, x + dx * speed, y + dy * speed)
+        elif command == 'R' or command == 'L':
+            heading = (heading + 1) % 4 if command == 'R' else (heading - 1) % 4
+            if self.footprints[slot] is None:
+                self.headings[slot] = heading
+            elif not self.turn_to(slot, command, heading):
+                return
+        else:
+            self.reject(slot, command, (self.xs[slot], self.ys[slot]),
+                        f"Invalid command: {command}. Use 'F' for forward, 'L' for left, 'R' for right.")
+            return
+        if self.verbose:
+            print(f"  Step {self.step_number}: {self.names[slot]} - {command} - {ACTIONS[command]}. "
+                  f"Position: ({self.xs[slot]}, {self.ys[slot]}), Facing: {COMPASS[self.headings[slot]]}")
+
+    def reject_move(self, slot, command, x, y):
+        """Reject a forward move whose first invalid cell is (x, y)."""
+        self.reject(slot, command, (x, y), self.cars[slot]._boundary_error((x, y)))
+
+    def leave_field(self, slot, command, limit, dx, dy, room):
+        """Apply the boundary policy to a forward move with only `room` valid cells ahead.
+
+        limit is the cell that reaches the wall first (the anchor for single-cell
+        cars). Returns the number of cells the car still advances in a straight
+        line; 0 when the car stays put or when the move has been carried out here.
+        """
+        policy = self.boundary_policy
+        if policy == 'wrap':
+            x = self.xs[slot]
+            y = self.ys[slot]
+            width, height = self.bounds[slot]
+            path = [((x + dx * i) % width, (y + dy * i) % height) for i in range(1, self.speeds[slot] + 1)]
+            if len(path) > 1:
+                self.swept[slot] = path[:-1]
+            self.move_to(slot, path[-1][0], path[-1][1])
+            if self.verbose:
+                print(f"  Step {self.step_number}: {self.names[slot]} - {command} - wrapped around. "
+                      f"Position: ({self.xs[slot]}, {self.ys[slot]}), Facing: {COMPASS[self.headings[slot]]}")
+            return 0
+        if policy == 'despawn':
+            if self.verbose:
+                print(f"  Step {self.step_number}: {self.names[slot]} - {command} - left the field.")
+            self.remove(slot)
+            return 0
+        self.reject_move(slot, command, limit[0] + dx * (room + 1), limit[1] + dy * (room + 1))
+        if policy == 'stop':
+            self.stop_off_field(slot)
+        elif policy == 'clamp':
+            return room
+        return 0
+
+    def stop_off_field(self, slot):
+        """Stop a car for good after a boundary violation ('stop' boundary policy)."""
+        self.status[slot] = OFF_FIELD
+        if self.scheduler is not None:
+            self.scheduler.cancel(slot)
+
+    def check_collisions(self, moved, first=False):
+        """Check the cells swept by the cars that acted this step.
+
+        Each swept cell is looked up in the occupancy index and in the index
+        of cells swept by the other cars this step, so the cost follows the
+        number of swept cells. Paths hold anchor cells; a multi-cell vehicle
+        covers its footprint at every anchor. A pair collides at the first cell shared along
+        the lower slot's sweep; the collision policy picks the cars that stop,
+        and each of them stops at its first contested cell. Pairs are resolved
+        in sweep order, so a pair past the cell where one of its cars stopped
+        does not collide. On the first tick every shared cell is checked, as
+        the reference engine does, so cars parked together from the start
+        collide even though neither acts.
+        """
+        swept = self.swept
+        sweep_index = {}
+        for slot, anchors in swept.items():
+            for anchor in anchors:
+                for cell in self.cells_at(slot, anchor[0], anchor[1], self.headings[slot]):
+                    sweep_index.setdefault(cell, []).append(slot)
+
+        pairs = {}
+        contacts = {}
+        paths = {}
+        for slot in moved:
+            if self.status[slot] == DESPAWNED:
+                continue
+            path = [(self.xs[slot], self.ys[slot])]
+            if slot in swept:
+                path = swept[slot] + path
+                paths[slot] = path
+            footprint = self.footprints[slot]
+            for index, anchor in enumerate(path):
+                cells = (anchor,) if footprint is None else footprint_cells(anchor[0], anchor[1], self.headings[slot], footprint)
+                for cell in cells:
+                    others = self.occupancy.get(cell, [])
+                    if sweep_index:
+                        others = others + sweep_index.get(cell, [])
+                    for other in others:
+                        if other == slot:
+                            continue
+                        key = (min(slot, other), max(slot, other))
+                        pairs.setdefault(key, cell)
+                        contacts.setdefault((slot, key), index)
+        if first:
+            for cell, occupants in self.occupancy.items():
+                if len(occupants) > 1:
+                    for position, slot in enumerate(occupants):
+                        for other in occupants[position + 1:]:
+                            pairs.setdefault((min(slot, other), max(slot, other)), cell)
+        swept.clear()
+        if not pairs:
+            return
+
+        # Resolve the pairs in sweep order: a car stopped at a contested cell never reaches the cells past it
+        order = sorted(pairs, key=lambda key: (max(contacts.get((slot, key), 0) for slot in key), key))
+        stops = {}
+        for key in order:
+            indices = [contacts.get((slot, key), 0) for slot in key]
+            if any(stops.get(slot, index) < index for slot, index in zip(key, indices)):
+                continue
+            cell = pairs[key]
+            add_collision(self.result, self.names[key[0]], self.names[key[1]], cell, self.step_number, self.verbose,
+                          self.recorded)
+            for slot in self.stopped_by(key, cell):
+                index = contacts.get((slot, key), 0)
+                stops[slot] = min(stops.get(slot, index), index)
+        for slot, index in stops.items():
+            self.status[slot] = COLLIDED
+            self.result['collided_cars'].add(self.names[slot])
+            if self.scheduler is not None:
+                self.scheduler.cancel(slot)
+            if slot in paths and index < len(paths[slot]) - 1:
+                cell = paths[slot][index]
+                self.move_to(slot, cell[0], cell[1])
+        if self.verbose and stops:
+            print(f"  Cars {', '.join(self.names[slot] for slot in sorted(stops))} have been stopped due to collision.")
+
+    def stopped_by(self, pair, cell):
+        """Return the cars of a colliding pair that the collision policy stops."""
+        policy = self.collision_policy
+        if policy == 'stop':
+            return pair
+        if policy == 'ghost':
+            return ()
+        # 'later': a car passing through the cell arrived on this step
+        arrivals = [self.arrivals[slot] if cell in self.cells_at(slot, self.xs[slot], self.ys[slot], self.headings[slot])
+                    else self.step_number for slot in pair]
+        latest = max(arrivals)
+        return [slot for slot, arrival in zip(pair, arrivals) if arrival == latest]
+
+    def compact(self, moved):
+        """Drop collided cars and cars without commands; reschedule the others."""
+        active = []
+        for slot in moved:
+            if self.status[slot] != ACTIVE:
+                continue
+            if self.cursors[slot] >= len(self.programs[slot]):
+                self.status[slot] = FINISHED
+                continue
+            active.append(slot)
+        if self.scheduler is None:
+            self.active = active
+            self.active_shared = False
+            return
+        for slot in active:
+            self.scheduler.schedule(slot, next_tick(self.step_number, self.periods[slot], self.pauses[slot]))
+
+    def pending(self):
+        """Return True while some car still has commands to execute or a source will spawn one."""
+        if self.sources:
+            return True
+        return bool(self.active) if self.scheduler is None else len(self.scheduler) > 0
+
+    def step(self):
+        """Execute one command for every car due on the next tick, then check for collisions.
+
+        Sources due on the tick place their cars after the collision check.
+        """
+        first = self.step_number == 0
+        if self.scheduler is None:
+            self.step_number += 1
+            moved = self.active
+        else:
+            tick = self.scheduler.peek()
+            source_tick = self.next_source_tick()
+            if source_tick is not None and (tick is None or source_tick < tick):
+                self.step_number, moved = source_tick, []
+            else:
+                self.step_number, moved = self.scheduler.pop_due()
+            for slot in moved:
+                if self.starts[slot]:
+                    self.enter(slot)
+        if self.observers:
+            # itemgetter picks every cell in one call, but returns a bare value for a single slot
+            if len(moved) > 1:
+                pick = itemgetter(*moved)
+                old_xs = pick(self.xs)
+                old_ys = pick(self.ys)
+            else:
+                old_xs = [self.xs[slot] for slot in moved]
+                old_ys = [self.ys[slot] for slot in moved]
+        self.stepping = True
+        for slot in moved:
+            self.execute(slot)
+        self.check_collisions(moved, first)
+        self.compact(moved)
+        self.stepping = False
+        for observer in self.observers:
+            observer.observe(self, moved, old_xs, old_ys)
+        if self.leaving:
+            self.free.extend(self.leaving)
+            self.leaving = []
+        if self.sources:
+            self.spawn_due()
+        for observer in self.observers:
+            if hasattr(observer, 'settle'):
+                observer.settle(self)
+
+    def finish(self):
+        """Write the final state back to the cars and return the result."""
+        for slot in range(self.size):
+            car = self.cars[slot]
+            if car is None:
+                continue
+            car.position = (self.xs[slot], self.ys[slot])
+            car.direction = COMPASS[self.headings[slot]]
+        self.result['steps'] = self.step_number
+        return self.result
+
+    def run(self, max_ticks=None):
+        """Step until every car has stopped (and every source is exhausted), or up to `max_ticks`."""
+        if self.verbose:
+            print("\nExecuting commands for all cars simultaneously:")
+        if self.sources:
+            self.spawn_due()
+        while self.pending() and (max_ticks is None or self.step_number < max_ticks):
+            self.step()
+        return self.finish()
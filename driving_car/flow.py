@@ -0,0 +1,183 @@
+"""
+Driving Car Simulation - Flow Counters
+
+Counts vehicles crossing user-defined cut lines, for throughput and
+capacity studies. A FlowCounter is a fleet engine observer: after every
+tick it walks the moves of the cars that acted (cars that did not act cost
+nothing).
+
+Cut lines are straight segments between two points in field coordinates.
+Put them on half coordinates (e.g. from (4.5, -0.5) to (4.5, 9.5) for a
+gate between columns 4 and 5) so that no cell lies on a line. A crossing
+counts as forward when the car passes from the left of the line (seen
+from start to end) to its right, so eastbound traffic is forward on a gate
+drawn northwards; backward otherwise.
+
+When a line is declared it is rasterised once: walking the grid rows and
+columns the line spans, the sign-change tests are run against the unit
+steps next to where it meets each one, and the steps it cuts go into a
+dict, so a line costs time in its length rather than its bounding box.
+Counting a move is then one lookup per cell advanced, however many lines
+there are, and while every car moves at most one cell a tick a move that
+does not start next to a cut step is skipped with a single set lookup.
+Moves are taken as the straight line from the old to the new cell, so a
+wrapped move counts as if it had crossed the field.
+
+Counts are kept per time bucket of `resolution` ticks, so the counter
+doubles as a time series of vehicles per bucket.
+"""
+
+import math
+from array import array
+from itertools import compress
+
+
+def crosses(line, ax, ay, bx, by):
+    """Return +1 or -1 if the move from (ax, ay) to (bx, by) crosses a line forward or backward, else 0."""
+    px, py, qx, qy = line
+    dx = qx - px
+    dy = qy - py
+    left_before = dx * (ay - py) - dy * (ax - px) > 0
+    left_after = dx * (by - py) - dy * (bx - px) > 0
+    if left_before == left_after:
+        return 0
+    # The line's end points must not lie on the same side of the move
+    ex = bx - ax
+    ey = by - ay
+    if (ex * (py - ay) - ey * (px - ax)) * (ex * (qy - ay) - ey * (qx - ax)) > 0:
+        return 0
+    return 1 if left_before else -1
+
+
+class FlowCounter(object):
+    """Crossing counters for a set of cut lines, bucketed in time."""
+
+    def __init__(self, resolution=1):
+        if resolution < 1:
+            raise ValueError(f"Flow resolution must be a positive number of ticks. Invalid resolution: '{resolution}'")
+        self.resolution = resolution
+        self.names = []
+        self.lines = []
+        self.forward = []
+        self.backward = []
+        # (x, y, axis) -> [(line_index, sign)] for the unit step from (x, y)
+        # to (x + 1, y) (axis 0) or (x, y + 1) (axis 1); sign is +1 when that
+        # step crosses the line forward
+        self.cuts = {}
+        # Cells at either end of a cut step; a one-cell move from any other cell crosses nothing
+        self.near = set()
+        # Whether a car may move more than one cell in a tick, unknown until the engine places its cars
+        self.long_moves = None
+
+    def place(self, engine, slots):
+        """Note whether the placed cars can move several cells in a tick, which the near-cell check misses."""
+        self.long_moves = (self.long_moves is True or engine.boundary_policy == 'wrap'
+                           or any(engine.speeds[slot] > 1 for slot in slots))
+
+    def add_line(self, name, start, end):
+        """Declare a cut line from `start` to `end`."""
+        if name in self.names:
+            raise ValueError(f"Cut line {name} is already declared")
+        if tuple(start) == tuple(end):
+            raise ValueError(f"Cut line {name} needs two distinct end points")
+        line_index = len(self.lines)
+        line = (start[0], start[1], end[0], end[1])
+        self.names.append(name)
+        self.lines.append(line)
+        self.forward.append(array('l'))
+        self.backward.append(array('l'))
+
+        # Only unit steps on a grid line the cut line spans can be cut: walk
+        # those grid lines and test the steps next to where the line meets them
+        px, py, qx, qy = line
+        for axis, (u0, v0, u1, v1) in enumerate(((py, px, qy, qx), (px, py, qx, qy))):
+            # Axis 0 steps lie on the row y = u, axis 1 steps on the column x = u
+            if u0 == u1:
+                continue
+            for u in range(math.ceil(min(u0, u1)), math.floor(max(u0, u1)) + 1):
+                v = math.floor(v0 + (v1 - v0) * (u - u0) / (u1 - u0))
+                for w in (v - 1, v, v + 1):
+                    x, y = (w, u) if axis == 0 else (u, w)
+                    sign = crosses(line, x, y, x + 1 - axis, y + axis)
+                    if sign:
+                        self.cuts.setdefault((x, y, axis), []).append((line_index, sign))
+                        self.near.update(((x, y), (x + 1 - axis, y + axis)))
+
+    def observe(self, engine, moved, old_xs, old_ys):
+        """Count the crossings of the cars that moved on the engine's current tick."""
+        cuts = self.cuts
+        if not cuts:
+            return
+        xs = engine.xs
+        ys = engine.ys
+        counts = None
+        cars = zip(moved, old_xs, old_ys)
+        if self.long_moves is False:
+            # Only one-cell moves from a cell next to a cut step can cross a line
+            cars = compress(cars, map(self.near.__contains__, zip(old_xs, old_ys)))
+        for slot, ax, ay in cars:
+            bx = xs[slot]
+            by = ys[slot]
+            # One-cell moves need a single lookup
+            if ay == by:
+                if bx == ax + 1:
+                    hits = cuts.get((ax, ay, 0))
+                    step = 1
+                elif bx == ax - 1:
+                    hits = cuts.get((bx, ay, 0))
+                    step = -1
+                elif bx == ax:
+                    continue
+                else:
+                    hits, step = self.long_move(ax, ay, bx, by)
+            elif ax == bx and by == ay + 1:
+                hits = cuts.get((ax, ay, 1))
+                step = 1
+            elif ax == bx and by == ay - 1:
+                hits = cuts.get((ax, by, 1))
+                step = -1
+            else:
+                hits, step = self.long_move(ax, ay, bx, by)
+            if hits:
+                if counts is None:
+                    counts = {}
+                for line_index, sign in hits:
+                    direction = counts.setdefault(line_index, [0, 0])
+                    direction[0 if sign == step else 1] += 1
+        if counts:
+            bucket = engine.step_number // self.resolution
+            for line_index, (forward, backward) in counts.items():
+                self.add(line_index, bucket, forward, backward)
+
+    def long_move(self, ax, ay, bx, by):
+        """Return (hits, step) for a move over several cells: the cuts of every unit step it takes."""
+        if ay == by:
+            step = 1 if bx > ax else -1
+            keys = [(x if step > 0 else x - 1, ay, 0) for x in range(ax, bx, step)]
+        else:
+            step = 1 if by > ay else -1
+            keys = [(ax, y if step > 0 else y - 1, 1) for y in range(ay, by, step)]
+        hits = [hit for key in keys for hit in self.cuts.get(key, ())]
+        return hits, step
+
+    def add(self, line_index, bucket, forward, backward):
+        """Add crossings to a line's bucket, growing its series as needed."""
+        forward_series = self.forward[line_index]
+        backward_series = self.backward[line_index]
+        if bucket >= len(forward_series):
+            extra = bucket + 1 - len(forward_series)
+            forward_series.extend([0] * extra)
+            backward_series.extend([0] * extra)
+        forward_series[bucket] += forward
+        backward_series[bucket] += backward
+
+    def totals(self, name):
+        """Return (forward, backward) crossings of a cut line over the whole run."""
+        index = self.names.index(name)
+        return sum(self.forward[index]), sum(self.backward[index])
+
+    def series(self, name):
+        """Return [(first_tick, forward, backward)] per time bucket of a cut line."""
+        index = self.names.index(name)
+        return [(bucket * self.resolution, forward, backward)
+                for bucket, (forward, backward) in enumerate(zip(self.forward[index], self.backward[index]))]
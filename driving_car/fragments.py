@@ -0,0 +1,249 @@
+"""
+Driving Car Simulation - Fragment Cache
+
+Cars often share command fragments, such as a standard docking manoeuvre
+entered as one command string. A fragment's free trajectory does not depend
+on where it starts, only on the heading it starts with, so it is compiled
+once per (heading, fragment) into cell offsets from its start, and a car
+that runs it again only translates the offsets to its own cell.
+
+Fragments are the entries of a car's ``commands`` list, as added one input
+at a time by the menu. A cached fragment also keeps the bounding box of its
+offsets: where the translated box stays on the field no move of the
+fragment is rejected, so the translation is exact. Otherwise the fragment
+is compiled cell by cell with two_phase.compile_trajectory.
+
+FragmentCache is an LRU memo bounded by `max_entries` that counts hits,
+misses and evictions and the approximate bytes its entries hold. A miss
+costs several times a plain compile, so a cache smaller than the working set
+would be slower than none: lookups are judged in windows, and after a
+window that evicts at a hit rate under `min_hit_rate` cars are compiled
+from their joined fragments without the cache. After a pause that doubles
+while the cache keeps thrashing it is used again for one window.
+
+    python fragments.py 20000 16 12
+
+times compiling 20000 cars of 16 fragments from a library of 12, with and
+without the cache.
+"""
+
+import gc
+import random
+import sys
+import time
+from collections import OrderedDict
+
+from simulation import COMPASS, VECTORS
+from two_phase import compile_trajectory
+
+PAIR_BYTES = sys.getsizeof((0, 0))
+# Lookups a hit rate is judged on
+WINDOW = 1024
+# Shortest and longest pause, in windows, before a thrashing cache is used again
+MIN_PAUSE = 4
+MAX_PAUSE = 256
+
+
+def compile_fragment(heading, fragment):
+    """Compile a fragment started at (0, 0) on an unbounded field.
+
+    Returns (offsets, headings, invalid, box, end): the cell offset and
+    heading index after each step of the fragment, the steps with a command
+    that is not L, R or F, the (min dx, min dy, max dx, max dy) of the
+    offsets and the net transform (dx, dy, heading) of the whole fragment.
+    """
+    dx = dy = 0
+    offsets = []
+    headings = []
+    invalid = []
+    for step_number, command in enumerate(fragment, 1):
+        if command == 'R':
+            heading = (heading + 1) % 4
+        elif command == 'L':
+            heading = (heading - 1) % 4
+        elif command == 'F':
+            vx, vy = VECTORS[heading]
+            dx += vx
+            dy += vy
+        else:
+            invalid.append(step_number)
+        offsets.append((dx, dy))
+        headings.append(heading)
+    # An empty fragment has the box of its start cell
+    xs = [offset[0] for offset in offsets] or [0]
+    ys = [offset[1] for offset in offsets] or [0]
+    return offsets, headings, invalid, (min(xs), min(ys), max(xs), max(ys)), (dx, dy, heading)
+
+
+def entry_bytes(entry):
+    """Return the approximate memory held by a cache entry."""
+    offsets, headings, invalid, box, end = entry
+    # The offsets are pairs of small ints, which Python shares, so each holds the size of a pair
+    return (sys.getsizeof(offsets) + len(offsets) * PAIR_BYTES + sys.getsizeof(headings)
+            + sys.getsizeof(invalid) + sys.getsizeof(box) + sys.getsizeof(end))
+
+
+class FragmentCache(object):
+    """LRU memo of compiled fragments keyed by (heading index, fragment)."""
+
+    def __init__(self, max_entries=4096, min_hit_rate=0.9):
+        if max_entries < 1:
+            raise ValueError(f"A fragment cache holds at least one entry. Invalid size: '{max_entries}'")
+        self.max_entries = max_entries
+        self.min_hit_rate = min_hit_rate
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bypassed = 0
+        self.bytes = 0
+        self.admitting = True
+        # Lookups left in the current window or pause, and the counters it started with
+        self.window_left = WINDOW
+        self.window_hits = 0
+        self.window_evictions = 0
+        self.pause = MIN_PAUSE * WINDOW
+
+    def get(self, heading, fragment):
+        """Return the compiled fragment, compiling and caching it on a miss."""
+        if self.window_left <= 0:
+            self.end_window()
+        self.window_left -= 1
+        key = (heading, fragment)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        entry = self.entries[key] = compile_fragment(heading, fragment)
+        self.bytes += entry_bytes(entry)
+        if len(self.entries) > self.max_entries:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= entry_bytes(evicted)
+            self.evictions += 1
+        return entry
+
+    def bypass(self, count):
+        """Return whether `count` fragments are to be compiled without the cache, which is thrashing."""
+        if self.admitting:
+            return False
+        if self.window_left <= 0:
+            self.end_window()
+            return False
+        self.window_left -= count
+        self.bypassed += count
+        return True
+
+    def end_window(self):
+        """Stop or resume taking entries by the hit rate of the lookups since the last window."""
+        if not self.admitting:
+            # Take entries again for one window, in case the working set has shrunk
+            self.admitting = True
+            self.window_left = WINDOW
+        elif (self.evictions > self.window_evictions
+              and self.hits - self.window_hits < self.min_hit_rate * WINDOW):
+            self.admitting = False
+            self.window_left = self.pause
+            self.pause = min(self.pause * 2, MAX_PAUSE * WINDOW)
+        else:
+            self.window_left = WINDOW
+            self.pause = MIN_PAUSE * WINDOW
+        self.window_hits = self.hits
+        self.window_evictions = self.evictions
+
+    def stats(self):
+        """Return the hit and memory counters of the cache."""
+        lookups = self.hits + self.misses
+        return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'bypassed': self.bypassed,
+                'hit_rate': self.hits / lookups if lookups else 0.0, 'bytes': self.bytes}
+
+
+def compile_fragments(position, direction, fragments, field_bounds=None, cache=None):
+    """Compute the free trajectory of a car from its fragments, as compile_trajectory does.
+
+    Returns the (path, headings, violations) of compile_trajectory on the
+    joined fragments.
+    """
+    if cache is None:
+        cache = FragmentCache()
+    if cache.bypass(len(fragments)):
+        return compile_trajectory(position, direction, ''.join(fragments), field_bounds)
+    x, y = position
+    heading = COMPASS.index(direction)
+    path = []
+    headings = []
+    violations = []
+    width, height = field_bounds if field_bounds else (float('inf'), float('inf'))
+    get = cache.get
+    for fragment in fragments:
+        if not fragment:
+            continue
+        offsets, fragment_headings, invalid, (min_dx, min_dy, max_dx, max_dy), end = get(heading, fragment)
+        if x + min_dx < 0 or y + min_dy < 0 or x + max_dx >= width or y + max_dy >= height:
+            # Some move may be rejected at the edge of the field
+            start = len(path)
+            fragment_path, fragment_headings, fragment_violations = compile_trajectory(
+                (x, y), COMPASS[heading], fragment, field_bounds)
+            path += fragment_path
+            violations += [(start + step_number, cell) for step_number, cell in fragment_violations]
+            x, y = path[-1]
+        else:
+            if invalid:
+                start = len(path)
+            path += [(x + dx, y + dy) for dx, dy in offsets]
+            if invalid:
+                violations += [(start + step_number, path[start + step_number - 1]) for step_number in invalid]
+            x += end[0]
+            y += end[1]
+        headings += fragment_headings
+        heading = end[2]
+    return path, headings, violations
+
+
+def fragment_fleet(num_cars, num_fragments, library_size, size, seed=0):
+    """Return (position, direction, fragments) of cars that draw their fragments from a shared library."""
+    rng = random.Random(seed)
+    library = [''.join(rng.choice('FFFLR') for _ in range(rng.randint(8, 40))) for _ in range(library_size)]
+    return [((rng.randrange(size), rng.randrange(size)), rng.choice(COMPASS),
+             [rng.choice(library) for _ in range(num_fragments)]) for _ in range(num_cars)]
+
+
+def time_compile(cars, size, cache=None):
+    """Return the seconds taken to compile every car, joining its fragments if there is no cache."""
+    gc.collect()
+    start = time.perf_counter()
+    if cache is None:
+        for position, direction, fragments in cars:
+            compile_trajectory(position, direction, ''.join(fragments), (size, size))
+    else:
+        for position, direction, fragments in cars:
+            compile_fragments(position, direction, fragments, (size, size), cache)
+    return time.perf_counter() - start
+
+
+def main():
+    num_cars = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    num_fragments = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    library_size = int(sys.argv[3]) if len(sys.argv) > 3 else 12
+    size = 1000
+    cars = fragment_fleet(num_cars, num_fragments, library_size, size)
+    print(f"Fragment cache: {num_cars} cars of {num_fragments} fragments from a library of {library_size}, "
+          f"field {size}x{size}")
+    same = all(compile_fragments(position, direction, fragments, (size, size)) ==
+               compile_trajectory(position, direction, ''.join(fragments), (size, size))
+               for position, direction, fragments in cars[:100])
+    plain_seconds = time_compile(cars, size)
+    cache = FragmentCache()
+    cached_seconds = time_compile(cars, size, cache)
+    stats = cache.stats()
+    print(f"  compile_trajectory: {plain_seconds:.2f} s, compile_fragments: {cached_seconds:.2f} s, "
+          f"same trajectories: {same}")
+    print(f"  {stats['entries']} entries, {stats['bytes'] / 1024:.0f} KiB, hit rate {stats['hit_rate']:.1%}, "
+          f"{stats['evictions']} evictions, {stats['bypassed']} fragments compiled without the cache")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,330 @@
+"""
+Driving Car Simulation - Incremental What-If Engine
+
+A two-phase engine that keeps its trajectories, (cell, step) index and
+collisions between runs, so adding a car or editing one car's commands
+costs time in proportion to the cars it affects instead of a run of the
+whole fleet. The result after every change is identical to a fresh
+TwoPhaseEngine run of the changed fleet.
+
+Every collided pair is kept, per step and per car. When a car changes,
+its new free trajectory is compiled and compared with the old one; from
+the first step where its cells differ the car is invalidated:
+
+- its collisions from that step on are dropped, and so is its truncation
+  if that came from one of them, so it drives on until they are found
+  again;
+- every car it had dropped collisions with is invalidated from the step
+  of that collision, and so on through the cascade;
+- a car that the resolve phase stops earlier than in the previous run is
+  invalidated from the step after its new stop.
+
+Only the (cell, step) visits of invalidated cars, and the cars arriving on
+their parking cells, are fed back to TwoPhaseEngine.resolve; a collision
+between two cars that are both still valid is already kept. The result
+lists are kept sorted between changes, and only the collisions of the
+cells whose pairs changed and the violations of invalidated cars are
+deleted from or inserted into them.
+
+    python incremental.py 2000 100 200
+
+times single-car edits against full runs.
+"""
+
+import random
+import sys
+import time
+from bisect import bisect_left
+
+from benchmark import random_scenario
+from car import Car
+from simulation import COMPASS, new_result, record_collision, copy_fleet
+from two_phase import TwoPhaseEngine, check_supported
+
+
+def first_difference(old_path, new_path):
+    """Return the first step on which a car's cells differ between two free trajectories, or None."""
+    for step_number, (old_cell, new_cell) in enumerate(zip(old_path, new_path), 1):
+        if old_cell != new_cell:
+            return step_number
+    if len(old_path) != len(new_path):
+        # One of them parks while the other still drives
+        return min(len(old_path), len(new_path)) + 1
+    return None
+
+
+class IncrementalEngine(TwoPhaseEngine):
+    """Two-phase engine that re-resolves only the cars a changed car affects."""
+
+    def __init__(self, cars_with_commands, fragment_cache=None):
+        super(IncrementalEngine, self).__init__(list(cars_with_commands), fragment_cache=fragment_cache)
+        self.indexes = {name: index for index, name in enumerate(self.names)}
+        # Every collided pair, as cell -> {(step, i, j)} and index -> {(step, i, j, cell)}
+        self.pairs_at = {}
+        self.car_pairs = []
+        self.collision_counts = []
+        self.collided = set()
+        # index -> first step from which a car may behave differently than in the previous run
+        self.invalid_from = {}
+        # Cells whose collisions changed since the result was last updated
+        self.touched = set()
+        # Sorted keys of the result's events: cell -> {(step, i, j)} of the recorded collisions,
+        # (step, i, j, cell) of the collision events and (step, index, cell) of the violations
+        self.recorded_at = {}
+        self.event_keys = []
+        self.violation_keys = []
+        self.car_violations = []
+        # Sorted (first violation, index) of the cars with violations
+        self.first_violations = []
+        self.collision_results = []
+        self.collision_events = []
+        self.boundary_events = []
+        self.result = None
+        self.affected = 0
+
+    def run(self):
+        """Run both phases on the whole fleet, or return the result of the last change."""
+        if self.result is not None:
+            return self.result
+        self.compile()
+        self.build_index()
+        self.car_pairs = [set() for _ in self.paths]
+        self.collision_counts = [0] * len(self.paths)
+        self.car_violations = [[] for _ in self.paths]
+        self.invalid_from = dict.fromkeys(range(len(self.paths)), 1)
+        self.resolve(new_result(), self.initial_candidates())
+        return self.update_result()
+
+    def set_car(self, car_data):
+        """Add a car entry, or replace the entry of the car with the same name; return the new result."""
+        check_supported(car_data)
+        self.run()
+        name = car_data['car'].get_car_name()
+        had_steps = any(self.paths)
+        path, headings, violations = self.compile_car(car_data)
+        index = self.indexes.get(name)
+        if index is None:
+            index = self.indexes[name] = len(self.paths)
+            self.cars_with_commands.append(car_data)
+            self.names.append(name)
+            self.origins.append(car_data['car'].get_car_position())
+            self.paths.append(path)
+            self.headings.append(headings)
+            self.violations.append(violations)
+            self.end.append(len(path))
+            self.car_pairs.append(set())
+            self.collision_counts.append(0)
+            self.car_violations.append([])
+            changed_from = 1
+        else:
+            self.cars_with_commands[index] = car_data
+            changed_from = first_difference(self.paths[index], path)
+            self.remove_visits(index)
+            if changed_from is None and self.origins[index] != car_data['car'].get_car_position():
+                # A car with an empty program that is parked somewhere else
+                changed_from = 1
+            self.origins[index] = car_data['car'].get_car_position()
+            if any(pair[0] == self.end[index] for pair in self.car_pairs[index]):
+                self.end[index] = min(self.end[index], len(path))
+            else:
+                # A car no collision stopped drives to the end of its new commands
+                self.end[index] = len(path)
+            self.paths[index] = path
+            self.headings[index] = headings
+            self.violations[index] = violations
+        self.add_visits(index)
+        candidates = [] if changed_from is None else self.invalidate(index, changed_from)
+        if had_steps != any(self.paths):
+            # Step 1, on which cars parked together from the start meet, has appeared or gone
+            for cell in self.shared_origins():
+                for other in self.parked[cell]:
+                    if not self.end[other]:
+                        candidates.extend(self.invalidate(other, 1))
+        if candidates:
+            self.resolve(new_result(), candidates)
+        # Its heading and violations may have changed even if its cells did not
+        self.invalid_from.setdefault(index, None)
+        return self.update_result()
+
+    def add_visits(self, index):
+        """Index the (cell, step) visits and the parking cell of a car."""
+        path = self.paths[index]
+        for step_number, cell in enumerate(path, 1):
+            cell_visits = self.visits.setdefault(cell, [])
+            cell_visits.insert(bisect_left(cell_visits, (step_number, index)), (step_number, index))
+            self.occupants.setdefault((cell, step_number), []).append(index)
+        self.parked.setdefault(self.parking_cell(index), set()).add(index)
+
+    def remove_visits(self, index):
+        """Take a car's visits and parking cell out of the index."""
+        path = self.paths[index]
+        for step_number, cell in enumerate(path, 1):
+            cell_visits = self.visits[cell]
+            del cell_visits[bisect_left(cell_visits, (step_number, index))]
+            self.occupants[(cell, step_number)].remove(index)
+        self.parked[self.parking_cell(index)].discard(index)
+
+    def invalidate(self, index, step_number):
+        """Invalidate a car from a step on, cascading to the cars it collided with since.
+
+        Returns the (step, cell) candidates to resolve again.
+        """
+        candidates = []
+        stack = [(index, step_number)]
+        while stack:
+            index, step_number = stack.pop()
+            if self.invalid_from.get(index, step_number + 1) <= step_number:
+                continue
+            self.invalid_from[index] = step_number
+            for pair in [pair for pair in self.car_pairs[index] if pair[0] >= step_number]:
+                self.remove_pair(pair)
+                stack.append((pair[2] if pair[1] == index else pair[1], pair[0]))
+            path = self.paths[index]
+            if step_number <= self.end[index] < len(path):
+                # The collision that stopped it is gone; it drives on until it is found again
+                self.parked[path[self.end[index] - 1]].discard(index)
+                self.end[index] = len(path)
+                self.parked.setdefault(path[-1], set()).add(index)
+            end = self.end[index]
+            if not end and step_number == 1:
+                candidates.append((1, self.origins[index]))
+            candidates.extend((later, path[later - 1]) for later in range(step_number, end + 1))
+            candidates.extend(self.arrivals(self.parking_cell(index), max(end, step_number - 1), index))
+        return candidates
+
+    def collide(self, result, i, j, cell, step_number):
+        """Keep a collision unless both cars are still valid, in which case it is kept already."""
+        invalid_from = self.invalid_from
+        if invalid_from.get(i, step_number + 1) > step_number and invalid_from.get(j, step_number + 1) > step_number:
+            return
+        self.pairs_at.setdefault(cell, set()).add((step_number, i, j))
+        self.touched.add(cell)
+        pair = (step_number, i, j, cell)
+        for index in (i, j):
+            self.car_pairs[index].add(pair)
+            self.collision_counts[index] += 1
+            self.collided.add(self.names[index])
+
+    def remove_pair(self, pair):
+        step_number, i, j, cell = pair
+        self.pairs_at[cell].discard((step_number, i, j))
+        self.touched.add(cell)
+        for index in (i, j):
+            self.car_pairs[index].discard(pair)
+            self.collision_counts[index] -= 1
+            if not self.collision_counts[index]:
+                self.collided.discard(self.names[index])
+
+    def truncate(self, index, step_number):
+        """Stop a car, invalidating it from the next step if it drove on in the previous run."""
+        candidates = super(IncrementalEngine, self).truncate(index, step_number)
+        candidates.extend(self.invalidate(index, step_number + 1))
+        return candidates
+
+    def update_result(self):
+        """Splice the changed collisions and violations into the result lists and return a copy.
+
+        Whether a collision is recorded depends on the earlier messages about
+        the same cell only (the cell is the one parenthesised part of a
+        message), so the messages of the touched cells are recomputed with
+        record_collision and the differences are inserted or deleted in place.
+        """
+        for cell in self.touched:
+            messages = []
+            recorded = set()
+            for step_number, i, j in sorted(self.pairs_at.get(cell, ())):
+                if record_collision(messages, self.names[i], self.names[j], cell, step_number, verbose=False):
+                    recorded.add((step_number, i, j))
+            previous = self.recorded_at.get(cell, set())
+            for step_number, i, j in previous - recorded:
+                position = bisect_left(self.event_keys, (step_number, i, j, cell))
+                del self.event_keys[position]
+                del self.collision_events[position]
+                del self.collision_results[2 * position:2 * position + 2]
+            for step_number, i, j in sorted(recorded - previous):
+                position = bisect_left(self.event_keys, (step_number, i, j, cell))
+                self.event_keys.insert(position, (step_number, i, j, cell))
+                names = self.names[i], self.names[j]
+                self.collision_events.insert(position, (step_number,) + names + (cell,))
+                self.collision_results[2 * position:2 * position] = [
+                    f"{names[0]}, collides with {names[1]} at ({cell[0]},{cell[1]}) at step {step_number}",
+                    f"{names[1]}, collides with {names[0]} at ({cell[0]},{cell[1]}) at step {step_number}"]
+            self.recorded_at[cell] = recorded
+        self.touched = set()
+
+        for index in self.invalid_from:
+            car = self.cars_with_commands[index]['car']
+            end = self.end[index]
+            if end:
+                car.position = self.paths[index][end - 1]
+                car.direction = COMPASS[self.headings[index][end - 1]]
+            keys = [(step_number, index, cell) for step_number, cell in self.violations[index] if step_number <= end]
+            if keys == self.car_violations[index]:
+                continue
+            for key in self.car_violations[index]:
+                position = bisect_left(self.violation_keys, key)
+                del self.violation_keys[position]
+                del self.boundary_events[position]
+            for key in keys:
+                position = bisect_left(self.violation_keys, key)
+                self.violation_keys.insert(position, key)
+                self.boundary_events.insert(position, (key[0], self.names[index], key[2]))
+            if self.car_violations[index]:
+                self.first_violations.remove((self.car_violations[index][0], index))
+            if keys:
+                first = (keys[0], index)
+                self.first_violations.insert(bisect_left(self.first_violations, first), first)
+            self.car_violations[index] = keys
+        self.affected = len(self.invalid_from)
+        self.invalid_from = {}
+
+        result = new_result()
+        result['collision_results'] = list(self.collision_results)
+        result['collision_events'] = list(self.collision_events)
+        result['collided_cars'] = set(self.collided)
+        result['boundary_events'] = list(self.boundary_events)
+        result['boundary_violated_cars'] = [self.names[index] for _, index in self.first_violations]
+        result['steps'] = max(map(len, self.paths)) if self.paths else 0
+        self.result = result
+        return result
+
+
+def main():
+    num_cars = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    num_steps = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    size = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    num_edits = int(sys.argv[4]) if len(sys.argv) > 4 else 20
+    rng = random.Random(1)
+    fleet = random_scenario(num_cars, num_steps, size)
+    print(f"Incremental what-if: {num_cars} cars, up to {num_steps} steps, {size} x {size} field, "
+          f"{num_edits} single-car edits")
+    engine = IncrementalEngine(copy_fleet(fleet))
+    start = time.perf_counter()
+    engine.run()
+    print(f"  first run: {time.perf_counter() - start:.3f} s")
+    full_seconds = edit_seconds = 0.0
+    affected = 0
+    for _ in range(num_edits):
+        index = rng.randrange(num_cars)
+        commands = fleet[index]['commands'][0]
+        cut = rng.randrange(len(commands))
+        fleet[index]['commands'] = [commands[:cut] + rng.choice('FLR') + commands[cut + 1:]]
+        edited = copy_fleet([fleet[index]])[0]
+        edited['car'] = Car(edited['name'], edited['position'], edited['facing'], (size, size))
+        start = time.perf_counter()
+        engine.set_car(edited)
+        edit_seconds += time.perf_counter() - start
+        affected += engine.affected
+        rerun = copy_fleet(fleet)
+        for car_data in rerun:
+            car_data['car'] = Car(car_data['name'], car_data['position'], car_data['facing'], (size, size))
+        start = time.perf_counter()
+        TwoPhaseEngine(rerun).run()
+        full_seconds += time.perf_counter() - start
+    print(f"  full run per edit: {full_seconds / num_edits * 1000:.1f} ms, incremental: "
+          f"{edit_seconds / num_edits * 1000:.1f} ms, {affected / num_edits:.1f} cars affected on average")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
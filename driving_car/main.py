@@ -13,6 +13,7 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from car import Car
+from simulation import simulate, check_collisions
 
 # Global list to store all cars
 cars_list = []
@@ -224,46 +225,8 @@ def process_command(car, command):
         print("  - Command sequences: FFRFFLF (multiple moves at once)")
         return True
 
-def check_collisions(current_positions, step_number, collision_results):
-    """Check for collisions between cars at current step."""
-    collision_found = False
-    new_collided_cars = set()
-    car_names = list(current_positions.keys())
-    
-    # Check each pair of cars for collision
-    for i in range(len(car_names)):
-        for j in range(i + 1, len(car_names)):
-            car1_name = car_names[i]
-            car2_name = car_names[j]
-            car1_pos = current_positions[car1_name]
-            car2_pos = current_positions[car2_name]
-            
-            # Check if cars are at the same position
-            if car1_pos == car2_pos:
-                collision_found = True
-                new_collided_cars.add(car1_name)
-                new_collided_cars.add(car2_name)
-                
-                collision_msg1 = f"{car1_name}, collides with {car2_name} at ({car1_pos[0]},{car1_pos[1]}) at step {step_number}"
-                collision_msg2 = f"{car2_name}, collides with {car1_name} at ({car2_pos[0]},{car2_pos[1]}) at step {step_number}"
-                
-                # Check if this collision has already been recorded (avoid duplicates)
-                collision_exists = any(
-                    ((car1_name in result and car2_name in result) or (car2_name in result and car1_name in result)) 
-                    and f"({car1_pos[0]},{car1_pos[1]})" in result
-                    for result in collision_results
-                )
-                
-                if not collision_exists:
-                    collision_results.append(collision_msg1)
-                    collision_results.append(collision_msg2)
-                    print(f"\n*** COLLISION DETECTED at step {step_number} ***")
-                    print(f"Cars {car1_name} and {car2_name} collided at position ({car1_pos[0]},{car1_pos[1]})")
-    
-    return collision_found, new_collided_cars
-
-def run_simulation():
-    """Run the main simulation loop."""
+def run_simulation(engine='step'):
+    """Run the main simulation loop with the selected engine (see simulation.ENGINES)."""
     try:
         if not cars_list:
             print("No cars available. Please add a car first.")
@@ -281,83 +244,11 @@ def run_simulation():
             print("Please add commands to cars first by selecting option 1 and adding commands.")
             return 1
         
-        # Track all car positions during simulation for collision detection
-        collision_results = []
-        collided_cars = set() 
-        boundary_violated_cars = set()
-         
-        # Find the maximum number of commands across all cars
-        max_commands = 0
-        for car_data in cars_with_commands:
-            total_commands = sum(len(cmd_seq) for cmd_seq in car_data['commands'])
-            max_commands = max(max_commands, total_commands)
-            
         # Execute commands step by step for all cars simultaneously
-        step_number = 0
-        car_command_indices = {car_data['name']: {'seq_idx': 0, 'cmd_idx': 0} for car_data in cars_with_commands}
-        
-        print("\nExecuting commands for all cars simultaneously:")
-  
-        for step in range(max_commands):
-            step_number += 1
-            current_positions = {}
-                           
-            # Execute one command for each car if they have commands remaining
-            for car_data in cars_with_commands:
-                car = car_data['car']
-                car_name = car.get_car_name()
-                commands = car_data['commands']
-                indices = car_command_indices[car_name]
-                
-                # Skip this car if it has already collided
-                if car_name in collided_cars:
-                    current_positions[car_name] = car.get_car_position()
-                    continue
-                
-                # Check if this car still has commands to execute
-                if indices['seq_idx'] < len(commands):
-                    current_sequence = commands[indices['seq_idx']]
-                    
-                    if indices['cmd_idx'] < len(current_sequence):
-                        # Execute the next command
-                        single_command = current_sequence[indices['cmd_idx']]
-                        
-                        try:
-                            car.move(single_command)
-                            # Show feedback for each command
-                            if single_command == 'L':
-                                action = "turned left"
-                            elif single_command == 'R':
-                                action = "turned right"
-                            elif single_command == 'F':
-                                action = "moved forward"
-                        
-                            pos = car.get_car_position()
-                            print(f"  Step {step_number}: {car_name} - {single_command} - {action}. Position: ({pos[0]}, {pos[1]}), Facing: {car.get_facing()}")
-                            
-                        except ValueError as e:
-                            boundary_violated_cars.add(car_name)
-                            print(f"  Step {step_number}: {car_name} - {single_command} - BOUNDARY VIOLATION!")
-                            print(f"    Error: {e}")
-                            print(f"    Car {car_name} has been stopped.")
-
-                        # Move to next command
-                        indices['cmd_idx'] += 1
-                        
-                        if indices['cmd_idx'] >= len(current_sequence):
-                            indices['seq_idx'] += 1
-                            indices['cmd_idx'] = 0
-                            
-                # Store current position for collision detection
-                current_positions[car_name] = car.get_car_position()
-            
-            # Check for collisions at this step
-            collision_found, new_collided_cars = check_collisions(current_positions, step_number, collision_results)
-            
-             # Add newly collided cars to the set of stopped cars
-            if new_collided_cars:
-                collided_cars.update(new_collided_cars)
-                print(f"  Cars {', '.join(new_collided_cars)} have been stopped due to collision.") 
+        result = simulate(cars_with_commands, engine=engine, verbose=True)
+        collision_results = result['collision_results']
+        collided_cars = result['collided_cars']
+        boundary_violated_cars = result['boundary_violated_cars']
         
         print("\n" + "=" * 50)
         print("      SIMULATION COMPLETED")
@@ -476,6 +367,8 @@ def main():
     # if len(sys.argv) > 1 and sys.argv[1] == '--demo':
     #     run_demo()
     #     return 0
+    # Select the simulation engine, e.g. 'python main.py --engine two_phase'
+    engine = sys.argv[sys.argv.index('--engine') + 1] if '--engine' in sys.argv[:-1] else 'step'
     display_welcome()
     
     # Create smulation field in x y format
@@ -520,7 +413,7 @@ def main():
                     continue
                     
                 # Run simulation
-                result = run_simulation()
+                result = run_simulation(engine)
                 
                 # After simulation, ask if user wants to continue
                 continue_choice = input("\nWould you like to continue? (y/n): ").strip().lower()
@@ -0,0 +1,66 @@
+"""
+Driving Car Simulation - Boundary Precheck
+
+Finds, before the simulation runs, the first command that would take each
+car off the field. The command stream is split into straight runs; heading
+and displacement are summed run by run (turn runs add their R/L balance,
+forward runs add length x speed cells), and the wall is hit inside a run
+at a closed-form index. Cars proven safe skip the per-move bounds check in
+the fleet engine. A car only deviates from its free trajectory after its
+first violation (or once it has stopped), so the precheck is exact.
+Multi-cell vehicles can also violate on a turn; they are not prechecked.
+"""
+
+from car import cells_to_edge
+from segments import RUNS
+from simulation import COMPASS, VECTORS
+
+VALID_COMMANDS = frozenset('LRF')
+
+
+def first_violation(position, direction, program, field_bounds=None, speed=1):
+    """Return the index of the first command that would be rejected, or None if the car stays on the field."""
+    x, y = position
+    if x < 0 or y < 0 or (field_bounds and (x >= field_bounds[0] or y >= field_bounds[1])):
+        return 0
+
+    # Car.move rejects unknown commands as well
+    first_invalid = None
+    if not VALID_COMMANDS.issuperset(program):
+        first_invalid = next(index for index, command in enumerate(program) if command not in VALID_COMMANDS)
+
+    heading = COMPASS.index(direction)
+    for run in RUNS.finditer(program):
+        start = run.start()
+        if first_invalid is not None and start > first_invalid:
+            break
+        commands = run.group()
+        if commands[0] != 'F':
+            heading = (heading + commands.count('R') - commands.count('L')) % 4
+            continue
+        dx, dy = VECTORS[heading]
+        distance = len(commands) * speed
+        room = cells_to_edge(x, y, dx, dy, field_bounds)
+        if room is not None and room < distance:
+            index = start + room // speed
+            return index if first_invalid is None else min(index, first_invalid)
+        x += dx * distance
+        y += dy * distance
+    return first_invalid
+
+
+def precheck_fleet(cars_with_commands, programs=None):
+    """Return, for every car, the index of its first rejected command (len(program) if none).
+
+    Multi-cell vehicles get 0, so every one of their moves is checked.
+    """
+    results = []
+    for index, car_data in enumerate(cars_with_commands):
+        car = car_data['car']
+        if len(car.footprint) > 1:
+            results.append(0)
+            continue
+        program = programs[index] if programs is not None else ''.join(car_data['commands'])
+        first = first_violation(car.get_car_position(), car.get_facing(), program, car.field_bounds, car.speed)
+        results.append(len(program) if first is None else first)
+    return results
@@ -0,0 +1,267 @@
+"""
+Driving Car Simulation - Proximity Index
+
+Uniform-grid bucket index over the cars on the field, for near-miss
+detection and nearest-car queries. The field is cut into square buckets of
+`bucket` cells (by default the query radius), and each car sits in the
+bucket of its anchor cell. As a fleet engine observer the index is updated
+incrementally: only cars that moved into another bucket on a tick are
+re-bucketed.
+
+- pairs() reports every pair of cars within the radius by comparing each
+  bucket with itself and its forward neighbours only, so the work follows
+  the number of close pairs rather than the square of the fleet size.
+- nearest() searches rings of buckets outwards from a car and stops once
+  no unvisited bucket can hold a closer car.
+- NearMisses turns the index into an event log of cars coming within the
+  radius of each other.
+
+Distances are taken between anchor cells, with the Manhattan or the
+Chebyshev metric. Cars that collided or finished stay on the field and are
+still indexed; despawned cars are not.
+"""
+
+from fleet import DESPAWNED
+
+METRICS = ('manhattan', 'chebyshev')
+
+
+class ProximityIndex(object):
+    """Bucket grid over the cars of a fleet engine."""
+
+    def __init__(self, radius, metric='manhattan', bucket=None):
+        if radius < 0:
+            raise ValueError(f"Proximity radius must not be negative. Invalid radius: '{radius}'")
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric}. Choose from: {', '.join(METRICS)}")
+        if bucket is not None and bucket < 1:
+            raise ValueError(f"Bucket size must be a positive number of cells. Invalid bucket size: '{bucket}'")
+        self.radius = radius
+        self.chebyshev = metric == 'chebyshev'
+        self.bucket = bucket or max(radius, 1)
+        self.engine = None
+        # (bucket_x, bucket_y) -> set of slots, and slot -> its bucket
+        self.buckets = {}
+        self.where = {}
+        # Bounding box of every bucket ever used: [min_x, min_y, max_x, max_y]
+        self.extent = None
+
+    def insert(self, slot, x, y):
+        """Put a car into the bucket of cell (x, y)."""
+        key = (x // self.bucket, y // self.bucket)
+        self.where[slot] = key
+        members = self.buckets.get(key)
+        if members is None:
+            self.buckets[key] = {slot}
+            extent = self.extent
+            if extent is None:
+                self.extent = [key[0], key[1], key[0], key[1]]
+            else:
+                extent[0] = min(extent[0], key[0])
+                extent[1] = min(extent[1], key[1])
+                extent[2] = max(extent[2], key[0])
+                extent[3] = max(extent[3], key[1])
+        else:
+            members.add(slot)
+
+    def discard(self, slot):
+        """Take a car out of the index, if it is in it."""
+        key = self.where.pop(slot, None)
+        if key is not None:
+            members = self.buckets[key]
+            members.discard(slot)
+            if not members:
+                del self.buckets[key]
+
+    def place(self, engine, slots):
+        """Index cars placed on the field."""
+        self.engine = engine
+        for slot in slots:
+            self.discard(slot)
+            self.insert(slot, engine.xs[slot], engine.ys[slot])
+
+    def remove(self, engine, slot):
+        """Drop a despawned car."""
+        self.discard(slot)
+
+    def observe(self, engine, moved, old_xs, old_ys):
+        """Re-bucket the cars that moved into another bucket on the engine's current tick."""
+        bucket = self.bucket
+        where = self.where
+        xs = engine.xs
+        ys = engine.ys
+        status = engine.status
+        for slot in moved:
+            if status[slot] == DESPAWNED:
+                self.discard(slot)
+                continue
+            x = xs[slot]
+            y = ys[slot]
+            if where.get(slot) != (x // bucket, y // bucket):
+                self.discard(slot)
+                self.insert(slot, x, y)
+
+    def rebuild(self, engine):
+        """Index the cars on the field of an engine from scratch."""
+        self.buckets = {}
+        self.where = {}
+        self.extent = None
+        self.place(engine, [slot for slot in range(engine.size) if engine.status[slot] != DESPAWNED])
+
+    def distance(self, slot, other):
+        """Return the distance between the anchor cells of two cars."""
+        xs = self.engine.xs
+        ys = self.engine.ys
+        dx = abs(xs[slot] - xs[other])
+        dy = abs(ys[slot] - ys[other])
+        return max(dx, dy) if self.chebyshev else dx + dy
+
+    def within(self, slot, radius=None):
+        """Return [(other_slot, distance)] for the cars within `radius` (default: the index radius) of a car."""
+        radius = self.radius if radius is None else radius
+        reach = -(-radius // self.bucket)
+        bucket_x, bucket_y = self.where[slot]
+        buckets = self.buckets
+        xs = self.engine.xs
+        ys = self.engine.ys
+        x = xs[slot]
+        y = ys[slot]
+        chebyshev = self.chebyshev
+        close = []
+        for key_x in range(bucket_x - reach, bucket_x + reach + 1):
+            for key_y in range(bucket_y - reach, bucket_y + reach + 1):
+                members = buckets.get((key_x, key_y))
+                if members:
+                    for other in members:
+                        dx = abs(xs[other] - x)
+                        dy = abs(ys[other] - y)
+                        distance = (dx if dx > dy else dy) if chebyshev else dx + dy
+                        if distance <= radius and other != slot:
+                            close.append((other, distance))
+        return close
+
+    def pairs(self, radius=None):
+        """Return sorted (name1, name2, distance) for every pair of cars within `radius` of each other."""
+        radius = self.radius if radius is None else radius
+        reach = -(-radius // self.bucket)
+        names = self.engine.names
+        # Each bucket meets itself and the neighbours after it, so every pair of buckets is visited once
+        forward = [(dx, dy) for dx in range(0, reach + 1) for dy in range(-reach, reach + 1) if (dx, dy) > (0, 0)]
+        found = []
+        for (bucket_x, bucket_y), members in self.buckets.items():
+            ordered = sorted(members)
+            for index, slot in enumerate(ordered):
+                for other in ordered[index + 1:]:
+                    distance = self.distance(slot, other)
+                    if distance <= radius:
+                        found.append((slot, other, distance))
+            for dx, dy in forward:
+                neighbours = self.buckets.get((bucket_x + dx, bucket_y + dy))
+                if neighbours:
+                    for slot in ordered:
+                        for other in neighbours:
+                            distance = self.distance(slot, other)
+                            if distance <= radius:
+                                found.append((slot, other, distance))
+        return sorted(tuple(sorted((names[slot], names[other]))) + (distance,) for slot, other, distance in found)
+
+    def nearest(self, car_name, k=1):
+        """Return [(name, distance)] of the k cars nearest to a car, nearest first (ties by name)."""
+        slot = self.engine.slots[car_name]
+        names = self.engine.names
+        bucket_x, bucket_y = self.where[slot]
+        min_x, min_y, max_x, max_y = self.extent
+        found = []
+        ring = 0
+        while True:
+            for key in ring_keys(bucket_x, bucket_y, ring):
+                for other in self.buckets.get(key, ()):
+                    if other != slot:
+                        found.append((self.distance(slot, other), names[other]))
+            # Every bucket beyond this ring is at least ring * bucket + 1 cells away
+            if len(found) >= k:
+                found.sort()
+                if found[k - 1][0] < ring * self.bucket + 1:
+                    break
+            if (bucket_x - ring <= min_x and bucket_y - ring <= min_y
+                    and bucket_x + ring >= max_x and bucket_y + ring >= max_y):
+                break
+            ring += 1
+        found.sort()
+        return [(name, distance) for distance, name in found[:k]]
+
+
+def ring_keys(center_x, center_y, ring):
+    """Return the bucket keys on the square ring at Chebyshev distance `ring` from a bucket."""
+    if ring == 0:
+        return [(center_x, center_y)]
+    keys = [(x, y) for x in range(center_x - ring, center_x + ring + 1) for y in (center_y - ring, center_y + ring)]
+    keys.extend((x, y) for x in (center_x - ring, center_x + ring) for y in range(center_y - ring + 1, center_y + ring))
+    return keys
+
+
+class NearMisses(ProximityIndex):
+    """Proximity index that logs cars coming within the radius of each other.
+
+    A near miss is recorded once when two cars get within the radius (but
+    not onto the same cell, which is a collision) and again only after they
+    have been apart. Only the cars that changed cell on a tick are
+    re-examined.
+    """
+
+    def __init__(self, radius, metric='manhattan', bucket=None):
+        super().__init__(radius, metric, bucket)
+        # slot -> slots currently within the radius, kept symmetric
+        self.close = {}
+        self.events = []
+
+    def forget(self, slot):
+        """Drop the close pairs of a car."""
+        for other in self.close.pop(slot, ()):
+            self.close[other].discard(slot)
+
+    def place(self, engine, slots):
+        """Index cars placed on the field; cars placed next to each other are no near miss."""
+        super().place(engine, slots)
+        for slot in slots:
+            self.forget(slot)
+        for slot in slots:
+            partners = {other for other, distance in self.within(slot) if distance}
+            self.close[slot] = partners
+            for other in partners:
+                self.close.setdefault(other, set()).add(slot)
+
+    def remove(self, engine, slot):
+        """Drop a despawned car."""
+        super().remove(engine, slot)
+        self.forget(slot)
+
+    def observe(self, engine, moved, old_xs, old_ys):
+        """Record the pairs that came within the radius on the engine's current tick."""
+        super().observe(engine, moved, old_xs, old_ys)
+        names = engine.names
+        status = engine.status
+        close = self.close
+        xs = engine.xs
+        ys = engine.ys
+        found = []
+        for slot, x, y in zip(moved, old_xs, old_ys):
+            if status[slot] == DESPAWNED:
+                self.forget(slot)
+                continue
+            # A car that turned in place only meets the cars that moved, which are examined themselves
+            if xs[slot] == x and ys[slot] == y:
+                continue
+            old = close.get(slot, set())
+            new = set()
+            for other, distance in self.within(slot):
+                if distance:
+                    new.add(other)
+                    if other not in old:
+                        found.append(tuple(sorted((names[slot], names[other]))) + (distance,))
+                        close.setdefault(other, set()).add(slot)
+            for other in old - new:
+                close[other].discard(slot)
+            close[slot] = new
+        for first, second, distance in sorted(found):
+            self.events.append((engine.step_number, first, second, distance))
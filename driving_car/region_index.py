@@ -0,0 +1,232 @@
+"""
+Driving Car Simulation - Spatio-temporal Region Index
+
+Answers "which cars were in region R during steps [t0, t1]" without
+replaying the run. A RegionIndex is a fleet engine observer that
+compresses every car's positions into straight runs (t0, t1, x, y, dx, dy),
+as in segments.py: after step t (t0 <= t <= t1) the car is at
+(x + dx * (t - t0), y + dy * (t - t0)). A run stays open while the car keeps
+its velocity (or stays parked), so a car costs a comparison per tick and
+an entry per change of velocity.
+
+Closed runs are filed per tile of `tile` x `tile` cells (a moving run is
+cut where it crosses tile borders) and per time bucket of `bucket` steps.
+Time buckets form a dyadic hierarchy: a run spanning many buckets is filed
+under at most two blocks per level (1, 2, 4, ... buckets long), so a car
+parked for the whole run costs a logarithmic number of entries. A query
+visits the tiles overlapping the region and, per level, the blocks
+overlapping the window, then checks the candidate runs exactly.
+
+Positions are those after each step, so a fast car that jumps over a
+region within one step is not in it. Querying mid-run first closes the
+open runs up to the current step.
+"""
+
+from array import array
+
+from fleet import DESPAWNED
+
+
+def ceil_div(numerator, denominator):
+    """Return the ceiling of an integer division."""
+    return -(-numerator // denominator)
+
+
+def steps_in_tile(position, velocity, tile):
+    """Return how many more steps a coordinate moving at `velocity` stays in its tile."""
+    if velocity > 0:
+        return ((position // tile + 1) * tile - 1 - position) // velocity
+    if velocity < 0:
+        return (position - position // tile * tile) // -velocity
+    return None
+
+
+def axis_steps(position, velocity, low, high):
+    """Return (first, last) step offsets at which a moving coordinate lies in [low, high]."""
+    if velocity > 0:
+        return ceil_div(low - position, velocity), (high - position) // velocity
+    return ceil_div(position - high, -velocity), (position - low) // -velocity
+
+
+class RegionIndex(object):
+    """Per-tile, time-bucketed index of the compressed trajectories of a fleet."""
+
+    def __init__(self, tile=16, bucket=64):
+        if tile < 1:
+            raise ValueError(f"Tile size must be a positive number of cells. Invalid tile size: '{tile}'")
+        if bucket < 1:
+            raise ValueError(f"Time bucket must be a positive number of steps. Invalid bucket: '{bucket}'")
+        self.tile = tile
+        self.bucket = bucket
+        self.engine = None
+        # slot -> open run [t0, last_step, x, y, dx, dy, name]; dx is None
+        # while the run holds a single step
+        self.open = {}
+        self.dirty = False
+        # Closed runs
+        self.names = []
+        self.starts = array('l')
+        self.ends = array('l')
+        self.xs = array('l')
+        self.ys = array('l')
+        self.dxs = array('l')
+        self.dys = array('l')
+        # (tile_x, tile_y, level, block) -> run indices
+        self.blocks = {}
+        self.levels = 0
+
+    def place(self, engine, slots):
+        """Open a run for every car placed on the field."""
+        self.engine = engine
+        step_number = engine.step_number
+        for slot in slots:
+            self.open[slot] = [step_number, step_number, engine.xs[slot], engine.ys[slot], None, None,
+                               engine.names[slot]]
+        self.dirty = True
+
+    def remove(self, engine, slot):
+        """Close the run of a despawned car."""
+        run = self.open.pop(slot, None)
+        if run is not None:
+            # A car despawned during a tick was last on the field on the tick before
+            self.park(run, engine.step_number - 1 if engine.stepping else engine.step_number)
+            self.add_run(*run)
+
+    def observe(self, engine, moved, old_xs, old_ys):
+        """Extend or close the runs of the cars that acted on the engine's current tick."""
+        step_number = engine.step_number
+        xs = engine.xs
+        ys = engine.ys
+        open_runs = self.open
+        for slot in moved:
+            run = open_runs.get(slot)
+            if run is None:
+                continue
+            x = xs[slot]
+            y = ys[slot]
+            if run[1] < step_number - 1:
+                self.park(run, step_number - 1)
+            t0, last, x0, y0, dx, dy, name = run
+            if dx is None:
+                run[1] = step_number
+                run[4] = x - x0
+                run[5] = y - y0
+            elif x == x0 + dx * (step_number - t0) and y == y0 + dy * (step_number - t0):
+                run[1] = step_number
+            else:
+                self.add_run(t0, last, x0, y0, dx, dy, name)
+                open_runs[slot] = [step_number, step_number, x, y, None, None, name]
+        self.dirty = True
+
+    def park(self, run, end):
+        """Extend a run up to step `end`, during which the car has stood still since its last step."""
+        t0, last, x0, y0, dx, dy, name = run
+        if end <= last:
+            return
+        if dx is None or dx == dy == 0:
+            run[1] = end
+            run[4] = run[5] = 0
+            return
+        self.add_run(t0, last, x0, y0, dx, dy, name)
+        run[:] = [last + 1, end, x0 + dx * (last - t0), y0 + dy * (last - t0), 0, 0, name]
+
+    def flush(self):
+        """File the open runs up to the current step; the cars carry on from their current cells."""
+        step_number = self.engine.step_number
+        for slot, run in self.open.items():
+            self.park(run, step_number)
+            self.add_run(*run)
+            t0, last, x, y, dx, dy, name = run
+            if dx is not None:
+                x += dx * (last - t0)
+                y += dy * (last - t0)
+            self.open[slot] = [last, last, x, y, None, None, name]
+        self.dirty = False
+
+    def add_run(self, t0, t1, x, y, dx, dy, name):
+        """Store a closed run and file it under the tiles it crosses."""
+        if dx is None:
+            dx = dy = 0
+        index = len(self.names)
+        self.names.append(name)
+        self.starts.append(t0)
+        self.ends.append(t1)
+        self.xs.append(x)
+        self.ys.append(y)
+        self.dxs.append(dx)
+        self.dys.append(dy)
+        tile = self.tile
+        start = t0
+        while start <= t1:
+            # Cut the run where it leaves the tile it is in
+            stay_x = steps_in_tile(x, dx, tile)
+            stay_y = steps_in_tile(y, dy, tile)
+            stay = min(stay for stay in (stay_x, stay_y, t1 - start) if stay is not None)
+            self.file(x // tile, y // tile, start, start + stay, index)
+            start += stay + 1
+            x += dx * (stay + 1)
+            y += dy * (stay + 1)
+
+    def file(self, tile_x, tile_y, t0, t1, index):
+        """File a run under the fewest dyadic time blocks covering steps [t0, t1] of a tile."""
+        low = t0 // self.bucket
+        high = t1 // self.bucket
+        level = 0
+        while low <= high:
+            if low & 1:
+                self.blocks.setdefault((tile_x, tile_y, level, low), []).append(index)
+                low += 1
+            if not high & 1:
+                self.blocks.setdefault((tile_x, tile_y, level, high), []).append(index)
+                high -= 1
+            low >>= 1
+            high >>= 1
+            level += 1
+        self.levels = max(self.levels, level)
+
+    def query(self, region, window):
+        """Return sorted (name, first_step, last_step) for the cars in a region during a window of steps.
+
+        region is ((x0, y0), (x1, y1)) and window (t0, t1), both inclusive;
+        first_step and last_step are the first and last steps of the window
+        on which the car was in the region.
+        """
+        if self.dirty:
+            self.flush()
+        (x0, y0), (x1, y1) = region
+        t0, t1 = window
+        tile = self.tile
+        candidates = set()
+        for tile_x in range(x0 // tile, x1 // tile + 1):
+            for tile_y in range(y0 // tile, y1 // tile + 1):
+                for level in range(self.levels):
+                    for block in range((t0 // self.bucket) >> level, ((t1 // self.bucket) >> level) + 1):
+                        candidates.update(self.blocks.get((tile_x, tile_y, level, block), ()))
+        found = {}
+        for index in candidates:
+            steps = self.steps_in(index, x0, y0, x1, y1, t0, t1)
+            if steps is not None:
+                name = self.names[index]
+                first, last = found.get(name, steps)
+                found[name] = (min(first, steps[0]), max(last, steps[1]))
+        return sorted((name, first, last) for name, (first, last) in found.items())
+
+    def steps_in(self, index, x0, y0, x1, y1, t0, t1):
+        """Return the (first, last) steps within [t0, t1] a run spends in a region, or None."""
+        start = self.starts[index]
+        first = max(start, t0)
+        last = min(self.ends[index], t1)
+        for position, velocity, low, high in ((self.xs[index], self.dxs[index], x0, x1),
+                                              (self.ys[index], self.dys[index], y0, y1)):
+            if velocity == 0:
+                if not low <= position <= high:
+                    return None
+            else:
+                entry, leave = axis_steps(position, velocity, low, high)
+                first = max(first, start + entry)
+                last = min(last, start + leave)
+        return (first, last) if first <= last else None
+
+    def cars_in(self, region, window):
+        """Return the sorted names of the cars in a region during a window of steps."""
+        return [name for name, first, last in self.query(region, window)]
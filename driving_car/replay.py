@@ -0,0 +1,170 @@
+"""
+Driving Car Simulation - Keyframed Replay
+
+An event log with keyframes, so a viewer can show any step of a run
+without decoding it from step 0. A ReplayWriter is an EventLogWriter that,
+every K steps at the end of the step, starts a new frame with a KEYFRAME
+record holding every car on the field, in a frame of its own. A JSON sidecar ``path.json`` lists
+the (step, file offset) of each keyframe. Replay.state(step) seeks to the
+last keyframe at or before the step and applies at most K steps of deltas.
+The file stays a valid event log for EventLogReader and the exporters.
+
+K is chosen automatically unless given: after each keyframe the writer
+measures its size and the delta bytes per step since the previous one, and
+sets K so keyframes add about `overhead` (default a quarter) to the size of
+the deltas. A seek then reads one keyframe and at most 1 / overhead
+keyframes' worth of deltas, however long the run: the file size and seek
+latency both stay within a constant factor of the best either can be.
+Sizes are measured after compression, as written to the file.
+
+    python replay.py run.dcel 120 500
+
+prints the cars of a replay at steps 120 and 500.
+"""
+
+import json
+import math
+import sys
+from bisect import bisect_right
+
+from eventlog import EventLogWriter, EventLogReader, KEYFRAME, put_varint, put_name, put_signed
+from fleet import DESPAWNED
+from simulation import COMPASS
+
+FORMAT_VERSION = 1
+
+
+def keyframe_interval(keyframe_bytes, delta_bytes_per_step, overhead, max_interval):
+    """Return the steps between keyframes for which keyframes add `overhead` to the size of the deltas."""
+    if delta_bytes_per_step <= 0:
+        return max_interval
+    return max(1, min(max_interval, math.ceil(keyframe_bytes / (overhead * delta_bytes_per_step))))
+
+
+class ReplayWriter(EventLogWriter):
+    """Observer that writes an event log with a keyframe every `interval` steps.
+
+    interval='auto' picks the interval from the measured keyframe and delta
+    sizes after every keyframe, up to `max_interval` steps.
+    """
+
+    def __init__(self, path, interval='auto', overhead=0.25, max_interval=4096, **options):
+        if interval != 'auto' and (not isinstance(interval, int) or interval < 1):
+            raise ValueError(f"A keyframe interval is 'auto' or a positive number of steps. Invalid interval: "
+                             f"'{interval}'")
+        if overhead <= 0:
+            raise ValueError(f"The keyframe overhead must be positive. Invalid overhead: '{overhead}'")
+        super().__init__(path, **options)
+        self.interval = interval
+        self.overhead = overhead
+        self.max_interval = max_interval
+        # (step, file offset) of the frames a seek can start from
+        self.seek_points = []
+        self.next_keyframe = None
+        # File offset where the last keyframe's frame ended
+        self.keyframe_end = 0
+        self.keyframe_step = 0
+        self.intervals = []
+
+    def start(self, engine):
+        """Open the log; its first frame is a seek point with the cars placed on it."""
+        super().start(engine)
+        self.seek_points.append((engine.step_number, self.bytes_written))
+        self.keyframe_end = self.bytes_written
+        self.keyframe_step = engine.step_number
+        # The first keyframe also measures the deltas of one step
+        self.next_keyframe = engine.step_number + (1 if self.interval == 'auto' else self.interval)
+
+    def settle(self, engine):
+        """Write a keyframe once the step is complete, if one is due."""
+        if engine.step_number >= self.next_keyframe:
+            self.write_keyframe(engine)
+
+    def write_keyframe(self, engine):
+        """Write a frame of its own with the state of every car on the field."""
+        self.write_frame()
+        delta_bytes = self.bytes_written - self.keyframe_end
+        delta_steps = engine.step_number - self.keyframe_step
+        self.seek_points.append((engine.step_number, self.bytes_written))
+        out = self.buffer
+        out.append(KEYFRAME)
+        put_varint(out, engine.step_number)
+        slots = [slot for slot in range(engine.size) if engine.status[slot] != DESPAWNED]
+        put_varint(out, len(slots))
+        for slot in slots:
+            put_varint(out, slot)
+            put_name(out, engine.names[slot])
+            put_signed(out, engine.xs[slot])
+            put_signed(out, engine.ys[slot])
+            out.append(engine.headings[slot])
+        self.write_frame()
+        keyframe_bytes = self.bytes_written - self.seek_points[-1][1]
+        self.keyframe_end = self.bytes_written
+        self.keyframe_step = self.step = engine.step_number
+        # The next tick cannot refer back to the slots of the previous one
+        self.last_moved = None
+        if self.interval == 'auto':
+            interval = keyframe_interval(keyframe_bytes, delta_bytes / delta_steps, self.overhead,
+                                         self.max_interval)
+        else:
+            interval = self.interval
+        self.intervals.append(interval)
+        self.next_keyframe = engine.step_number + interval
+
+    def close(self):
+        """Write the last frame and the sidecar listing the keyframes."""
+        if self.file is None:
+            return
+        last_step = self.step
+        super().close()
+        sidecar = {'version': FORMAT_VERSION, 'last_step': last_step, 'seek_points': self.seek_points}
+        with open(self.path + '.json', 'w') as sidecar_file:
+            json.dump(sidecar, sidecar_file)
+
+
+class Replay(object):
+    """Random access to the fleet states of a log written by ReplayWriter."""
+
+    def __init__(self, path):
+        with open(path + '.json') as sidecar_file:
+            sidecar = json.load(sidecar_file)
+        if sidecar['version'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported replay format version: {sidecar['version']}")
+        self.path = path
+        self.reader = EventLogReader(path)
+        self.last_step = sidecar['last_step']
+        self.seek_points = [tuple(seek_point) for seek_point in sidecar['seek_points']]
+        self.first_step = self.seek_points[0][0]
+        self.seek_steps = [step_number for step_number, _ in self.seek_points]
+
+    def state(self, step_number):
+        """Return {name: ((x, y), heading)} of the cars on the field after a step.
+
+        Steps after the last one return the final state.
+        """
+        if step_number < self.first_step:
+            raise ValueError(f"The replay starts at step {self.first_step}. Invalid step: '{step_number}'")
+        step, offset = self.seek_points[bisect_right(self.seek_steps, step_number) - 1]
+        cars = {}
+        with open(self.path, 'rb') as log_file:
+            decompress, _ = self.reader.read_header(log_file)
+            log_file.seek(offset)
+            for _ in self.reader.events(self.reader.frames(log_file, decompress), step, cars, until=step_number):
+                pass
+        return {name: ((x, y), COMPASS[heading]) for name, x, y, heading in cars.values()}
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: python replay.py <replay log> <step> [<step> ...]")
+        return 1
+    replay = Replay(sys.argv[1])
+    for step_number in map(int, sys.argv[2:]):
+        print(f"\nStep {step_number}:")
+        for name, ((x, y), heading) in sorted(replay.state(step_number).items()):
+            print(f"- {name}, ({x},{y}) {heading}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
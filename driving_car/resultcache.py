@@ -0,0 +1,200 @@
+"""
+Driving Car Simulation - Result Cache
+
+An on-disk cache of simulation results keyed by a hash of the scenario, so
+a batch job that submits the same scenario again gets the stored result
+instead of running it.
+
+scenario_key hashes a canonical form of everything a result depends on:
+the engine, its collision and boundary policies, ENGINE_VERSION, and for
+every car in order its name, start cell and heading, field bounds, speed,
+footprint offsets, timing (start, period and sorted pauses, with their
+defaults filled in) and program, the joined command string the engines
+run, written as JSON so that no name or program can pass for other fields.
+Two fleets whose commands are split differently, or that leave a default
+out, get the same key.
+
+A ResultCache is a directory with one JSON file per key, holding the result
+and the final state of every car. Files are written to a temporary file in
+the same directory and renamed over the key, so workers sharing the
+directory only ever read complete results. A hit touches the file's
+modification time, and when the directory grows over `max_bytes` the least
+recently used files are deleted until it fits again.
+
+    python resultcache.py 2000 200 100
+
+times a run against a cache hit of the same scenario.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmark import random_scenario
+from simulation import ENGINE_VERSION, new_result, get_program, copy_fleet, simulate
+
+FORMAT_VERSION = 1
+EVENT_LISTS = ('collision_events', 'boundary_events')
+
+
+def scenario_key(cars_with_commands, engine='step', collision_policy='stop', boundary_policy='skip'):
+    """Return the hex SHA-256 of the canonical form of a scenario and the engine that runs it."""
+    # A JSON list of per-car lists: names and programs may hold any character, and JSON quotes them
+    cars = []
+    for car_data in cars_with_commands:
+        car = car_data['car']
+        bounds = list(car.field_bounds) if car.field_bounds else None
+        pauses = sorted(tuple(pause) for pause in car_data.get('pauses', ()))
+        cars.append([car.name, list(car.position), car.direction, bounds, car.speed, car.footprint,
+                     car_data.get('start', 0), car_data.get('period', 1), pauses, get_program(car_data)])
+    canonical = json.dumps([engine, ENGINE_VERSION, collision_policy, boundary_policy, cars], separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def encode_entry(key, cars_with_commands, result):
+    """Return the JSON document stored for a finished run."""
+    stored = dict(result)
+    stored['collided_cars'] = sorted(result['collided_cars'])
+    final_states = [[car_data['car'].get_car_name(), list(car_data['car'].get_car_position()),
+                     car_data['car'].get_facing()] for car_data in cars_with_commands]
+    return {'version': FORMAT_VERSION, 'key': key, 'result': stored, 'final_states': final_states}
+
+
+def decode_result(stored):
+    """Turn a stored result back into the dictionary the engines return."""
+    result = new_result()
+    result.update(stored)
+    result['collided_cars'] = set(stored['collided_cars'])
+    for name in EVENT_LISTS:
+        # The last item of an event is its (x, y) cell
+        result[name] = [tuple(event[:-1]) + (tuple(event[-1]),) for event in stored[name]]
+    return result
+
+
+class ResultCache(object):
+    """Directory of results keyed by scenario_key, bounded to about `max_bytes` by LRU eviction."""
+
+    def __init__(self, directory, max_bytes=256 * 2 ** 20):
+        if max_bytes <= 0:
+            raise ValueError(f"The cache size must be positive. Invalid size: '{max_bytes}'")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        # Bytes in the directory as last counted, plus what this process wrote since
+        self.size = sum(size for _, _, size in self.entries())
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def entries(self):
+        """Return (mtime, path, size) of every cached result; files other workers delete are skipped."""
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return entries
+
+    def get(self, key):
+        """Return the stored entry of a key, or None on a miss."""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as cache_file:
+                entry = json.loads(cache_file.read())
+            os.utime(path)
+        except FileNotFoundError:
+            entry = None
+        except ValueError:
+            # Not written by this cache, or by an older version of it
+            entry = None
+        if entry is None or entry.get('version') != FORMAT_VERSION or entry.get('key') != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        """Store an entry atomically, then evict the least recently used entries if the cache is full."""
+        data = json.dumps(entry, separators=(',', ':')).encode('utf-8')
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as cache_file:
+                cache_file.write(data)
+                cache_file.flush()
+                os.fsync(cache_file.fileno())
+            os.replace(temporary, self.path(key))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits in `max_bytes`."""
+        entries = sorted(self.entries())
+        self.size = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if self.size <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                self.evicted += 1
+            except FileNotFoundError:
+                # Another worker evicted it first
+                pass
+            self.size -= size
+
+    def simulate(self, cars_with_commands, engine='step', collision_policy='stop', boundary_policy='skip'):
+        """Return the result of a scenario from the cache, or run it and store the result.
+
+        Like the engines, a hit writes the final states back to the cars.
+        """
+        key = scenario_key(cars_with_commands, engine, collision_policy, boundary_policy)
+        entry = self.get(key)
+        if entry is not None and len(entry['final_states']) == len(cars_with_commands):
+            for car_data, (_, position, facing) in zip(cars_with_commands, entry['final_states']):
+                car_data['car'].position = tuple(position)
+                car_data['car'].direction = facing
+            return decode_result(entry['result'])
+        result = simulate(cars_with_commands, engine, False, collision_policy, boundary_policy)
+        self.put(key, encode_entry(key, cars_with_commands, result))
+        return result
+
+
+def main():
+    num_cars = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    num_steps = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    size = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    fleet = random_scenario(num_cars, num_steps, size)
+    print(f"Result cache: {num_cars} cars, {num_steps} steps, field {size}x{size}")
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResultCache(directory)
+        start = time.perf_counter()
+        scenario_key(fleet)
+        key_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        result = cache.simulate(copy_fleet(fleet))
+        miss_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        cached = cache.simulate(copy_fleet(fleet))
+        hit_seconds = time.perf_counter() - start
+        print(f"  key: {key_seconds * 1000:.1f} ms, miss (run and store): {miss_seconds * 1000:.1f} ms, "
+              f"hit: {hit_seconds * 1000:.1f} ms, {cache.size} bytes stored")
+        print(f"  same result: {cached == result}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+Driving Car Simulation - Trajectory Retention
+
+How much trajectory history a run keeps, chosen per consumer:
+
+- 'none' keeps nothing, as every engine does without an observer.
+- 'ring' keeps the last `ticks` ticks (dispatch).
+- 'sampled' keeps one tick out of every `every` steps, the first tick of
+  each period (analytics).
+- 'full' keeps every tick (incident review), in memory or, with a `path`,
+  spilled to disk through trajectory.TrajectoryRecorder.
+
+A Retention is a fleet engine observer (or the `retention` argument of
+simulate with the step engine). In memory, every policy uses the row
+layout of the trajectory chunks: a steps array plus xs, ys, headings and
+status arrays of rows x slots, allocated up front with `ticks` rows. A
+tick is copied in with slice assignments from the engine's arrays, so
+retaining costs no per-car objects. The ring never reallocates; sampled
+and full double their rows when they fill up, and the rows are laid out
+again when the engine's slot capacity grows. Which car held which slot is
+not tracked under 'none', and the ring forgets the cars that left before
+its oldest row, so neither grows with the number of cars spawned.
+"""
+
+from array import array
+
+from fleet import DESPAWNED
+from trajectory import CHUNK_ARRAYS, SlotTenancies, TrajectoryFile, TrajectoryRecorder, copy_row, row_state, \
+    car_trajectory
+
+RETENTION_POLICIES = ('none', 'ring', 'sampled', 'full')
+
+
+class Retention(object):
+    """Trajectory history of a fleet run under a retention policy."""
+
+    def __init__(self, policy='none', ticks=64, every=100, path=None, chunk_ticks=1024):
+        if policy not in RETENTION_POLICIES:
+            raise ValueError(f"Unknown retention policy: {policy}. Choose from: {', '.join(RETENTION_POLICIES)}")
+        if ticks < 1:
+            raise ValueError(f"Retention must hold at least one tick. Invalid number of ticks: '{ticks}'")
+        if every < 1:
+            raise ValueError(f"Sampling period must be a positive number of steps. Invalid period: '{every}'")
+        if path is not None and policy != 'full':
+            raise ValueError("Only the full retention policy spills to disk")
+        self.policy = policy
+        self.ticks = ticks
+        self.every = every
+        self.spill = TrajectoryRecorder(path, chunk_ticks) if path is not None else None
+        self.tenancies = SlotTenancies()
+        # The ring prunes the tenancies of cars gone before its oldest row once they reach this many
+        self.prune_at = 64
+        self.views = None
+        self.rows = 0
+        # Rows written so far; the ring writes row `written % rows`
+        self.written = 0
+        self.last_period = None
+
+    def allocate(self, rows, width):
+        """Lay out `rows` rows of `width` slots, keeping the rows written so far."""
+        views = {'width': width}
+        for name, typecode, per_slot in CHUNK_ARRAYS:
+            fill = DESPAWNED if name == 'status' else 0
+            views[name] = array(typecode, [fill]) * (rows * (width if per_slot else 1))
+        old = self.views
+        if old is not None:
+            old_width = old['width']
+            views['steps'][:self.rows] = old['steps']
+            for name, _, per_slot in CHUNK_ARRAYS:
+                if per_slot:
+                    for row in range(self.rows):
+                        views[name][row * width:row * width + old_width] = \
+                            old[name][row * old_width:(row + 1) * old_width]
+        self.views = views
+        self.rows = rows
+
+    def nbytes(self):
+        """Return the bytes held by the in-memory rows."""
+        if self.views is None:
+            return 0
+        return sum(self.views[name].itemsize * len(self.views[name]) for name, _, _ in CHUNK_ARRAYS)
+
+    def due(self, step_number):
+        """Return True if the policy keeps the tick of a step."""
+        if self.policy == 'sampled':
+            return step_number // self.every != self.last_period
+        return self.policy != 'none'
+
+    def record(self, engine):
+        """Copy the engine's current tick into the next row."""
+        width = len(engine.xs)
+        if self.views is None:
+            self.allocate(self.ticks, width)
+        elif width != self.views['width']:
+            self.allocate(self.rows, width)
+        if self.policy == 'ring':
+            row = self.written % self.rows
+        else:
+            if self.written == self.rows:
+                self.allocate(2 * self.rows, width)
+            row = self.written
+        copy_row(self.views, row, engine)
+        self.written += 1
+        self.last_period = engine.step_number // self.every
+        if self.policy == 'ring' and len(self.tenancies.cars) >= self.prune_at:
+            self.tenancies.prune(self.views['steps'][self.written % self.rows] if self.written > self.rows
+                                 else self.views['steps'][0])
+            # Pruning again only once the list has doubled keeps its cost constant per car placed
+            self.prune_at = max(64, 2 * len(self.tenancies.cars))
+
+    def place(self, engine, slots):
+        """Start the tenancies of cars placed on the field and keep their start cells."""
+        if self.spill is not None:
+            self.spill.place(engine, slots)
+            return
+        if self.policy == 'none':
+            return
+        self.tenancies.place(engine, slots)
+        if self.written and self.views['steps'][(self.written - 1) % self.rows] == engine.step_number:
+            # Cars spawned after the tick's row was written
+            self.written -= 1
+            self.record(engine)
+        elif self.due(engine.step_number):
+            self.record(engine)
+
+    def remove(self, engine, slot):
+        """End the tenancy of a despawned car."""
+        if self.spill is not None:
+            self.spill.remove(engine, slot)
+        elif self.policy != 'none':
+            self.tenancies.remove(engine, slot)
+
+    def observe(self, engine, moved, old_xs, old_ys):
+        """Keep the engine's current tick if the policy wants it."""
+        if self.spill is not None:
+            self.spill.observe(engine, moved, old_xs, old_ys)
+        elif self.due(engine.step_number):
+            self.record(engine)
+
+    def close(self):
+        """Write out the spilled history, if any."""
+        if self.spill is not None:
+            self.spill.close()
+
+    def recording(self):
+        """Return the spilled history as a trajectory.TrajectoryFile."""
+        self.close()
+        return TrajectoryFile(self.spill.path)
+
+    def retained_rows(self):
+        """Return (views, row, step) for every retained row, oldest first."""
+        if self.views is None:
+            return []
+        if self.policy == 'ring' and self.written > self.rows:
+            order = [(self.written + offset) % self.rows for offset in range(self.rows)]
+        else:
+            order = range(self.written)
+        return [(self.views, row, self.views['steps'][row]) for row in order]
+
+    def steps(self):
+        """Return the retained steps, oldest first."""
+        if self.spill is not None:
+            return [step_number for _, _, step_number in self.recording().rows()]
+        return [step_number for _, _, step_number in self.retained_rows()]
+
+    def state_at(self, step_number):
+        """Return {name: ((x, y), heading)} of the cars on the field after a retained step."""
+        if self.spill is not None:
+            return self.recording().state_at(step_number)
+        for views, row, retained_step in self.retained_rows():
+            if retained_step == step_number:
+                return row_state(views, row, self.tenancies.covering(step_number))
+        raise ValueError(f"Step {step_number} is not retained by the {self.policy} retention policy")
+
+    def history(self, car_name):
+        """Return [(step, (x, y), heading)] of a car over the retained steps."""
+        if self.spill is not None:
+            return self.recording().trajectory(car_name)
+        return car_trajectory(self.retained_rows(), self.tenancies.of(car_name))
@@ -0,0 +1,336 @@
+"""
+Driving Car Simulation - Road Graph
+
+Graph-backed field for road networks where most cells are not drivable.
+Nodes are intersections or road points, directed edges are lanes with a
+compass heading and a length in ticks, and turn restrictions list the
+outgoing edges allowed after each incoming edge. Everything is stored in
+compressed sparse row (CSR) arrays:
+
+- offsets[node] .. offsets[node + 1] index the outgoing edges of a node in
+  targets (head node), headings (compass index) and lengths
+- turn_offsets[edge] .. turn_offsets[edge + 1] index the outgoing edges
+  allowed after `edge` in turn_targets; an empty range means no restriction
+
+GraphEngine moves cars along the edges with the usual L/R/F commands: F
+takes the outgoing edge in the car's heading (or advances one tick along
+the current edge), and L/R only succeed at a node with an allowed road in
+the new heading, so turns happen at intersections only. Occupancy and
+collision checks run on integer place ids: a node id, or one id for every
+interior tick position of a longer edge.
+
+The graph arrays use 32-bit ints, about 40 bytes per node of a street
+grid, so a 10^6-node city map fits in tens of MB.
+"""
+
+from array import array
+from bisect import bisect_left
+
+from simulation import COMPASS, VECTORS, ACTIONS, new_result, add_collision, add_boundary_violation, get_program
+
+# Car status codes (as in fleet)
+ACTIVE = 0
+FINISHED = 1
+COLLIDED = 2
+
+
+class RoadGraph(object):
+    """Directed road network in CSR arrays."""
+
+    def __init__(self, num_nodes, edges, coordinates=None, turns=None):
+        """Build the graph.
+
+        edges is an iterable of (source, target, heading) or (source, target,
+        heading, length) tuples, heading a compass letter or index.
+        coordinates optionally gives the (x, y) cell of every node. turns is
+        an optional iterable of (a, b, c) node triples allowing the move
+        a -> b -> c; an incoming edge without any listed turn is unrestricted.
+        """
+        edges = [(source, target, heading if isinstance(heading, int) else COMPASS.index(heading),
+                  rest[0] if rest else 1) for source, target, heading, *rest in edges]
+        self.num_nodes = num_nodes
+        self.num_edges = len(edges)
+
+        # Counting sort of the edges by source node
+        counts = array('i', [0]) * (num_nodes + 1)
+        for source, target, heading, length in edges:
+            if not (0 <= source < num_nodes and 0 <= target < num_nodes):
+                raise ValueError(f"Edge ({source}, {target}) refers to a node outside 0..{num_nodes - 1}")
+            if length < 1:
+                raise ValueError(f"Edge ({source}, {target}) must be at least one tick long")
+            counts[source + 1] += 1
+        for node in range(num_nodes):
+            counts[node + 1] += counts[node]
+        self.offsets = counts
+        self.targets = array('i', [0]) * len(edges)
+        self.headings = array('b', [0]) * len(edges)
+        lengths = array('i', [1]) * len(edges)
+        fill = array('i', counts[:-1])
+        for source, target, heading, length in edges:
+            edge = fill[source]
+            fill[source] += 1
+            self.targets[edge] = target
+            self.headings[edge] = heading
+            lengths[edge] = length
+
+        # Interior tick positions of long edges get place ids after the nodes
+        self.lengths = None
+        self.interior_base = None
+        if any(length > 1 for length in lengths):
+            self.lengths = lengths
+            self.interior_base = array('i', [0]) * len(edges)
+            base = num_nodes
+            for edge in range(len(edges)):
+                self.interior_base[edge] = base
+                base += lengths[edge] - 1
+
+        self.xs = self.ys = None
+        self.sorted_keys = self.sorted_nodes = None
+        if coordinates is not None:
+            self.xs = array('i', (x for x, _ in coordinates))
+            self.ys = array('i', (y for _, y in coordinates))
+
+        self.turn_offsets = self.turn_targets = None
+        if turns:
+            allowed = {}
+            for a, b, c in turns:
+                allowed.setdefault(self.edge_between(a, b), []).append(self.edge_between(b, c))
+            self.turn_offsets = array('i', [0]) * (len(edges) + 1)
+            self.turn_targets = array('i')
+            for edge in range(len(edges)):
+                self.turn_targets.extend(sorted(allowed.get(edge, ())))
+                self.turn_offsets[edge + 1] = len(self.turn_targets)
+
+    @classmethod
+    def from_cells(cls, cells):
+        """Build the graph of a set of drivable grid cells, linking 4-neighbours both ways."""
+        cells = sorted(set(cells))
+        index = {cell: node for node, cell in enumerate(cells)}
+        edges = []
+        for node, (x, y) in enumerate(cells):
+            for heading, (dx, dy) in enumerate(VECTORS):
+                neighbour = index.get((x + dx, y + dy))
+                if neighbour is not None:
+                    edges.append((node, neighbour, heading))
+        return cls(len(cells), edges, coordinates=cells)
+
+    def nbytes(self):
+        """Return the memory taken by the graph arrays."""
+        arrays = [self.offsets, self.targets, self.headings, self.lengths, self.interior_base,
+                  self.xs, self.ys, self.sorted_keys, self.sorted_nodes, self.turn_offsets, self.turn_targets]
+        return sum(len(data) * data.itemsize for data in arrays if data is not None)
+
+    def out_edges(self, node):
+        """Return the range of edge ids leaving a node."""
+        return range(self.offsets[node], self.offsets[node + 1])
+
+    def edge_between(self, source, target):
+        """Return the id of the edge from source to target."""
+        for edge in self.out_edges(source):
+            if self.targets[edge] == target:
+                return edge
+        raise ValueError(f"No edge from node {source} to node {target}")
+
+    def edge_length(self, edge):
+        """Return the length of an edge in ticks."""
+        return 1 if self.lengths is None else self.lengths[edge]
+
+    def turn_allowed(self, from_edge, to_edge):
+        """Return True if a car arriving over from_edge may leave over to_edge."""
+        if self.turn_offsets is None or from_edge < 0:
+            return True
+        start, end = self.turn_offsets[from_edge], self.turn_offsets[from_edge + 1]
+        if start == end:
+            return True
+        position = bisect_left(self.turn_targets, to_edge, start, end)
+        return position < end and self.turn_targets[position] == to_edge
+
+    def next_edge(self, node, heading, from_edge=-1):
+        """Return the allowed edge leaving a node in a heading, or -1."""
+        for edge in range(self.offsets[node], self.offsets[node + 1]):
+            if self.headings[edge] == heading and self.turn_allowed(from_edge, edge):
+                return edge
+        return -1
+
+    def node_at(self, x, y):
+        """Return the node at a cell, or -1. Needs node coordinates."""
+        if self.xs is None:
+            raise ValueError("The road graph has no node coordinates")
+        if self.sorted_keys is None:
+            span = max(self.ys) + 1 if self.num_nodes else 1
+            self.span = span
+            self.sorted_nodes = array('i', sorted(range(self.num_nodes), key=lambda node: (self.xs[node], self.ys[node])))
+            self.sorted_keys = array('q', (self.xs[node] * span + self.ys[node] for node in self.sorted_nodes))
+        if not 0 <= y < self.span:
+            return -1
+        key = x * self.span + y
+        position = bisect_left(self.sorted_keys, key)
+        if position < len(self.sorted_keys) and self.sorted_keys[position] == key:
+            return self.sorted_nodes[position]
+        return -1
+
+    def place(self, node, edge, progress):
+        """Return the place id of a car at a node (edge -1) or `progress` ticks along an edge."""
+        if edge < 0:
+            return node
+        return self.interior_base[edge] + progress - 1
+
+    def location(self, node, edge, progress):
+        """Return the (x, y) cell of a place; interior points are interpolated along the edge heading.
+
+        Without node coordinates the place is described as (node, progress).
+        """
+        if self.xs is None:
+            return (node, 0) if edge < 0 else (node, progress)
+        x, y = self.xs[node], self.ys[node]
+        if edge < 0:
+            return (x, y)
+        dx, dy = VECTORS[self.headings[edge]]
+        return (x + dx * progress, y + dy * progress)
+
+
+class GraphEngine(object):
+    """Step engine for cars driving on a RoadGraph.
+
+    A car sits on a node (edge -1) or `progress` ticks along an edge that
+    leaves `node`. Car positions are mapped to nodes through the node
+    coordinates and written back as cells at the end of the run.
+    """
+
+    def __init__(self, graph, cars_with_commands, verbose=False):
+        self.graph = graph
+        self.verbose = verbose
+        self.cars = [car_data['car'] for car_data in cars_with_commands]
+        self.names = [car.get_car_name() for car in self.cars]
+        self.programs = [get_program(car_data) for car_data in cars_with_commands]
+        self.nodes = array('l', (self.start_node(car) for car in self.cars))
+        self.edges = array('l', [-1]) * len(self.cars)
+        self.progress = array('l', [0]) * len(self.cars)
+        self.last_edges = array('l', [-1]) * len(self.cars)
+        self.headings = array('b', (COMPASS.index(car.get_facing()) for car in self.cars))
+        self.cursors = array('l', [0]) * len(self.cars)
+        self.status = array('b', (ACTIVE if program else FINISHED for program in self.programs))
+        self.active = [slot for slot in range(len(self.cars)) if self.status[slot] == ACTIVE]
+        self.places = array('l', self.nodes)
+        self.occupancy = {}
+        for slot, place in enumerate(self.places):
+            self.occupancy.setdefault(place, []).append(slot)
+        self.step_number = 0
+        self.result = new_result()
+
+    def start_node(self, car):
+        """Return the node a car starts on."""
+        node = self.graph.node_at(*car.get_car_position())
+        if node < 0:
+            raise ValueError(f"Car {car.get_car_name()} does not start on a road: {car.get_car_position()}")
+        return node
+
+    def location(self, slot):
+        """Return the (x, y) cell of a car."""
+        return self.graph.location(self.nodes[slot], self.edges[slot], self.progress[slot])
+
+    def move_to(self, slot, place):
+        """Move a car to a new place id and keep the occupancy index in sync."""
+        occupants = self.occupancy[self.places[slot]]
+        if len(occupants) == 1:
+            del self.occupancy[self.places[slot]]
+        else:
+            occupants.remove(slot)
+        self.occupancy.setdefault(place, []).append(slot)
+        self.places[slot] = place
+
+    def reject(self, slot, command, message):
+        """Record a command that could not be executed; the car keeps its place."""
+        add_boundary_violation(self.result, self.names[slot], self.location(slot), self.step_number)
+        if self.verbose:
+            print(f"  Step {self.step_number}: {self.names[slot]} - {command} - BOUNDARY VIOLATION!")
+            print(f"    Error: {message}")
+
+    def execute(self, slot):
+        """Execute the next command of a car."""
+        graph = self.graph
+        cursor = self.cursors[slot]
+        command = self.programs[slot][cursor]
+        self.cursors[slot] = cursor + 1
+        edge = self.edges[slot]
+        if command == 'F':
+            if edge < 0:
+                edge = graph.next_edge(self.nodes[slot], self.headings[slot], self.last_edges[slot])
+                if edge < 0:
+                    self.reject(slot, command, f"Car {self.names[slot]} has no road ahead at {self.location(slot)}")
+                    return
+                progress = 1
+            else:
+                progress = self.progress[slot] + 1
+            if progress == graph.edge_length(edge):
+                # Arrived at the head node
+                self.nodes[slot] = graph.targets[edge]
+                self.edges[slot] = -1
+                self.progress[slot] = 0
+                self.last_edges[slot] = edge
+                self.move_to(slot, self.nodes[slot])
+            else:
+                self.edges[slot] = edge
+                self.progress[slot] = progress
+                self.move_to(slot, graph.place(self.nodes[slot], edge, progress))
+        elif command == 'R' or command == 'L':
+            heading = (self.headings[slot] + 1) % 4 if command == 'R' else (self.headings[slot] - 1) % 4
+            if edge >= 0 or graph.next_edge(self.nodes[slot], heading, self.last_edges[slot]) < 0:
+                self.reject(slot, command, f"Car {self.names[slot]} cannot turn at {self.location(slot)}")
+                return
+            self.headings[slot] = heading
+        else:
+            self.reject(slot, command, f"Invalid command: {command}. Use 'F' for forward, 'L' for left, 'R' for right.")
+            return
+        if self.verbose:
+            print(f"  Step {self.step_number}: {self.names[slot]} - {command} - {ACTIONS[command]}. "
+                  f"Position: {self.location(slot)}, Facing: {COMPASS[self.headings[slot]]}")
+
+    def check_collisions(self, moved):
+        """Check the places of the cars that acted against the occupancy index."""
+        pairs = set()
+        for slot in moved:
+            for other in self.occupancy[self.places[slot]]:
+                if other != slot:
+                    pairs.add((min(slot, other), max(slot, other)))
+        if not pairs:
+            return
+        new_collided_cars = set()
+        for i, j in sorted(pairs):
+            add_collision(self.result, self.names[i], self.names[j], self.location(i), self.step_number, self.verbose)
+            new_collided_cars.update((i, j))
+        for slot in new_collided_cars:
+            self.status[slot] = COLLIDED
+            self.result['collided_cars'].add(self.names[slot])
+
+    def step(self):
+        """Execute one command for every active car, then check for collisions."""
+        self.step_number += 1
+        moved = self.active
+        for slot in moved:
+            self.execute(slot)
+        self.check_collisions(moved)
+        active = []
+        for slot in moved:
+            if self.status[slot] != ACTIVE:
+                continue
+            if self.cursors[slot] >= len(self.programs[slot]):
+                self.status[slot] = FINISHED
+                continue
+            active.append(slot)
+        self.active = active
+
+    def run(self):
+        """Step until every car has stopped, then write the cells back to the cars."""
+        while self.active:
+            self.step()
+        for slot, car in enumerate(self.cars):
+            car.position = self.location(slot)
+            car.direction = COMPASS[self.headings[slot]]
+        self.result['steps'] = self.step_number
+        return self.result
+
+
+def run_graph_engine(graph, cars_with_commands, verbose=False):
+    """Run a list of cars on a road graph and return the result."""
+    return GraphEngine(graph, cars_with_commands, verbose).run()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Driving Car Simulation - Run Store
+
+Keeps the results of many runs in a local SQLite database, to answer
+questions such as "all runs where a car of class X collided within 50
+steps of the start" without running them again:
+
+- runs: one row per run with its name, engine, policies, number of steps
+  and cars, and free-form scenario metadata as JSON.
+- cars: start and final state of every car of a run, with its class and
+  whether it collided or left the field.
+- collisions: one row per car in a collision (a collision of A and B is
+  stored for A with B as the other car, and for B with A), so that finding
+  the collisions of a car is one index lookup.
+- violations: one row per boundary violation.
+
+Events are indexed on (run_id, step), (car, run_id, step) and (x, y), and
+cars on (car_class). A run is written in one transaction, each table with
+one executemany call fed by a generator, so no rows are built as a list.
+Inside ``with store.bulk():`` the event indexes are dropped while runs are
+added and built once at the end.
+
+Usage: python runstore.py [events] [runs]
+benchmarks ingesting and querying synthetic events (10^7 by default).
+"""
+
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from simulation import get_program
+
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    name TEXT,
+    engine TEXT,
+    collision_policy TEXT,
+    boundary_policy TEXT,
+    steps INTEGER,
+    cars INTEGER,
+    metadata TEXT
+);
+CREATE TABLE IF NOT EXISTS cars (
+    run_id INTEGER NOT NULL,
+    car TEXT NOT NULL,
+    car_class TEXT,
+    commands TEXT,
+    start_x INTEGER,
+    start_y INTEGER,
+    start_heading TEXT,
+    final_x INTEGER,
+    final_y INTEGER,
+    final_heading TEXT,
+    collided INTEGER,
+    violated INTEGER,
+    PRIMARY KEY (run_id, car)
+);
+CREATE TABLE IF NOT EXISTS collisions (
+    run_id INTEGER NOT NULL,
+    step INTEGER NOT NULL,
+    car TEXT NOT NULL,
+    other_car TEXT NOT NULL,
+    x INTEGER,
+    y INTEGER
+);
+CREATE TABLE IF NOT EXISTS violations (
+    run_id INTEGER NOT NULL,
+    step INTEGER NOT NULL,
+    car TEXT NOT NULL,
+    x INTEGER,
+    y INTEGER
+);
+CREATE INDEX IF NOT EXISTS cars_class ON cars (car_class);
+"""
+# Event indexes as (name, table, columns); a car's events are found by (car, run_id, step) in joins with cars
+EVENT_INDEXES = (
+    ('collisions_run_step', 'collisions', 'run_id, step'),
+    ('collisions_car', 'collisions', 'car, run_id, step'),
+    ('collisions_cell', 'collisions', 'x, y'),
+    ('violations_run_step', 'violations', 'run_id, step'),
+    ('violations_car', 'violations', 'car, run_id, step'),
+    ('violations_cell', 'violations', 'x, y'),
+)
+EVENT_TABLES = ('collisions', 'violations')
+
+
+class RunStore(object):
+    """SQLite database of run metadata, final car states, collisions and violations."""
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            self.connection.close()
+            raise ValueError(f"Unsupported run store schema version: {version}")
+        # Ingest speed over durability on power loss; a crash still leaves a consistent database
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+            self.create_indexes()
+            self.connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def close(self):
+        """Close the database."""
+        self.connection.close()
+
+    def create_indexes(self):
+        """Create the event indexes that do not exist yet."""
+        for index_name, table, columns in EVENT_INDEXES:
+            self.connection.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({columns})')
+
+    @contextmanager
+    def bulk(self):
+        """Context in which many runs are added with the event indexes dropped.
+
+        The indexes are built again on exit, which is several times faster
+        than updating them on every insert.
+        """
+        with self.connection:
+            for index_name, _, _ in EVENT_INDEXES:
+                self.connection.execute(f'DROP INDEX IF EXISTS {index_name}')
+        try:
+            yield self
+        finally:
+            with self.connection:
+                self.create_indexes()
+
+    def add_run(self, cars_with_commands, result, name=None, engine='step', collision_policy='stop',
+                boundary_policy='skip', class_of=None, metadata=None):
+        """Store a finished run and return its run id.
+
+        Final states are read from the cars of `cars_with_commands`, as
+        simulation.get_outcome does; class_of maps a car name to its class.
+        """
+        class_of = class_of or (lambda car_name: None)
+        collided = result['collided_cars']
+        violated = set(result['boundary_violated_cars'])
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO runs (name, engine, collision_policy, boundary_policy, steps, cars, metadata) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (name, engine, collision_policy, boundary_policy, result['steps'], len(cars_with_commands),
+                 json.dumps(metadata) if metadata is not None else None))
+            run_id = cursor.lastrowid
+            self.connection.executemany(
+                'INSERT INTO cars VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                ((run_id, car_data['name'], class_of(car_data['name']), get_program(car_data),
+                  car_data['position'][0], car_data['position'][1], car_data['facing'],
+                  *car_data['car'].get_car_position(), car_data['car'].get_facing(),
+                  car_data['name'] in collided, car_data['name'] in violated)
+                 for car_data in cars_with_commands))
+            self.add_events(run_id, result['collision_events'], result['boundary_events'])
+        return run_id
+
+    def add_events(self, run_id, collision_events, boundary_events):
+        """Insert the (step, name1, name2, (x, y)) collisions and (step, name, (x, y)) violations of a run."""
+        self.connection.executemany(
+            'INSERT INTO collisions VALUES (?, ?, ?, ?, ?, ?)',
+            (row for step_number, car1_name, car2_name, (x, y) in collision_events
+             for row in ((run_id, step_number, car1_name, car2_name, x, y),
+                         (run_id, step_number, car2_name, car1_name, x, y))))
+        self.connection.executemany(
+            'INSERT INTO violations VALUES (?, ?, ?, ?, ?)',
+            ((run_id, step_number, car_name, x, y) for step_number, car_name, (x, y) in boundary_events))
+
+    def where(self, table, run_id=None, car=None, car_class=None, max_step=None, cell=None):
+        """Return (WHERE clause, parameters) selecting the events of `table` that match every filter."""
+        conditions = []
+        parameters = []
+        if run_id is not None:
+            conditions.append(f'{table}.run_id = ?')
+            parameters.append(run_id)
+        if car is not None:
+            conditions.append(f'{table}.car = ?')
+            parameters.append(car)
+        if car_class is not None:
+            conditions.append(f'cars.run_id = {table}.run_id AND cars.car = {table}.car AND cars.car_class = ?')
+            parameters.append(car_class)
+        if max_step is not None:
+            conditions.append(f'{table}.step <= ?')
+            parameters.append(max_step)
+        if cell is not None:
+            conditions.append(f'{table}.x = ? AND {table}.y = ?')
+            parameters.extend(cell)
+        return (' WHERE ' + ' AND '.join(conditions)) if conditions else '', parameters
+
+    def select_events(self, table, columns, order, filters):
+        """Run a query over an event table ordered by `order` columns, joined with the cars when filtering
+        on their class."""
+        if table not in EVENT_TABLES:
+            raise ValueError(f"Unknown event table: {table}. Choose from: {', '.join(EVENT_TABLES)}")
+        tables = f'{table}, cars' if filters.get('car_class') is not None else table
+        where, parameters = self.where(table, **filters)
+        order_by = ', '.join(f'{table}.{column}' for column in order)
+        return self.connection.execute(f'SELECT {columns} FROM {tables}{where} ORDER BY {order_by}', parameters)
+
+    def collisions(self, **filters):
+        """Return (run_id, step, car, other_car, (x, y)) for the collisions of the cars matching the filters.
+
+        Filters are run_id, car, car_class, max_step and cell; a collision
+        is returned once for each of its cars that matches.
+        """
+        return [(run_id, step_number, car, other_car, (x, y)) for run_id, step_number, car, other_car, x, y
+                in self.select_events('collisions', 'collisions.*', ('run_id', 'step'), filters).fetchall()]
+
+    def violations(self, **filters):
+        """Return (run_id, step, car, (x, y)) for the boundary violations matching the filters."""
+        return [(run_id, step_number, car, (x, y)) for run_id, step_number, car, x, y
+                in self.select_events('violations', 'violations.*', ('run_id', 'step'), filters).fetchall()]
+
+    def runs_with(self, table='collisions', **filters):
+        """Return the sorted ids of the runs with at least one event matching the filters."""
+        return [run_id for run_id, in self.select_events(
+            table, f'DISTINCT {table}.run_id', ('run_id',), filters).fetchall()]
+
+    def run(self, run_id):
+        """Return the metadata of a run as a dictionary."""
+        row = self.connection.execute('SELECT * FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"No run with id {run_id}")
+        names = [description[0] for description in self.connection.execute('SELECT * FROM runs LIMIT 0')
+                 .description]
+        run = dict(zip(names, row))
+        run['metadata'] = json.loads(run['metadata']) if run['metadata'] is not None else None
+        return run
+
+    def final_states(self, run_id):
+        """Return {name: ((x, y), heading)} of the cars of a run when it finished."""
+        return {car: ((x, y), heading) for car, x, y, heading in self.connection.execute(
+            'SELECT car, final_x, final_y, final_heading FROM cars WHERE run_id = ?', (run_id,))}
+
+
+def synthetic_events(rng, num_events, num_cars, steps, size):
+    """Return (collision events, boundary events) of about num_events events, for benchmarking."""
+    names = [f"C{index}" for index in range(num_cars)]
+    collisions = []
+    violations = []
+    for _ in range(num_events):
+        step_number = rng.randrange(steps)
+        if rng.random() < 0.5:
+            collisions.append((step_number, rng.choice(names), rng.choice(names),
+                               (rng.randrange(size), rng.randrange(size))))
+        else:
+            violations.append((step_number, rng.choice(names), (size, rng.randrange(size))))
+    return collisions, violations
+
+
+def add_synthetic_runs(store, num_runs, num_cars, collisions, violations):
+    """Add runs of synthetic cars, one in ten a truck, that all share the same events."""
+    for run_index in range(num_runs):
+        with store.connection:
+            run_id = store.connection.execute('INSERT INTO runs (name, steps, cars) VALUES (?, ?, ?)',
+                                              (f"run{run_index}", 1000, num_cars)).lastrowid
+            store.connection.executemany(
+                'INSERT INTO cars (run_id, car, car_class) VALUES (?, ?, ?)',
+                ((run_id, f"C{index}", 'truck' if index % 10 == 0 else 'car') for index in range(num_cars)))
+            store.add_events(run_id, collisions, violations)
+
+
+def benchmark_store(num_events, num_runs, path):
+    """Ingest synthetic events into a store at `path` and time some typical queries."""
+    rng = random.Random(0)
+    num_cars = 100
+    store = RunStore(path)
+    events_per_run = num_events // num_runs
+    # One run's events, reused for every run, so generating them does not dominate
+    collisions, violations = synthetic_events(rng, events_per_run, num_cars, 1000, 100)
+    start = time.perf_counter()
+    with store.bulk():
+        add_synthetic_runs(store, num_runs, num_cars, collisions, violations)
+    ingest = time.perf_counter() - start
+    rows = num_runs * (2 * len(collisions) + len(violations))
+    print(f"  ingest {num_runs * events_per_run} events ({rows} rows) in {ingest:.1f} s "
+          f"({num_runs * events_per_run / ingest:,.0f} events/s)")
+    queries = [
+        ("runs where a truck collided within 50 steps",
+         lambda: store.runs_with('collisions', car_class='truck', max_step=50)),
+        ("collisions of one car", lambda: store.collisions(car="C7")),
+        ("collisions of one run before step 20", lambda: store.collisions(run_id=num_runs // 2, max_step=20)),
+        ("violations in one cell", lambda: store.violations(cell=(100, 42))),
+    ]
+    for description, query in queries:
+        start = time.perf_counter()
+        found = len(query())
+        print(f"  {description:<45} {(time.perf_counter() - start) * 1000:10.1f} ms  ({found} rows)")
+    store.close()
+
+
+def main():
+    num_events = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 7
+    num_runs = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    print(f"Run store benchmark: {num_events} events over {num_runs} runs")
+    with tempfile.TemporaryDirectory() as directory:
+        benchmark_store(num_events, num_runs, os.path.join(directory, 'runs.db'))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Driving Car Simulation - Discrete-Event Scheduler
+
+Heap of (next_tick, slot) entries telling the fleet engine which cars act
+on which tick. Cars that are waiting to start, between two ticks of a slow
+period or paused have no entry due, so they cost nothing until they act.
+"""
+
+import heapq
+
+
+class EventScheduler(object):
+    """Heap of (next_tick, slot) with lazy cancellation."""
+
+    def __init__(self):
+        self.heap = []
+        self.next_ticks = {}
+
+    def __len__(self):
+        return len(self.next_ticks)
+
+    def schedule(self, slot, tick):
+        """Schedule a car to act on `tick`, replacing any earlier entry."""
+        self.next_ticks[slot] = tick
+        heapq.heappush(self.heap, (tick, slot))
+
+    def cancel(self, slot):
+        """Remove a car from the schedule."""
+        self.next_ticks.pop(slot, None)
+
+    def scheduled_tick(self, slot):
+        """Return the tick a car is scheduled for, or None."""
+        return self.next_ticks.get(slot)
+
+    def peek(self):
+        """Return the next tick on which a car is due, or None."""
+        heap = self.heap
+        next_ticks = self.next_ticks
+        while heap and next_ticks.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def pop_due(self):
+        """Pop every car due on the next tick.
+
+        Returns (tick, slots) with slots in ascending order, or (None, []) when
+        nothing is scheduled.
+        """
+        tick = self.peek()
+        if tick is None:
+            return None, []
+        heap = self.heap
+        next_ticks = self.next_ticks
+        due = []
+        while heap and heap[0][0] == tick:
+            _, slot = heapq.heappop(heap)
+            if next_ticks.get(slot) == tick:
+                del next_ticks[slot]
+                due.append(slot)
+        return tick, due
+
+
+def next_tick(tick, period, pauses):
+    """Return the tick after `tick` on which a car with `period` acts, skipping pause windows.
+
+    pauses is a list of (first_tick, duration) windows during which the car
+    does not act.
+    """
+    tick += period
+    moved = True
+    while moved:
+        moved = False
+        for first_tick, duration in pauses:
+            if first_tick <= tick < first_tick + duration:
+                tick = first_tick + duration
+                moved = True
+    return tick
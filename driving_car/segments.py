@@ -0,0 +1,182 @@
+"""
+Driving Car Simulation - Straight Run Segments
+
+A car's trajectory is compiled into run segments ``(t0, t1, x0, y0, dx, dy)``:
+after step t (t0 <= t <= t1) the car is at ``(x0 + dx * (t - t0), y0 + dy * (t - t0))``.
+Turns and rejected moves give stationary segments and the last segment parks
+the car forever. Two segments move at constant velocity, so whether they meet
+is solved in closed form instead of step by step.
+"""
+
+import re
+from bisect import bisect_right
+
+from simulation import COMPASS, VECTORS
+
+FOREVER = float('inf')
+RUNS = re.compile(r'F+|[^F]+')
+
+
+def distance_to_wall(x, y, heading, field_bounds=None):
+    """Return how many cells a car can advance before leaving the field."""
+    if heading == 0:
+        return field_bounds[1] - 1 - y if field_bounds else FOREVER
+    if heading == 1:
+        return field_bounds[0] - 1 - x if field_bounds else FOREVER
+    if heading == 2:
+        return y
+    return x
+
+
+def add_segment(segments, t0, t1, x, y, dx, dy):
+    """Append a segment, merging consecutive stationary ones."""
+    if segments and dx == dy == 0:
+        last = segments[-1]
+        if last[4] == last[5] == 0 and last[1] == t0:
+            segments[-1] = (last[0], t1, x, y, 0, 0)
+            return
+    segments.append((t0, t1, x, y, dx, dy))
+
+
+def compile_segments(position, direction, program, field_bounds=None):
+    """Compile a car's free trajectory into run segments.
+
+    Returns (segments, turns, violations): turns lists (step, heading index)
+    changes starting with (0, initial heading) and violations lists
+    (first_step, last_step, rejected_cell) ranges of rejected moves.
+    """
+    x, y = position
+    heading = COMPASS.index(direction)
+    segments = []
+    turns = [(0, heading)]
+    violations = []
+    t = 0
+    for run in RUNS.finditer(program):
+        commands = run.group()
+        if commands[0] == 'F':
+            dx, dy = VECTORS[heading]
+            length = len(commands)
+            moved = min(length, distance_to_wall(x, y, heading, field_bounds))
+            if moved:
+                segments.append((t, t + moved, x, y, dx, dy))
+                x += dx * moved
+                y += dy * moved
+            if moved < length:
+                violations.append((t + moved + 1, t + length, (x + dx, y + dy)))
+                add_segment(segments, t + moved, t + length, x, y, 0, 0)
+            t += length
+            continue
+        for offset, command in enumerate(commands, t + 1):
+            if command == 'R':
+                heading = (heading + 1) % 4
+                turns.append((offset, heading))
+            elif command == 'L':
+                heading = (heading - 1) % 4
+                turns.append((offset, heading))
+            else:
+                violations.append((offset, offset, (x, y)))
+        add_segment(segments, t, t + len(commands), x, y, 0, 0)
+        t += len(commands)
+    add_segment(segments, t, FOREVER, x, y, 0, 0)
+    return segments, turns, violations
+
+
+def position_at(segments, step_number):
+    """Return the cell of a car after `step_number`."""
+    index = bisect_right(segments, (step_number, FOREVER)) - 1
+    t0, t1, x0, y0, dx, dy = segments[max(index, 0)]
+    elapsed = min(step_number, t1) - t0
+    return (x0 + dx * elapsed, y0 + dy * elapsed)
+
+
+def heading_at(turns, step_number):
+    """Return the heading index of a car after `step_number`."""
+    return turns[bisect_right(turns, (step_number, 4)) - 1][1]
+
+
+def truncate_segments(segments, step_number):
+    """Cut a trajectory after `step_number` and park the car where it stands."""
+    kept = []
+    for t0, t1, x0, y0, dx, dy in segments:
+        if t0 >= step_number:
+            break
+        kept.append((t0, min(t1, step_number), x0, y0, dx, dy))
+    x, y = position_at(kept, step_number)
+    add_segment(kept, step_number, FOREVER, x, y, 0, 0)
+    return kept
+
+
+def solve_linear(offset, rate, target, lo, hi):
+    """Return the smallest integer t in [lo, hi] with offset + rate * t == target on both axes."""
+    t = None
+    for c, k, goal in zip(offset, rate, target):
+        if k == 0:
+            if c != goal:
+                return None
+            continue
+        q, r = divmod(goal - c, k)
+        if r:
+            return None
+        if t is None:
+            t = q
+        elif t != q:
+            return None
+    if t is None:
+        t = lo
+    return t if lo <= t <= hi else None
+
+
+def first_contact(a, b, lo=1, swaps=True):
+    """Return (step, kind) of the first contact of two segments at or after step `lo`.
+
+    kind is 'cell' when both cars occupy the same cell after the step and
+    'swap' when they exchange cells during it. Returns None if they never meet.
+    """
+    a_t0, a_t1, ax, ay, adx, ady = a
+    b_t0, b_t1, bx, by, bdx, bdy = b
+    # d(t) = a(t) - b(t) = offset + rate * t
+    offset = (ax - adx * a_t0 - bx + bdx * b_t0, ay - ady * a_t0 - by + bdy * b_t0)
+    rate = (adx - bdx, ady - bdy)
+    start = max(a_t0, b_t0, lo)
+    stop = min(a_t1, b_t1)
+    meet = solve_linear(offset, rate, (0, 0), start, stop)
+    swap = None
+    if swaps and (adx, ady) == (-bdx, -bdy) != (0, 0):
+        # a(t) == b(t - 1) and b(t) == a(t - 1) reduce to d(t) == a's velocity
+        swap = solve_linear(offset, rate, (adx, ady), max(start, max(a_t0, b_t0) + 1), stop)
+    if swap is not None and (meet is None or swap < meet):
+        return (swap, 'swap')
+    if meet is not None:
+        return (meet, 'cell')
+    return None
+
+
+def first_meeting(segments_a, segments_b, lo=1, swaps=False):
+    """Return the first (step, kind, cell) at which two compiled trajectories meet."""
+    i = bisect_right(segments_a, (lo, FOREVER)) - 1
+    j = bisect_right(segments_b, (lo, FOREVER)) - 1
+    i, j = max(i, 0), max(j, 0)
+    while i < len(segments_a) and j < len(segments_b):
+        a = segments_a[i]
+        b = segments_b[j]
+        contact = first_contact(a, b, lo, swaps)
+        if contact is not None:
+            return contact + (position_at(segments_a, contact[0]),)
+        if a[1] <= b[1]:
+            i += 1
+        else:
+            j += 1
+    return None
+
+
+def bounding_box(segments):
+    """Return (min_x, min_y, max_x, max_y) covered by a compiled trajectory."""
+    xs = []
+    ys = []
+    for t0, t1, x0, y0, dx, dy in segments:
+        xs.append(x0)
+        ys.append(y0)
+        if t1 != FOREVER:
+            xs.append(x0 + dx * (t1 - t0))
+            ys.append(y0 + dy * (t1 - t0))
+    return (min(xs), min(ys), max(xs), max(ys))
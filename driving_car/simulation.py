@@ -0,0 +1,278 @@
+"""
+Driving Car Simulation - Simulation Engines
+
+Headless engines that execute the command sequences of a list of cars
+(``cars_with_commands`` entries as built by ``main.add_car_to_list``) and
+return a result dictionary instead of relying on global state.
+"""
+
+from car import Car
+
+COMPASS = ['N', 'E', 'S', 'W']
+VECTORS = [(0, 1), (1, 0), (0, -1), (-1, 0)]  # N, E, S, W movement vectors
+ACTIONS = {'L': "turned left", 'R': "turned right", 'F': "moved forward"}
+COLLISION_POLICIES = ('stop', 'ghost', 'later')
+BOUNDARY_POLICIES = ('skip', 'stop', 'clamp', 'wrap', 'despawn')
+# Bump when a change to an engine changes the results it returns (see resultcache)
+ENGINE_VERSION = 1
+
+
+def new_result():
+    """Create an empty simulation result."""
+    return {
+        'steps': 0,
+        'collision_results': [],
+        'collision_events': [],
+        'collided_cars': set(),
+        'boundary_violated_cars': [],
+        'boundary_events': [],
+    }
+
+
+def record_collision(collision_results, car1_name, car2_name, position, step_number, verbose=True, recorded=None):
+    """Record a collision between two cars unless it has already been recorded.
+
+    A pair of cars is recorded once per cell. Without `recorded`, a set of
+    the (names, cell) keys recorded so far, the earlier messages are
+    scanned. Returns True if new collision messages were appended.
+    """
+    if recorded is not None:
+        key = (frozenset((car1_name, car2_name)), tuple(position))
+        if key in recorded:
+            return False
+        recorded.add(key)
+    else:
+        cell = f"({position[0]},{position[1]})"
+        prefixes = (f"{car1_name}, collides with {car2_name} at {cell} at step ",
+                    f"{car2_name}, collides with {car1_name} at {cell} at step ")
+        if any(result.startswith(prefixes) for result in collision_results):
+            return False
+
+    collision_results.append(f"{car1_name}, collides with {car2_name} at ({position[0]},{position[1]}) at step {step_number}")
+    collision_results.append(f"{car2_name}, collides with {car1_name} at ({position[0]},{position[1]}) at step {step_number}")
+    if verbose:
+        print(f"\n*** COLLISION DETECTED at step {step_number} ***")
+        print(f"Cars {car1_name} and {car2_name} collided at position ({position[0]},{position[1]})")
+    return True
+
+
+def check_collisions(current_positions, step_number, collision_results, verbose=True, collision_events=None):
+    """Check for collisions between cars at current step."""
+    collision_found = False
+    new_collided_cars = set()
+    car_names = list(current_positions.keys())
+
+    # Check each pair of cars for collision
+    for i in range(len(car_names)):
+        for j in range(i + 1, len(car_names)):
+            car1_name = car_names[i]
+            car2_name = car_names[j]
+            car1_pos = current_positions[car1_name]
+            car2_pos = current_positions[car2_name]
+
+            # Check if cars are at the same position
+            if car1_pos == car2_pos:
+                collision_found = True
+                new_collided_cars.add(car1_name)
+                new_collided_cars.add(car2_name)
+                recorded = record_collision(collision_results, car1_name, car2_name, car1_pos, step_number, verbose)
+                if recorded and collision_events is not None:
+                    collision_events.append((step_number, car1_name, car2_name, tuple(car1_pos)))
+
+    return collision_found, new_collided_cars
+
+
+def add_collision(result, car1_name, car2_name, position, step_number, verbose=False, recorded=None):
+    """Record a collision in a result and keep the structured event log in sync."""
+    if record_collision(result['collision_results'], car1_name, car2_name, position, step_number, verbose, recorded):
+        result['collision_events'].append((step_number, car1_name, car2_name, tuple(position)))
+
+
+def add_boundary_violation(result, car_name, position, step_number):
+    """Record a boundary violation (the rejected target cell) in a result."""
+    if car_name not in result['boundary_violated_cars']:
+        result['boundary_violated_cars'].append(car_name)
+    result['boundary_events'].append((step_number, car_name, tuple(position)))
+
+
+def letter_name(index):
+    """Turn an index into a unique letters-only car name (A, B, ..., Z, BA, BB, ...)."""
+    name = ''
+    while True:
+        name = chr(ord('A') + index % 26) + name
+        index //= 26
+        if index == 0:
+            return name
+
+
+def get_program(car_data):
+    """Return the full command string of a car."""
+    return ''.join(car_data['commands'])
+
+
+def copy_fleet(cars_with_commands):
+    """Deep copy a list of car entries so several engines can run the same scenario."""
+    fleet = []
+    for car_data in cars_with_commands:
+        car = car_data['car']
+        copied_car = Car(car.get_car_name(), car.get_car_position(), car.get_facing(), car.field_bounds, car.speed,
+                         car.footprint)
+        copied = dict(car_data)
+        copied['car'] = copied_car
+        copied['commands'] = list(car_data['commands'])
+        fleet.append(copied)
+    return fleet
+
+
+def get_outcome(cars_with_commands, result):
+    """Summarise a finished run as a comparable tuple.
+
+    Two engines agree when they produce the same final positions and
+    headings, the same collision messages and the same boundary violations.
+    """
+    final_states = tuple(
+        (car_data['car'].get_car_name(), car_data['car'].get_car_position(), car_data['car'].get_facing())
+        for car_data in cars_with_commands
+    )
+    return (final_states, tuple(result['collision_results']),
+            tuple(sorted(result['boundary_violated_cars'])))
+
+
+def run_reference_engine(cars_with_commands, verbose=True):
+    """Reference engine: execute one command per car per step, checking all pairs after every step.
+
+    Every car is visited on every step until the longest command sequence is
+    exhausted. The faster engines are checked against this one.
+    """
+    result = new_result()
+    collision_results = result['collision_results']
+    collided_cars = result['collided_cars']
+
+    # Find the maximum number of commands across all cars
+    max_commands = 0
+    for car_data in cars_with_commands:
+        total_commands = sum(len(cmd_seq) for cmd_seq in car_data['commands'])
+        max_commands = max(max_commands, total_commands)
+
+    # Execute commands step by step for all cars simultaneously
+    step_number = 0
+    car_command_indices = {car_data['name']: {'seq_idx': 0, 'cmd_idx': 0} for car_data in cars_with_commands}
+
+    if verbose:
+        print("\nExecuting commands for all cars simultaneously:")
+
+    for step in range(max_commands):
+        step_number += 1
+        current_positions = {}
+
+        # Execute one command for each car if they have commands remaining
+        for car_data in cars_with_commands:
+            car = car_data['car']
+            car_name = car.get_car_name()
+            commands = car_data['commands']
+            indices = car_command_indices[car_name]
+
+            # Skip this car if it has already collided
+            if car_name in collided_cars:
+                current_positions[car_name] = car.get_car_position()
+                continue
+
+            # Skip empty command sequences, which would otherwise stall the car
+            while indices['seq_idx'] < len(commands) and not commands[indices['seq_idx']]:
+                indices['seq_idx'] += 1
+
+            # Check if this car still has commands to execute
+            if indices['seq_idx'] < len(commands):
+                current_sequence = commands[indices['seq_idx']]
+
+                if indices['cmd_idx'] < len(current_sequence):
+                    # Execute the next command
+                    single_command = current_sequence[indices['cmd_idx']]
+
+                    try:
+                        car.move(single_command)
+                        if verbose:
+                            pos = car.get_car_position()
+                            print(f"  Step {step_number}: {car_name} - {single_command} - {ACTIONS[single_command]}. Position: ({pos[0]}, {pos[1]}), Facing: {car.get_facing()}")
+
+                    except ValueError as e:
+                        dx, dy = VECTORS[COMPASS.index(car.get_facing())]
+                        pos = car.get_car_position()
+                        add_boundary_violation(result, car_name, (pos[0] + dx, pos[1] + dy), step_number)
+                        if verbose:
+                            print(f"  Step {step_number}: {car_name} - {single_command} - BOUNDARY VIOLATION!")
+                            print(f"    Error: {e}")
+                            print(f"    Car {car_name} has been stopped.")
+
+                    # Move to next command
+                    indices['cmd_idx'] += 1
+
+                    if indices['cmd_idx'] >= len(current_sequence):
+                        indices['seq_idx'] += 1
+                        indices['cmd_idx'] = 0
+
+            # Store current position for collision detection
+            current_positions[car_name] = car.get_car_position()
+
+        # Check for collisions at this step
+        collision_found, new_collided_cars = check_collisions(
+            current_positions, step_number, collision_results, verbose, result['collision_events'])
+
+        # Add newly collided cars to the set of stopped cars
+        if new_collided_cars:
+            collided_cars.update(new_collided_cars)
+            if verbose:
+                print(f"  Cars {', '.join(new_collided_cars)} have been stopped due to collision.")
+
+    result['steps'] = step_number
+    return result
+
+
+def run_step_engine(cars_with_commands, verbose=True, collision_policy='stop', boundary_policy='skip',
+                    retention=None):
+    """Step engine that only visits the active cars (see fleet.FleetEngine)."""
+    from fleet import FleetEngine
+    engine = FleetEngine(cars_with_commands, verbose, collision_policy, boundary_policy)
+    if retention is not None:
+        engine.add_observer(retention)
+    return engine.run()
+
+
+def run_two_phase(cars_with_commands, verbose=False):
+    """Run the two-phase engine (free trajectories plus a (cell, step) hash join)."""
+    from two_phase import run_two_phase_engine
+    return run_two_phase_engine(cars_with_commands, verbose)
+
+
+def run_segments(cars_with_commands, verbose=False):
+    """Run the two-phase engine with the analytic segment-pair collision phase."""
+    from two_phase import run_two_phase_engine
+    return run_two_phase_engine(cars_with_commands, verbose, collision_phase='segments')
+
+
+ENGINES = {
+    'reference': run_reference_engine,
+    'step': run_step_engine,
+    'two_phase': run_two_phase,
+    'segments': run_segments,
+}
+
+
+def simulate(cars_with_commands, engine='step', verbose=True, collision_policy='stop', boundary_policy='skip',
+             retention=None):
+    """Run a list of cars through the selected engine and return the result.
+
+    The default policies reproduce the reference loop: colliding cars stop,
+    and a move off the field is skipped while the car carries on. Other
+    policies, and trajectory retention (a retention.Retention that fills up
+    as the cars drive), are only implemented by the step engine.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine: {engine}. Choose from: {', '.join(sorted(ENGINES))}")
+    if engine == 'step':
+        return run_step_engine(cars_with_commands, verbose, collision_policy, boundary_policy, retention)
+    if (collision_policy, boundary_policy) != ('stop', 'skip'):
+        raise ValueError(f"The {engine} engine only supports the default collision and boundary policies")
+    if retention is not None:
+        raise ValueError(f"The {engine} engine does not retain trajectories")
+    return ENGINES[engine](cars_with_commands, verbose=verbose)
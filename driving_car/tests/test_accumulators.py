@@ -0,0 +1,89 @@
+import sys
+import os
+import csv
+import tempfile
+import unittest
+
+# Add the parent directory to Python path to import the simulation modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from car import Car
+from fleet import FleetEngine
+from accumulators import Heatmap, Coverage
+from tests.test_simulation import make_fleet
+
+SPECS = [
+    ("A", (0, 0), 'E', "FFRF"),   # (0,0) (1,0) (2,0), then a rejected move south
+    ("B", (1, 3), 'S', "FFF"),    # (1,3) (1,2) (1,1) (1,0)
+]
+
+
+def run_with(*observers):
+    """Run the two-car scenario with observers attached."""
+    engine = FleetEngine(make_fleet(SPECS))
+    for observer in observers:
+        engine.add_observer(observer)
+    engine.run()
+    return engine
+
+
+class HeatmapTest(unittest.TestCase):
+    def test_cell_level_counts(self):
+        """Test that start cells and moved-into cells are counted."""
+        heatmap = Heatmap((10, 10))
+        run_with(heatmap)
+        self.assertEqual(heatmap.hottest(1), [((1, 0), 2)])
+        self.assertEqual(sum(heatmap.counts), 7)
+        self.assertEqual(heatmap.grid()[0][:3], [1, 2, 1])
+
+    def test_tile_level_counts(self):
+        """Test that tiles aggregate the cells they contain."""
+        heatmap = Heatmap((10, 10), tile=5)
+        run_with(heatmap)
+        self.assertEqual(heatmap.grid(), [[7, 0], [0, 0]])
+
+    def test_save_csv(self):
+        """Test that the heatmap exports its non-empty tiles."""
+        heatmap = Heatmap((10, 10), tile=2)
+        run_with(heatmap)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'heatmap.csv')
+            heatmap.save_csv(path)
+            with open(path, newline='') as csv_file:
+                rows = list(csv.reader(csv_file))
+        self.assertEqual(rows, [['tile_x', 'tile_y', 'visits'], ['0', '0', '4'], ['1', '0', '1'],
+                                ['0', '1', '2']])
+
+    def test_spawned_cars_are_counted(self):
+        """Test that a spawned car's start cell is counted."""
+        heatmap = Heatmap((10, 10))
+        engine = FleetEngine([])
+        engine.add_observer(heatmap)
+        engine.spawn({'car': Car("C", (5, 5), 'N', (10, 10)), 'commands': ["F"]})
+        engine.run()
+        self.assertEqual(heatmap.grid()[5][5], 1)
+        self.assertEqual(heatmap.grid()[6][5], 1)
+
+
+class CoverageTest(unittest.TestCase):
+    def test_per_fleet_coverage(self):
+        """Test per-fleet bitsets and the union over all fleets."""
+        coverage = Coverage((10, 10), fleet_of=lambda car_name: car_name)
+        run_with(coverage)
+        self.assertEqual(coverage.covered("A"), 3)
+        self.assertEqual(coverage.covered("B"), 4)
+        self.assertEqual(coverage.covered(), 6)
+        self.assertAlmostEqual(coverage.fraction(), 0.06)
+        self.assertEqual(coverage.covered_tiles("A"), [(0, 0), (1, 0), (2, 0)])
+        self.assertEqual(coverage.export()["A"][0], 0b111)
+
+    def test_tile_coverage(self):
+        """Test coverage on coarse tiles."""
+        coverage = Coverage((10, 10), tile=2)
+        run_with(coverage)
+        self.assertEqual(coverage.covered_tiles('all'), [(0, 0), (1, 0), (0, 1)])
+        self.assertAlmostEqual(coverage.fraction('all'), 3 / 25)
+
+
+if __name__ == '__main__':
+    unittest.main()
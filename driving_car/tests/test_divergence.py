@@ -0,0 +1,111 @@
+import sys
+import os
+import unittest
+
+# Add the parent directory to Python path to import the simulation modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fleet import FleetEngine
+from divergence import bisect_runs, fingerprint, car_states, step_events, advance
+from simulation import copy_fleet
+from benchmark import random_scenario
+from tests.test_simulation import make_fleet
+from tests.test_snapshot import scenario
+
+
+def first_difference(first, second):
+    """Compare two engines on every step; return (step, names of the differing cars) or None."""
+    for engine in (first, second):
+        if engine.sources:
+            engine.spawn_due()
+    step_number = 0
+    while True:
+        for engine in (first, second):
+            advance(engine, step_number)
+        first_states, second_states = car_states(first), car_states(second)
+        events = step_events(first, step_number) ^ step_events(second, step_number)
+        if first_states != second_states or events:
+            names = {name for name in first_states.keys() | second_states.keys()
+                     if first_states.get(name) != second_states.get(name)}
+            names.update(name for event in events for name in event[1:-1])
+            return step_number, sorted(names)
+        if not first.pending() and not second.pending():
+            return None
+        step_number += 1
+
+
+def edit_commands(fleet, index, commands):
+    edited = copy_fleet(fleet)
+    edited[index]['commands'] = [commands]
+    return edited
+
+
+class DivergenceTest(unittest.TestCase):
+    def assert_finds(self, make_first, make_second):
+        expected = first_difference(make_first(), make_second())
+        for every in (1, 3, 8, 64):
+            with self.subTest(every=every):
+                report = bisect_runs(make_first(), make_second(), every)
+                if expected is None:
+                    self.assertIsNone(report)
+                else:
+                    self.assertEqual((report['step'], sorted(report['cars'])), expected)
+        return expected
+
+    def test_edited_commands(self):
+        """Test that editing one car's commands is found on the step the runs split, with the cars involved."""
+        fleet = random_scenario(30, 60, 30, seed=4)
+        commands = fleet[0]['commands'][0]
+        edited = edit_commands(fleet, 0, commands[:20] + "L" + commands[21:])
+        step_number, names = self.assert_finds(lambda: FleetEngine(copy_fleet(fleet)),
+                                               lambda: FleetEngine(copy_fleet(edited)))
+        self.assertGreater(step_number, 0)
+        self.assertIn(fleet[0]['name'], names)
+
+    def test_cascade_through_collision(self):
+        """Test that a collision that only happens in one run names both cars."""
+        fleet = make_fleet([("A", (0, 0), 'E', "FFFF"), ("B", (4, 0), 'W', "FFFF"), ("C", (0, 5), 'N', "FF")])
+        edited = edit_commands(fleet, 1, "LFFF")
+        report = bisect_runs(FleetEngine(copy_fleet(fleet)), FleetEngine(copy_fleet(edited)), every=16)
+        self.assertEqual(report['step'], 1)
+        self.assertEqual(sorted(report['cars']), ["B"])
+        self.assert_finds(lambda: FleetEngine(copy_fleet(fleet)), lambda: FleetEngine(copy_fleet(edited)))
+
+    def test_divergence_gone_before_the_next_comparison(self):
+        """Test that a car leaving the field earlier in one run is found after both runs have lost it."""
+        fleet = make_fleet([("A", (0, 0), 'W', "LLFLLFFF"), ("B", (2, 4), 'E', "LR" * 50)], field_bounds=(5, 5))
+        edited = edit_commands(fleet, 0, "LFFLLFFF")
+        step_number, names = self.assert_finds(
+            lambda: FleetEngine(copy_fleet(fleet), boundary_policy='despawn'),
+            lambda: FleetEngine(copy_fleet(edited), boundary_policy='despawn'))
+        self.assertEqual((step_number, names), (2, ["A"]))
+
+    def test_resized_field_and_scheduler(self):
+        """Test scheduled runs with sources, and a field resize that only matters late in the run."""
+        def resized():
+            engine = scenario()
+            for slot in range(engine.size):
+                if engine.bounds[slot] == (14, 14):
+                    engine.bounds[slot] = (13, 14)
+            engine.checked_from = type(engine.checked_from)('l', [0]) * len(engine.checked_from)
+            return engine
+        self.assert_finds(scenario, resized)
+
+    def test_same_runs(self):
+        """Test that identical runs agree, and that an added car diverges on the first step."""
+        fleet = random_scenario(30, 40, 12, seed=8)
+        self.assertIsNone(bisect_runs(FleetEngine(copy_fleet(fleet)), FleetEngine(copy_fleet(fleet)), every=5))
+        extra = copy_fleet(fleet) + make_fleet([("EXTRA", (40, 40), 'N', "F")], field_bounds=(50, 50))
+        report = bisect_runs(FleetEngine(copy_fleet(fleet)), FleetEngine(extra))
+        self.assertEqual(report, {'step': 0, 'cars': {"EXTRA": (None, ((40, 40), 'N', 'active'))}})
+
+    def test_fingerprint_ignores_slots(self):
+        """Test that the fingerprint depends on the cars, not on the slots they hold."""
+        fleet = make_fleet([("A", (0, 0), 'E', "FF"), ("B", (5, 5), 'N', "RF")])
+        self.assertEqual(fingerprint(FleetEngine(fleet)), fingerprint(FleetEngine(list(reversed(fleet)))))
+        with self.assertRaises(ValueError):
+            bisect_runs(FleetEngine(fleet), FleetEngine(fleet), every=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
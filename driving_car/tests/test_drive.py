@@ -349,6 +349,55 @@ class DrivingCarTest(unittest.TestCase):
         
         car.move('F')  
         self.assertEqual(car.get_car_position(), (1, -1))
+
+    def test_move_forward_with_speed(self):
+        """Test that a fast car advances several cells per forward move."""
+        car = Car("FastCar", [1, 1], 'E', (10, 10), speed=3)
+        car.move('F')
+        self.assertEqual(car.get_car_position(), (4, 1))
+        
+        # The first invalid cell of the sweep is reported and the car stays put
+        car.move('F')
+        self.assertEqual(car.get_car_position(), (7, 1))
+        with self.assertRaises(ValueError) as context:
+            car.move('F')
+        self.assertIn("(10, 1)", str(context.exception))
+        self.assertEqual(car.get_car_position(), (7, 1))
+        
+        # Invalid speeds are rejected
+        for speed in [0, -1, 1.5]:
+            with self.subTest(speed=speed):
+                with self.assertRaises(ValueError):
+                    Car("SlowCar", [0, 0], 'N', speed=speed)
+
+    def test_footprint_rotates_with_heading(self):
+        """Test that a truck's footprint follows its heading and its anchor stays the position."""
+        truck = Car("Truck", (5, 5), 'E', (10, 10), footprint='truck')
+        self.assertEqual(truck.get_footprint_cells(), [(5, 5), (4, 5)])
+        truck.move('R')
+        self.assertEqual(truck.get_footprint_cells(), [(5, 5), (5, 6)])
+        truck.move('F')
+        self.assertEqual(truck.get_car_position(), (5, 4))
+        self.assertEqual(truck.get_footprint_cells(), [(5, 4), (5, 5)])
+
+    def test_footprint_boundary(self):
+        """Test that moves and turns keep the whole footprint on the field."""
+        truck = Car("Truck", (0, 0), 'N', (10, 10), footprint=((0, 0), (0, 1)))
+        # Turning right would swing the side cell to (0, -1)
+        with self.assertRaises(ValueError) as context:
+            truck.move('R')
+        self.assertIn("(0, -1)", str(context.exception))
+        self.assertEqual(truck.get_facing(), 'N')
+
+        # Turning left swings it onto the field instead
+        truck.move('L')
+        self.assertEqual(truck.get_footprint_cells(), [(0, 0), (0, 1)])
+
+        # Footprints must contain the anchor and distinct cells
+        for footprint in [((1, 0),), ((0, 0), (0, 0))]:
+            with self.subTest(footprint=footprint):
+                with self.assertRaises(ValueError):
+                    Car("Truck", (0, 0), 'N', footprint=footprint)
             
 if __name__ == '__main__':
    unittest.main()
\ No newline at end of file
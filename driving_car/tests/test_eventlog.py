@@ -0,0 +1,121 @@
+import sys
+import os
+import io
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+# Add the parent directory to Python path to import the simulation modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fleet import FleetEngine, DESPAWNED
+from eventlog import EventLogWriter, EventLogReader, put_signed, get_signed
+from benchmark import random_scenario
+from tests.test_simulation import make_fleet, StateLog, source_engine, run_observed
+
+
+def record(path, codec='zlib', frame_bytes=1 << 18, verbose=False, seed=2):
+    """Run a fleet with a source, a sink and collisions through an event log writer."""
+    engine = source_engine(random_scenario(30, 60, 12, seed=seed), count=15, verbose=verbose)
+    result, log = run_observed(engine, EventLogWriter(path, codec, frame_bytes))
+    return engine, result, log
+
+
+def replay_states(events):
+    """Rebuild the state after every step from the events of a log."""
+    states = {}
+    cars = {}
+    for event in events:
+        kind, step_number = event[0], event[1]
+        if kind == 'place':
+            cars[event[2]] = (event[3], event[4])
+        elif kind == 'command':
+            if event[6] == DESPAWNED:
+                del cars[event[2]]
+            else:
+                cars[event[2]] = (event[4], event[5])
+        elif kind == 'remove':
+            del cars[event[2]]
+        states[step_number] = dict(cars)
+    return states
+
+
+class EventLogTest(unittest.TestCase):
+    def test_round_trip(self):
+        """Test that the log replays every tick, collision and violation of a run, with every codec."""
+        for codec in ('none', 'zlib', 'lzma'):
+            with tempfile.TemporaryDirectory() as directory, self.subTest(codec=codec):
+                path = os.path.join(directory, 'run.dcel')
+                engine, result, log = record(path, codec, frame_bytes=256)
+                events = list(EventLogReader(path))
+                self.assertEqual(replay_states(events), log.states)
+                self.assertEqual([event[1:] for event in events if event[0] == 'collision'],
+                                 result['collision_events'])
+                self.assertEqual([event[1:] for event in events if event[0] == 'violation'],
+                                 result['boundary_events'])
+                self.assertTrue(result['collision_events'])
+                commands = ''.join(event[3] for event in events if event[0] == 'command' and event[2] == "A")
+                self.assertTrue(engine.cars_with_commands[0]['commands'][0].startswith(commands))
+
+    def test_smaller_than_text_output(self):
+        """Test that the log is at least 20 times smaller than the verbose text output."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.dcel')
+            text = io.StringIO()
+            with redirect_stdout(text):
+                record(path, verbose=True)
+            self.assertGreater(len(text.getvalue()), 20 * os.path.getsize(path))
+
+    def test_removed_between_ticks(self):
+        """Test that a car despawned by hand is removed from the replay."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.dcel')
+            engine = FleetEngine(make_fleet([("A", (0, 0), 'E', "FFF"), ("B", (5, 5), 'N', "FFF")]))
+            writer = EventLogWriter(path, 'none')
+            engine.add_observer(writer)
+            engine.step()
+            engine.despawn("B")
+            engine.run()
+            writer.close()
+            events = list(EventLogReader(path))
+            self.assertIn(('remove', 1, "B"), events)
+            self.assertEqual(events[-1], ('command', 3, "A", 'F', (3, 0), 'E', 1))
+
+    def test_wide_moves_and_other_commands(self):
+        """Test moves that do not fit a one-byte delta and commands other than F, L and R, Latin-1 or not."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.dcel')
+            engine = FleetEngine(make_fleet([("A", (0, 0), 'W', "FFXF"), ("B", (5, 0), 'E', "FLF\u00e9"),
+                                             ("C", (9, 2), 'E', "FF\u2192F")], field_bounds=(100, 3)),
+                                 boundary_policy='wrap')
+            writer = EventLogWriter(path)
+            log = StateLog()
+            engine.add_observer(writer)
+            engine.add_observer(log)
+            engine.run()
+            writer.close()
+            events = list(EventLogReader(path))
+            self.assertEqual(replay_states(events), log.states)
+            self.assertIn(('command', 1, "A", 'F', (99, 0), 'W', 0), events)
+            self.assertEqual([event[3] for event in events if event[0] == 'command' and event[1] >= 3],
+                             ['X', 'F', '\u2192', 'F', '\u00e9', 'F'])
+
+    def test_zigzag_varints(self):
+        """Test signed varints across byte boundaries."""
+        for value in (0, -1, 1, 63, -64, 64, -65, 10 ** 12, -10 ** 12):
+            out = bytearray()
+            put_signed(out, value)
+            self.assertEqual(get_signed(out, 0), (value, len(out)))
+
+    def test_not_an_event_log(self):
+        """Test that other files are refused."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.dcel')
+            with open(path, 'wb') as log_file:
+                log_file.write(b'Step 1: A - F')
+            with self.assertRaises(ValueError):
+                list(EventLogReader(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import sys
+import os
+import csv
+import tempfile
+import unittest
+import zipfile
+from array import array
+
+# Add the parent directory to Python path to import the simulation modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fleet import FleetEngine
+from eventlog import EventLogWriter, EventLogReader
+from export import export_npy, export_npz, export_trajectories_csv, export_events_csv, read_npy, \
+    NPY_HEADER_BYTES, EVENT_KINDS
+from retention import Retention
+from simulation import COMPASS
+from trajectory import TrajectoryRecorder, TrajectoryFile, TYPECODES
+from benchmark import random_scenario
+from tests.test_simulation import make_fleet, source_engine, run_observed
+
+
+def record(directory):
+    """Run a fleet with a source, a sink and collisions into a recording, an event log and a retention."""
+    retention = Retention('ring', ticks=5)
+    result, log = run_observed(source_engine(random_scenario(20, 40, 12, seed=3), count=10),
+                               TrajectoryRecorder(os.path.join(directory, 'run'), chunk_ticks=7),
+                               EventLogWriter(os.path.join(directory, 'run.dcel')), retention)
+    return result, retention, log
+
+
+def load_columns(directory):
+    """Return {column: list} of the .npy files of a directory, with the car names as a list."""
+    columns = {}
+    for file_name in os.listdir(directory):
+        descr, data = read_npy(os.path.join(directory, file_name))
+        if 'U' in descr:
+            width = int(descr.split('U')[1])
+            text = data.decode('utf-32-le' if descr[0] == '<' else 'utf-32-be')
+            values = [text[start:start + width].rstrip('\0') for start in range(0, len(text), width)]
+        else:
+            values = array(TYPECODES[descr[2:]])
+            values.frombytes(data)
+            values = list(values)
+        columns[file_name[:-len('.npy')]] = values
+    return columns
+
+
+def logged_rows(log):
+    """Return the sorted (name, step, x, y, heading) rows of a state log."""
+    return sorted((name, step_number, x, y, heading)
+                  for step_number, state in log.states.items()
+                  for name, ((x, y), heading) in state.items())
+
+
+def exported_rows(columns):
+    """Return the sorted (name, step, x, y, heading) rows of exported columns."""
+    cars = columns['cars']
+    return sorted(zip(map(cars.__getitem__, columns['car_id']), columns['step'], columns['x'], columns['y'],
+                      map(COMPASS.__getitem__, columns['heading'])))
+
+
+class ExportTest(unittest.TestCase):
+    def test_npy_matches_run(self):
+        """Test that the .npy columns of a recording hold every car of every step, and its events."""
+        with tempfile.TemporaryDirectory() as directory:
+            result, _, log = record(directory)
+            output = os.path.join(directory, 'columns')
+            export_npy(output, TrajectoryFile(os.path.join(directory, 'run')), result, chunk_rows=10)
+            columns = load_columns(output)
+            self.assertEqual(exported_rows(columns), logged_rows(log))
+            self.assertEqual(columns['step'], sorted(columns['step']))
+            cars = columns['cars']
+            collisions = [(step_number, cars[car_id], cars[other_car_id], (x, y))
+                          for kind, step_number, car_id, other_car_id, x, y
+                          in zip(columns['event_kind'], columns['event_step'], columns['event_car_id'],
+                                 columns['event_other_car_id'], columns['event_x'], columns['event_y'])
+                          if EVENT_KINDS[kind] == 'collision']
+            self.assertTrue(collisions)
+            self.assertEqual(collisions, result['collision_events'])
+            self.assertEqual(columns['event_kind'].count(EVENT_KINDS.index('violation')),
+                             len(result['boundary_events']))
+
+    def test_npz_archive(self):
+        """Test that the .npz archive holds the .npy files, stored or deflated."""
+        with tempfile.TemporaryDirectory() as directory:
+            result, _, _ = record(directory)
+            recording = TrajectoryFile(os.path.join(directory, 'run'))
+            output = os.path.join(directory, 'columns')
+            files = export_npy(output, recording, result)
+            for compressed in (False, True):
+                with self.subTest(compressed=compressed):
+                    path = os.path.join(directory, 'run.npz')
+                    export_npz(path, recording, result, chunk_rows=3, compressed=compressed)
+                    with zipfile.ZipFile(path) as archive:
+                        self.assertEqual(sorted(archive.namelist()), sorted(files))
+                        for file_name in files:
+                            with open(os.path.join(output, file_name), 'rb') as npy_file:
+                                self.assertEqual(archive.read(file_name), npy_file.read())
+            # The columns are staged in a temporary directory next to the archive
+            self.assertFalse([name for name in os.listdir(directory) if name.startswith('tmp')])
+
+    def test_npy_header(self):
+        """Test that the header is padded to a fixed size and holds the final length."""
+        with tempfile.TemporaryDirectory() as directory:
+            result, retention, _ = record(directory)
+            export_npy(directory, retention)
+            with open(os.path.join(directory, 'step.npy'), 'rb') as npy_file:
+                data = npy_file.read()
+            self.assertEqual(data[NPY_HEADER_BYTES - 1:NPY_HEADER_BYTES], b'\n')
+            length = (len(data) - NPY_HEADER_BYTES) // 8
+            self.assertIn(f"'shape': ({length},)".encode(), data[:NPY_HEADER_BYTES])
+
+    def test_event_log_source(self):
+        """Test that an event log exports the cells of the steps each car acted on."""
+        with tempfile.TemporaryDirectory() as directory:
+            _, _, log = record(directory)
+            reader = EventLogReader(os.path.join(directory, 'run.dcel'))
+            output = os.path.join(directory, 'columns')
+            export_npy(output, reader)
+            rows = exported_rows(load_columns(output))
+            self.assertTrue(rows)
+            self.assertTrue(set(rows) <= set(logged_rows(log)))
+
+    def test_events_csv(self):
+        """Test that a result and an event log export the same collision and violation rows."""
+        with tempfile.TemporaryDirectory() as directory:
+            engine = FleetEngine(make_fleet([("A", (8, 0), 'E', "FF"), ("B", (0, 0), 'E', "FF"),
+                                             ("C", (2, 0), 'W', "FF")]))
+            writer = EventLogWriter(os.path.join(directory, 'run.dcel'))
+            engine.add_observer(writer)
+            result = engine.run()
+            writer.close()
+            from_result = os.path.join(directory, 'result.csv')
+            from_log = os.path.join(directory, 'log.csv')
+            export_events_csv(from_result, result, chunk_rows=1)
+            export_events_csv(from_log, EventLogReader(os.path.join(directory, 'run.dcel')))
+            with open(from_result) as result_file, open(from_log) as log_file:
+                rows = list(csv.reader(result_file))
+                self.assertEqual(rows, list(csv.reader(log_file)))
+            self.assertEqual(rows, [['kind', 'step', 'car_id', 'other_car_id', 'x', 'y'],
+                                    ['collision', '1', 'B', 'C', '1', '0'],
+                                    ['violation', '2', 'A', '', '10', '0']])
+
+    def test_trajectories_csv(self):
+        """Test that the CSV rows of a ring retention are the last ticks of the run."""
+        with tempfile.TemporaryDirectory() as directory:
+            _, retention, log = record(directory)
+            path = os.path.join(directory, 'trajectories.csv')
+            export_trajectories_csv(path, retention, chunk_rows=4)
+            with open(path) as csv_file:
+                rows = list(csv.reader(csv_file))
+            self.assertEqual(rows[0], ['car_id', 'step', 'x', 'y', 'heading'])
+            last_steps = sorted(log.states)[-5:]
+            self.assertEqual(sorted((name, int(step), int(x), int(y), heading)
+                                    for name, step, x, y, heading in rows[1:]),
+                             [row for row in logged_rows(log) if row[1] in last_steps])
+
+    def test_invalid_chunk_size(self):
+        """Test that empty chunks are refused."""
+        with tempfile.TemporaryDirectory() as directory:
+            _, retention, _ = record(directory)
+            with self.assertRaises(ValueError):
+                export_trajectories_csv(os.path.join(directory, 'run.csv'), retention, chunk_rows=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import sys
+import os
+import math
+import random
+import unittest
+
+# Add the parent directory to Python path to import the simulation modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fleet import FleetEngine
+from flow import FlowCounter, crosses
+from benchmark import random_scenario
+from tests.test_simulation import make_fleet
+
+
+def gate_counter(resolution=1):
+    """Return a counter with a gate between columns 4 and 5 and a short gate between rows 4 and 5."""
+    counter = FlowCounter(resolution)
+    counter.add_line("gate", (4.5, -0.5), (4.5, 9.5))
+    counter.add_line("stub", (-0.5, 4.5), (2.5, 4.5))
+    return counter
+
+
+class FlowCounterTest(unittest.TestCase):
+    def test_directions_and_extent(self):
+        """Test forward and backward crossings and crossings beside a short line."""
+        counter = gate_counter()
+        engine = FleetEngine(make_fleet([
+            ("A", (3, 0), 'E', "FFF"),     # crosses the gate eastwards
+            ("B", (6, 2), 'W', "FFF"),     # crosses it westwards
+            ("C", (1, 3), 'N', "FF"),      # crosses the stub northwards
+            ("D", (5, 3), 'N', "FF"),      # passes beside the stub
+        ]))
+        engine.add_observer(counter)
+        engine.run()
+        self.assertEqual(counter.totals("gate"), (1, 1))
+        self.assertEqual(counter.totals("stub"), (0, 1))
+        self.assertEqual(counter.series("gate"), [(0, 0, 0), (1, 0, 0), (2, 1, 1)])
+
+    def test_fast_car_counts_once(self):
+        """Test that a car sweeping across a line in one move counts once."""
+        counter = gate_counter()
+        engine = FleetEngine(make_fleet([("A", (0, 0), 'E', "FF")], speeds=[4]))
+        engine.add_observer(counter)
+        engine.run()
+        self.assertEqual(counter.totals("gate"), (1, 0))
+
+    def test_time_series_resolution(self):
+        """Test the per-bucket throughput of a source-to-sink corridor."""
+        counter = gate_counter(resolution=10)
+        engine = FleetEngine([], boundary_policy='despawn')
+        engine.add_source((0, 0), 'E', "F" * 20, every=2, field_bounds=(10, 1))
+        engine.add_observer(counter)
+        engine.run(max_ticks=100)
+        # The car spawned on tick 2k crosses on tick 2k + 5
+        self.assertEqual(counter.series("gate"), [(0, 2, 0)] + [(tick, 5, 0) for tick in range(10, 100, 10)])
+        self.assertEqual(counter.totals("gate"), (47, 0))
+
+    def test_fast_source_car_counts(self):
+        """Test that a fast car spawned after the counter is added is still counted."""
+        counter = gate_counter()
+        engine = FleetEngine(make_fleet([("A", (0, 9), 'E', "F")]))
+        engine.add_observer(counter)
+        engine.add_source((0, 0), 'E', "FF", every=1, count=1, speed=4, field_bounds=(10, 10))
+        engine.run()
+        self.assertEqual(counter.totals("gate"), (1, 0))
+
+    def test_rasterisation_matches_bounding_box(self):
+        """Test that the cut steps found by grid traversal are those of every step around the line."""
+        rng = random.Random(5)
+        points = [lambda: rng.uniform(-3, 12), lambda: rng.randint(-3, 12) + rng.choice((0, 0.5))]
+        for _ in range(300):
+            draw = rng.choice(points)
+            line = (draw(), draw(), draw(), draw())
+            if line[:2] == line[2:]:
+                continue
+            counter = FlowCounter()
+            counter.add_line("line", line[:2], line[2:])
+            expected = {}
+            for x in range(math.floor(min(line[0], line[2])) - 1, math.ceil(max(line[0], line[2])) + 2):
+                for y in range(math.floor(min(line[1], line[3])) - 1, math.ceil(max(line[1], line[3])) + 2):
+                    for axis, (bx, by) in enumerate(((x + 1, y), (x, y + 1))):
+                        sign = crosses(line, x, y, bx, by)
+                        if sign:
+                            expected[(x, y, axis)] = [(0, sign)]
+            with self.subTest(line=line):
+                self.assertEqual(counter.cuts, expected)
+
+    def test_matches_direct_sign_test(self):
+        """Test that the rasterised lines count exactly what the sign-change test finds per move."""
+        lines = {"diagonal": (-0.5, 2.3, 11.5, 9.7), "steep": (3.2, -0.5, 5.9, 11.5), "gate": (6.5, 2.5, 6.5, 8.5)}
+
+        class MoveLog(object):
+            def __init__(self):
+                self.totals = {name: [0, 0] for name in lines}
+
+            def observe(self, engine, moved, old_xs, old_ys):
+                for slot, ax, ay in zip(moved, old_xs, old_ys):
+                    for name, line in lines.items():
+                        sign = crosses(line, ax, ay, engine.xs[slot], engine.ys[slot])
+                        if sign:
+                            self.totals[name][0 if sign > 0 else 1] += 1
+
+        for seed in range(5):
+            counter = FlowCounter(7)
+            for name, line in lines.items():
+                counter.add_line(name, line[:2], line[2:])
+            log = MoveLog()
+            engine = FleetEngine(random_scenario(40, 60, 12, seed=seed))
+            engine.add_observer(counter)
+            engine.add_observer(log)
+            engine.run()
+            with self.subTest(seed=seed):
+                for name in lines:
+                    self.assertEqual(counter.totals(name), tuple(log.totals[name]))
+
+    def test_invalid_lines(self):
+        """Test that duplicate names and degenerate lines are refused."""
+        counter = gate_counter()
+        with self.assertRaises(ValueError):
+            counter.add_line("gate", (0, 0), (1, 1))
+        with self.assertRaises(ValueError):
+            counter.add_line("dot", (1, 1), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
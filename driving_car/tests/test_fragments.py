@@ -0,0 +1,94 @@
+import sys
+import os
+import random
+import unittest
+
+# Add the parent directory to Python path to import the simulation modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fragments import FragmentCache, compile_fragment, compile_fragments, fragment_fleet
+from simulation import COMPASS, copy_fleet, get_outcome
+from two_phase import TwoPhaseEngine, compile_trajectory
+from incremental import IncrementalEngine
+from tests.test_simulation import make_fleet
+
+
+class FragmentCacheTest(unittest.TestCase):
+    def test_matches_compile_trajectory(self):
+        """Test that cars built from cached fragments drive exactly as from their joined commands."""
+        rng = random.Random(3)
+        library = [''.join(rng.choice('FFFLRX') for _ in range(rng.randint(0, 12))) for _ in range(10)]
+        for field_bounds in ((6, 6), (30, 20), None):
+            cache = FragmentCache(max_entries=16)
+            for _ in range(200):
+                position = (rng.randrange(6), rng.randrange(6))
+                direction = rng.choice(COMPASS)
+                fragments = [rng.choice(library) for _ in range(rng.randint(1, 8))]
+                with self.subTest(field_bounds=field_bounds, position=position, fragments=fragments):
+                    self.assertEqual(compile_fragments(position, direction, fragments, field_bounds, cache),
+                                     compile_trajectory(position, direction, ''.join(fragments), field_bounds))
+            self.assertGreater(cache.hits, 0)
+
+    def test_net_transform(self):
+        """Test that a fragment compiles to its offsets, bounding box and net transform."""
+        offsets, headings, invalid, box, end = compile_fragment(0, "FRFFXLB")
+        self.assertEqual(offsets, [(0, 1), (0, 1), (1, 1), (2, 1), (2, 1), (2, 1), (2, 1)])
+        self.assertEqual(headings, [0, 1, 1, 1, 1, 0, 0])
+        self.assertEqual(invalid, [5, 7])
+        self.assertEqual(box, (0, 1, 2, 1))
+        self.assertEqual(end, (2, 1, 0))
+
+    def test_least_recently_used_are_evicted(self):
+        """Test the LRU order and the hit, miss, eviction and memory counters."""
+        cache = FragmentCache(max_entries=2)
+        cache.get(0, "FF")
+        cache.get(1, "FF")
+        cache.get(0, "FF")
+        cache.get(0, "FRF")
+        self.assertEqual(list(cache.entries), [(0, "FF"), (0, "FRF")])
+        stats = cache.stats()
+        self.assertEqual((stats['entries'], stats['hits'], stats['misses'], stats['evictions']), (2, 1, 3, 1))
+        self.assertEqual(stats['hit_rate'], 0.25)
+        self.assertGreater(stats['bytes'], 0)
+        bytes_before = stats['bytes']
+        cache.get(2, "F" * 100)
+        self.assertGreater(cache.stats()['bytes'], bytes_before)
+        with self.assertRaises(ValueError):
+            FragmentCache(max_entries=0)
+
+    def test_thrashing_cache_is_bypassed(self):
+        """Test that a cache smaller than the working set is bypassed, and used again once the set fits."""
+        cache = FragmentCache(max_entries=64)
+        for library_size, seed in ((400, 1), (4, 2)):
+            hits = cache.hits
+            for position, direction, fragments in fragment_fleet(1200, 8, library_size, 12, seed=seed):
+                self.assertEqual(compile_fragments(position, direction, fragments, (12, 12), cache),
+                                 compile_trajectory(position, direction, ''.join(fragments), (12, 12)))
+            if library_size > cache.max_entries:
+                stats = cache.stats()
+                self.assertGreater(stats['bypassed'], stats['hits'] + stats['misses'])
+                self.assertFalse(cache.admitting)
+        self.assertTrue(cache.admitting)
+        self.assertGreater(cache.hits - hits, 1000)
+
+    def test_engines_with_a_fragment_cache(self):
+        """Test that the two-phase and incremental engines give the same results with a fragment cache."""
+        cars = fragment_fleet(40, 4, 5, 12, seed=1)
+        fleet = make_fleet([(name, position, direction, '') for name, (position, direction, _)
+                            in zip(map(chr, range(ord('A'), ord('Z') + 1)), cars)], field_bounds=(12, 12))
+        for car_data, (_, _, fragments) in zip(fleet, cars):
+            car_data['commands'] = list(fragments)
+        expected_fleet = copy_fleet(fleet)
+        expected = get_outcome(expected_fleet, TwoPhaseEngine(expected_fleet).run())
+        cache = FragmentCache()
+        cached_fleet = copy_fleet(fleet)
+        self.assertEqual(get_outcome(cached_fleet, TwoPhaseEngine(cached_fleet, fragment_cache=cache).run()),
+                         expected)
+        incremental_fleet = copy_fleet(fleet)
+        engine = IncrementalEngine(incremental_fleet, fragment_cache=cache)
+        self.assertEqual(get_outcome(incremental_fleet, engine.run()), expected)
+        self.assertGreater(cache.stats()['hit_rate'], 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
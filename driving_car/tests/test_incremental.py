@@ -0,0 +1,133 @@
+import sys
+import os
+import random
+import unittest
+
+# Add the parent directory to Python path to import the simulation modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from car import Car
+from incremental import IncrementalEngine, first_difference
+from simulation import COMPASS, copy_fleet, get_outcome
+from two_phase import TwoPhaseEngine
+from benchmark import random_scenario
+from tests.test_simulation import make_fleet
+
+
+def fresh(car_data, field_bounds):
+    """Return a copy of a car entry with a new car at its starting position."""
+    return dict(car_data, commands=list(car_data['commands']),
+                car=Car(car_data['name'], car_data['position'], car_data['facing'], field_bounds))
+
+
+def outcome(fleet, result):
+    return (get_outcome(fleet, result), result['collision_events'], result['boundary_events'],
+            result['collided_cars'], result['steps'])
+
+
+class IncrementalEngineTest(unittest.TestCase):
+    def assert_matches_full_run(self, engine, fleet, result, field_bounds):
+        """Compare an incremental result with a fresh two-phase run of the same fleet."""
+        expected_fleet = [fresh(car_data, field_bounds) for car_data in fleet]
+        expected = outcome(expected_fleet, TwoPhaseEngine(expected_fleet).run())
+        self.assertEqual(outcome(engine.cars_with_commands, result), expected)
+
+    def test_random_edits_match_full_runs(self):
+        """Test that random edits and additions give the same result as running the changed fleet."""
+        for seed in range(40):
+            rng = random.Random(seed)
+            size = rng.randint(3, 12)
+            fleet = random_scenario(rng.randint(2, 30), rng.randint(1, 25), size, seed=seed)
+            engine = IncrementalEngine(copy_fleet(fleet))
+            with self.subTest(seed=seed):
+                self.assert_matches_full_run(engine, fleet, engine.run(), (size, size))
+                for edit in range(5):
+                    if rng.random() < 0.3:
+                        name = 'NEW' + 'ABCDE'[edit]
+                        car_data = {'name': name, 'position': (rng.randrange(size), rng.randrange(size)),
+                                    'facing': rng.choice(COMPASS),
+                                    'commands': [''.join(rng.choice('FFFLR') for _ in range(rng.randint(1, 20)))]}
+                        fleet.append(car_data)
+                    else:
+                        index = rng.randrange(len(fleet))
+                        commands = list(fleet[index]['commands'][0])
+                        commands[rng.randrange(len(commands)):] = [rng.choice('FLR')
+                                                                   for _ in range(rng.randint(0, 6))]
+                        fleet[index] = car_data = dict(fleet[index], commands=[''.join(commands) or 'F'])
+                    result = engine.set_car(fresh(car_data, (size, size)))
+                    self.assert_matches_full_run(engine, fleet, result, (size, size))
+
+    def test_cascade(self):
+        """Test that removing a collision lets both cars drive on and collide with others further down."""
+        fleet = make_fleet([("A", (0, 0), 'E', "FFFF"), ("B", (4, 0), 'W', "FFFF"), ("C", (1, 2), 'S', "FF"),
+                            ("D", (9, 9), 'S', "F")])
+        engine = IncrementalEngine(copy_fleet(fleet))
+        result = engine.run()
+        self.assertEqual(result['collided_cars'], {'A', 'B'})
+        fleet[0] = dict(fleet[0], commands=["LFFFF"])
+        result = engine.set_car(fresh(fleet[0], (10, 10)))
+        self.assertEqual(result['collided_cars'], {'B', 'C'})
+        # C keeps its trajectory; only A and B are resolved again
+        self.assertEqual(engine.affected, 2)
+        self.assert_matches_full_run(engine, fleet, result, (10, 10))
+
+    def test_unchanged_edit(self):
+        """Test that setting a car to its own commands keeps the result."""
+        fleet = random_scenario(30, 20, 8, seed=3)
+        engine = IncrementalEngine(copy_fleet(fleet))
+        result = engine.run()
+        self.assertEqual(engine.set_car(fresh(fleet[5], (8, 8))), result)
+        self.assertEqual(engine.affected, 1)
+
+    def test_edit_affects_few_cars(self):
+        """Test that an edit on a sparse field re-resolves far fewer cars than the fleet."""
+        fleet = random_scenario(400, 40, 120, seed=2)
+        engine = IncrementalEngine(copy_fleet(fleet))
+        engine.run()
+        fleet[0] = dict(fleet[0], commands=["RR" + fleet[0]['commands'][0]])
+        result = engine.set_car(fresh(fleet[0], (120, 120)))
+        self.assertLess(engine.affected, 20)
+        self.assert_matches_full_run(engine, fleet, result, (120, 120))
+
+    def test_empty_program(self):
+        """Test that a car edited to an empty command input stays parked on its start cell."""
+        fleet = make_fleet([("A", (2, 0), 'N', "FF"), ("B", (0, 0), 'E', "FFFF"), ("C", (7, 7), 'S', "")])
+        fleet[2]['commands'] = ['']
+        engine = IncrementalEngine(copy_fleet(fleet))
+        self.assert_matches_full_run(engine, fleet, engine.run(), (10, 10))
+        fleet[0] = dict(fleet[0], commands=[''])
+        result = engine.set_car(fresh(fleet[0], (10, 10)))
+        self.assertEqual(result['collision_events'], [(2, 'A', 'B', (2, 0))])
+        self.assert_matches_full_run(engine, fleet, result, (10, 10))
+
+    def test_cars_parked_together_from_the_start(self):
+        """Test that edits giving the fleet its first command or taking its last one away keep step 1 exact."""
+        fleet = make_fleet([("A", (1, 1), 'N', ""), ("B", (1, 1), 'E', ""), ("C", (5, 5), 'S', "")])
+        engine = IncrementalEngine(copy_fleet(fleet))
+        self.assert_matches_full_run(engine, fleet, engine.run(), (10, 10))
+        for index, commands, position in ((2, "F", None), (2, "", None), (2, "FF", None), (1, "", (3, 3)),
+                                          (1, "", (1, 1)), (0, "R", None)):
+            fleet[index] = dict(fleet[index], commands=[commands], position=position or fleet[index]['position'])
+            result = engine.set_car(fresh(fleet[index], (10, 10)))
+            with self.subTest(index=index, commands=commands, position=position):
+                self.assert_matches_full_run(engine, fleet, result, (10, 10))
+        self.assertEqual(result['collision_events'], [(1, "A", "B", (1, 1))])
+
+    def test_first_difference(self):
+        self.assertEqual(first_difference([(0, 1), (0, 2)], [(0, 1), (1, 1)]), 2)
+        self.assertEqual(first_difference([(0, 1), (0, 2)], [(0, 1)]), 2)
+        self.assertIsNone(first_difference([(0, 1)], [(0, 1)]))
+
+    def test_unsupported_car(self):
+        """Test that cars the two-phase engines cannot run are refused."""
+        fleet = make_fleet([("A", (0, 0), 'E', "FF")])
+        engine = IncrementalEngine(copy_fleet(fleet))
+        engine.run()
+        with self.assertRaises(ValueError):
+            engine.set_car(dict(make_fleet([("B", (5, 5), 'N', "FF")])[0], start=3))
+        with self.assertRaises(ValueError):
+            engine.set_car(make_fleet([("B", (5, 5), 'N', "FF")], speeds=[2])[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import sys
+import os
+import unittest
+
+# Add the parent directory to Python path to import the simulation modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulation import simulate
+from tests.test_simulation import make_fleet
+
+
+class CollisionPolicyTest(unittest.TestCase):
+    def test_ghost_cars_drive_through(self):
+        """Test that ghost collisions are recorded but nobody stops."""
+        fleet = make_fleet([("A", (0, 0), 'E', "FFFF"), ("B", (4, 0), 'W', "FFFF")])
+        result = simulate(fleet, 'step', verbose=False, collision_policy='ghost')
+        self.assertEqual(result['collision_events'], [(2, "A", "B", (2, 0))])
+        self.assertEqual(result['collided_cars'], set())
+        self.assertEqual(fleet[0]['car'].get_car_position(), (4, 0))
+        self.assertEqual(fleet[1]['car'].get_car_position(), (0, 0))
+
+    def test_later_arriver_stops(self):
+        """Test that only the car entering an occupied cell stops."""
+        fleet = make_fleet([("A", (2, 0), 'N', "LLLF"), ("B", (0, 0), 'E', "FFFF")])
+        result = simulate(fleet, 'step', verbose=False, collision_policy='later')
+        self.assertEqual(result['collision_events'], [(2, "A", "B", (2, 0))])
+        self.assertEqual(result['collided_cars'], {"B"})
+        self.assertEqual(fleet[0]['car'].get_car_position(), (3, 0))
+        self.assertEqual(fleet[1]['car'].get_car_position(), (2, 0))
+
+    def test_later_simultaneous_arrivals_both_stop(self):
+        """Test that cars entering a cell on the same step both stop."""
+        fleet = make_fleet([("A", (0, 0), 'E', "FFFF"), ("B", (4, 0), 'W', "FFFF")])
+        result = simulate(fleet, 'step', verbose=False, collision_policy='later')
+        self.assertEqual(result['collided_cars'], {"A", "B"})
+        self.assertEqual(fleet[0]['car'].get_car_position(), (2, 0))
+
+    def test_unknown_policy(self):
+        """Test that an unknown policy is refused."""
+        fleet = make_fleet([("A", (0, 0), 'E', "F")])
+        with self.assertRaises(ValueError):
+            simulate(fleet, 'step', verbose=False, collision_policy='bounce')
+
+
+class BoundaryPolicyTest(unittest.TestCase):
+    def test_stop_policy(self):
+        """Test that a car stops for good after a boundary violation."""
+        fleet = make_fleet([("A", (0, 0), 'S', "FLF")])
+        result = simulate(fleet, 'step', verbose=False, boundary_policy='stop')
+        self.assertEqual(result['boundary_events'], [(1, "A", (0, -1))])
+        self.assertEqual(result['steps'], 1)
+        self.assertEqual(fleet[0]['car'].get_car_position(), (0, 0))
+
+    def test_clamp_policy(self):
+        """Test that a fast car is clamped to the last valid cell."""
+        fleet = make_fleet([("A", (7, 0), 'E', "FL")], speeds=[3])
+        result = simulate(fleet, 'step', verbose=False, boundary_policy='clamp')
+        self.assertEqual(result['boundary_events'], [(1, "A", (10, 0))])
+        self.assertEqual(fleet[0]['car'].get_car_position(), (9, 0))
+        self.assertEqual(fleet[0]['car'].get_facing(), 'N')
+
+    def test_wrap_policy(self):
+        """Test that a car leaving the field comes back on the opposite side."""
+        fleet = make_fleet([("A", (9, 0), 'E', "FFRF")])
+        result = simulate(fleet, 'step', verbose=False, boundary_policy='wrap')
+        self.assertEqual(result['boundary_violated_cars'], [])
+        self.assertEqual(fleet[0]['car'].get_car_position(), (1, 9))
+
+    def test_wrapped_sweep_collides(self):
+        """Test that the cells swept across the edge are checked for collisions."""
+        fleet = make_fleet([("A", (8, 0), 'E', "F"), ("B", (0, 0), 'N', "L")], speeds=[3, 1])
+        result = simulate(fleet, 'step', verbose=False, boundary_policy='wrap')
+        self.assertEqual(result['collision_events'], [(1, "A", "B", (0, 0))])
+        self.assertEqual(fleet[0]['car'].get_car_position(), (0, 0))
+
+    def test_wrap_needs_bounds(self):
+        """Test that wrapping is refused on an unbounded field."""
+        fleet = make_fleet([("A", (0, 0), 'E', "F")], field_bounds=None)
+        with self.assertRaises(ValueError):
+            simulate(fleet, 'step', verbose=False, boundary_policy='wrap')
+
+    def test_two_phase_rejects_policies(self):
+        """Test that the two-phase engines only run the default policies."""
+        fleet = make_fleet([("A", (0, 0), 'E', "F")])
+        with self.assertRaises(ValueError):
+            simulate(fleet, 'two_phase', verbose=False, boundary_policy='clamp')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import sys
+import os
+import random
+import unittest
+
+# Add the parent directory to Python path to import the simulation modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from car import Car
+from precheck import first_violation
+
+
+def brute_force_violation(position, direction, program, field_bounds, speed=1):
+    """Find the first rejected command by moving a car one command at a time."""
+    car = Car("Probe", position, direction, field_bounds, speed)
+    for index, command in enumerate(program):
+        try:
+            car.move(command)
+        except ValueError:
+            return index
+    return None
+
+
+class PrecheckTest(unittest.TestCase):
+    def test_safe_and_unsafe_programs(self):
+        """Test the first rejected command on a small field."""
+        self.assertIsNone(first_violation((0, 0), 'N', "FFRFFRFF", (5, 5)))
+        self.assertEqual(first_violation((0, 0), 'N', "FFFFFF", (5, 5)), 4)
+        self.assertEqual(first_violation((0, 0), 'N', "LF", (5, 5)), 1)
+        self.assertEqual(first_violation((1, 1), 'E', "FF", (5, 5), speed=2), 1)
+        self.assertEqual(first_violation((1, 1), 'E', "RXF", (5, 5)), 1)
+        self.assertEqual(first_violation((7, 1), 'W', "F", (5, 5)), 0)
+        self.assertIsNone(first_violation((3, 3), 'N', "F" * 1000))
+
+    def test_matches_moving_a_car(self):
+        """Test the prefix-sum precheck against moving a car command by command."""
+        rng = random.Random(7)
+        for _ in range(300):
+            program = ''.join(rng.choice('FFFLR') for _ in range(rng.randint(1, 30)))
+            position = (rng.randrange(8), rng.randrange(8))
+            direction = rng.choice('NESW')
+            speed = rng.randint(1, 3)
+            with self.subTest(program=program, position=position, direction=direction, speed=speed):
+                self.assertEqual(first_violation(position, direction, program, (8, 8), speed),
+                                 brute_force_violation(position, direction, program, (8, 8), speed))
+
+
+if __name__ == '__main__':
+    unittest.main()
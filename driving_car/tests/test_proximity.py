@@ -0,0 +1,103 @@
+import sys
+import os
+import unittest
+
+# Add the parent directory to Python path to import the simulation modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fleet import FleetEngine
+from proximity import ProximityIndex, NearMisses
+from benchmark import random_scenario
+from tests.test_simulation import make_fleet
+
+
+def brute_force_pairs(engine, radius, chebyshev):
+    """Return the close pairs of the cars on the field by comparing every pair."""
+    live = [slot for slot in range(engine.size) if engine.cars[slot] is not None]
+    found = []
+    for index, slot in enumerate(live):
+        for other in live[index + 1:]:
+            dx = abs(engine.xs[slot] - engine.xs[other])
+            dy = abs(engine.ys[slot] - engine.ys[other])
+            distance = max(dx, dy) if chebyshev else dx + dy
+            if distance <= radius:
+                found.append(tuple(sorted((engine.names[slot], engine.names[other]))) + (distance,))
+    return sorted(found)
+
+
+class ProximityIndexTest(unittest.TestCase):
+    def test_pairs_match_brute_force(self):
+        """Test that the incrementally updated index finds exactly the close pairs, tick after tick."""
+        for metric, radius, bucket in (('manhattan', 3, None), ('chebyshev', 2, None), ('manhattan', 5, 2)):
+            engine = FleetEngine(random_scenario(60, 30, 20, seed=radius))
+            index = ProximityIndex(radius, metric, bucket)
+            engine.add_observer(index)
+            with self.subTest(metric=metric, radius=radius, bucket=bucket):
+                while engine.pending():
+                    engine.step()
+                    if engine.step_number % 5 == 0:
+                        self.assertEqual(index.pairs(), brute_force_pairs(engine, radius, metric == 'chebyshev'))
+
+    def test_nearest_matches_sorting(self):
+        """Test k-nearest queries against a full sort of the distances."""
+        engine = FleetEngine(random_scenario(80, 10, 40, seed=3))
+        engine.run()
+        index = ProximityIndex(2)
+        index.rebuild(engine)
+        for name in ("A", "Q", "BZ"):
+            slot = engine.slots[name]
+            expected = sorted((index.distance(slot, other), engine.names[other])
+                              for other in range(engine.size) if other != slot)
+            with self.subTest(name=name):
+                self.assertEqual(index.nearest(name, 5), [(other, distance) for distance, other in expected[:5]])
+                self.assertEqual(len(index.nearest(name, 100)), 79)
+
+    def test_despawned_cars_leave_the_index(self):
+        """Test that despawned cars are no longer found."""
+        engine = FleetEngine(make_fleet([("A", (0, 0), 'E', "F"), ("B", (2, 0), 'W', "L"),
+                                         ("C", (9, 9), 'S', "L")]))
+        index = ProximityIndex(2)
+        engine.add_observer(index)
+        self.assertEqual(index.pairs(), [("A", "B", 2)])
+        engine.despawn("B")
+        self.assertEqual(index.pairs(), [])
+        self.assertEqual(index.nearest("A"), [("C", 18)])
+
+    def test_invalid_arguments(self):
+        """Test that bad radii, metrics and bucket sizes are refused."""
+        with self.assertRaises(ValueError):
+            ProximityIndex(-1)
+        with self.assertRaises(ValueError):
+            ProximityIndex(2, metric='euclidean')
+        with self.assertRaises(ValueError):
+            ProximityIndex(2, bucket=0)
+
+
+class NearMissesTest(unittest.TestCase):
+    def test_near_miss_is_recorded_once(self):
+        """Test that cars passing each other log one near miss per approach."""
+        engine = FleetEngine(make_fleet([
+            ("A", (0, 0), 'E', "FFFFFF"),
+            ("B", (6, 1), 'W', "FFFFFF"),   # passes A on the next row
+            ("C", (0, 5), 'N', "LLLLLL"),   # turns in place far away
+        ]))
+        near_misses = NearMisses(1)
+        engine.add_observer(near_misses)
+        result = engine.run()
+        self.assertEqual(result['collision_events'], [])
+        self.assertEqual(near_misses.events, [(3, "A", "B", 1)])
+
+    def test_chebyshev_radius(self):
+        """Test that diagonal neighbours are near misses under the Chebyshev metric only."""
+        fleet = [("A", (0, 0), 'E', "F"), ("B", (2, 1), 'S', "L")]
+        for metric, expected in (('manhattan', []), ('chebyshev', [(1, "A", "B", 1)])):
+            engine = FleetEngine(make_fleet(fleet))
+            near_misses = NearMisses(1, metric)
+            engine.add_observer(near_misses)
+            engine.run()
+            with self.subTest(metric=metric):
+                self.assertEqual(near_misses.events, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import sys
+import os
+import random
+import unittest
+
+# Add the parent directory to Python path to import the simulation modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fleet import FleetEngine
+from region_index import RegionIndex
+from benchmark import random_scenario
+from tests.test_simulation import make_fleet, StateLog
+
+
+def replay_query(states, region, window):
+    """Answer a region query by replaying the states of a StateLog."""
+    (x0, y0), (x1, y1) = region
+    found = {}
+    steps = sorted(states)
+    latest = None
+    for step_number in range(window[0], window[1] + 1):
+        while steps and steps[0] <= step_number:
+            latest = states[steps.pop(0)]
+        for name, ((x, y), _) in latest.items():
+            if x0 <= x <= x1 and y0 <= y <= y1:
+                first, last = found.get(name, (step_number, step_number))
+                found[name] = (first, step_number)
+    return sorted((name, first, last) for name, (first, last) in found.items())
+
+
+def random_queries(rng, size, steps, count):
+    """Return random (region, window) queries over a size x size field and `steps` steps."""
+    queries = []
+    for _ in range(count):
+        x0 = rng.randrange(size)
+        y0 = rng.randrange(size)
+        t0 = rng.randrange(steps + 1)
+        queries.append((((x0, y0), (x0 + rng.randrange(size // 2), y0 + rng.randrange(size // 2))),
+                        (t0, rng.randint(t0, steps))))
+    return queries
+
+
+class RegionIndexTest(unittest.TestCase):
+    def check_against_replay(self, engine, size, tile, bucket, seed):
+        index = RegionIndex(tile, bucket)
+        log = StateLog()
+        engine.add_observer(index)
+        engine.add_observer(log)
+        result = engine.run(max_ticks=150)
+        for region, window in random_queries(random.Random(seed), size, result['steps'], 40):
+            with self.subTest(seed=seed, region=region, window=window):
+                self.assertEqual(index.query(region, window), replay_query(log.states, region, window))
+
+    def test_lockstep_runs_match_replay(self):
+        """Test region queries on lockstep runs, including fast cars, against a full replay."""
+        for seed in range(3):
+            fleet = random_scenario(40, 80, 20, seed=seed)
+            for car_data in fleet[::4]:
+                car_data['car'].speed = 3
+            self.check_against_replay(FleetEngine(fleet), 20, 4, 8, seed)
+
+    def test_scheduled_and_spawned_cars_match_replay(self):
+        """Test region queries with periodic cars, sources and despawning against a full replay."""
+        for seed in range(3):
+            fleet = random_scenario(20, 30, 20, seed=seed)
+            for number, car_data in enumerate(fleet):
+                car_data['period'] = 1 + number % 3
+            engine = FleetEngine(fleet, boundary_policy='despawn')
+            engine.add_source((0, 10), 'E', "F" * 25, every=4, field_bounds=(20, 20), count=20)
+            self.check_against_replay(engine, 20, 8, 4, seed)
+
+    def test_query_mid_run(self):
+        """Test that a query during the run sees the runs so far, and the run carries on."""
+        engine = FleetEngine(make_fleet([("A", (0, 0), 'E', "FFFFFF"), ("B", (5, 5), 'N', "LLLLLL")]))
+        index = RegionIndex(tile=2, bucket=2)
+        engine.add_observer(index)
+        for _ in range(3):
+            engine.step()
+        self.assertEqual(index.query(((2, 0), (9, 0)), (0, 10)), [("A", 2, 3)])
+        engine.run()
+        self.assertEqual(index.query(((2, 0), (9, 0)), (0, 10)), [("A", 2, 6)])
+        self.assertEqual(index.cars_in(((0, 0), (9, 9)), (6, 6)), ["A", "B"])
+
+    def test_parked_car_costs_few_entries(self):
+        """Test that a long stationary run is filed under a logarithmic number of blocks."""
+        engine = FleetEngine(make_fleet([("A", (3, 3), 'N', "L" * 5000)]))
+        index = RegionIndex(tile=16, bucket=4)
+        engine.add_observer(index)
+        engine.run()
+        self.assertEqual(index.query(((0, 0), (5, 5)), (1000, 1200)), [("A", 1000, 1200)])
+        self.assertLess(sum(len(runs) for runs in index.blocks.values()), 2 * index.levels)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import sys
+import os
+import io
+import tempfile
+import unittest
+from bisect import bisect_right
+from contextlib import redirect_stdout
+
+# Add the parent directory to Python path to import the simulation modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import replay
+from eventlog import EventLogWriter, EventLogReader
+from replay import ReplayWriter, Replay, keyframe_interval
+from tests.test_snapshot import scenario
+from tests.test_simulation import run_observed
+
+
+def record(writer):
+    """Run the snapshot scenario through a writer, returning the states after every tick."""
+    return run_observed(scenario(), writer)[1].states
+
+
+class ReplayTest(unittest.TestCase):
+    def test_seek_matches_run(self):
+        """Test that the state at every step matches the run, whatever the keyframe interval."""
+        for interval, frame_bytes in (('auto', 1 << 18), (1, 1 << 18), (5, 64), (1000, 1 << 18)):
+            with tempfile.TemporaryDirectory() as directory, self.subTest(interval=interval):
+                path = os.path.join(directory, 'run.dcel')
+                states = record(ReplayWriter(path, interval, frame_bytes=frame_bytes))
+                logged_steps = sorted(states)
+                run_replay = Replay(path)
+                self.assertEqual(run_replay.last_step, logged_steps[-1])
+                for step_number in range(run_replay.last_step + 3):
+                    expected = states[logged_steps[bisect_right(logged_steps, step_number) - 1]]
+                    self.assertEqual(run_replay.state(step_number), expected)
+
+    def test_still_an_event_log(self):
+        """Test that the keyframes leave the events of the log unchanged."""
+        with tempfile.TemporaryDirectory() as directory:
+            plain = os.path.join(directory, 'plain.dcel')
+            keyed = os.path.join(directory, 'keyed.dcel')
+            record(EventLogWriter(plain))
+            record(ReplayWriter(keyed, interval=3))
+            events = list(EventLogReader(plain))
+            self.assertTrue(events)
+            self.assertEqual(list(EventLogReader(keyed)), events)
+
+    def test_automatic_interval(self):
+        """Test that keyframes are spaced so they add the given overhead to the deltas."""
+        self.assertEqual(keyframe_interval(1000, 100, 0.25, 4096), 40)
+        self.assertEqual(keyframe_interval(1000, 0, 0.25, 4096), 4096)
+        self.assertEqual(keyframe_interval(1000, 10, 0.25, 100), 100)
+        self.assertEqual(keyframe_interval(10, 1000, 0.25, 100), 1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.dcel')
+            writer = ReplayWriter(path)
+            record(writer)
+            keyframe_steps = [step_number for step_number, _ in writer.seek_points]
+            # The first keyframe follows the first step, to measure its deltas
+            self.assertEqual(keyframe_steps[:2], [0, 1])
+            self.assertTrue(all(interval > 1 for interval in writer.intervals))
+            self.assertEqual([step_number + interval for step_number, interval
+                              in zip(keyframe_steps[1:-1], writer.intervals)], keyframe_steps[2:])
+
+    def test_command(self):
+        """Test that the replay command prints the cars at the requested steps."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.dcel')
+            states = record(ReplayWriter(path))
+            output = io.StringIO()
+            argv = sys.argv
+            try:
+                sys.argv = ['replay.py', path, '0', '5']
+                with redirect_stdout(output):
+                    self.assertEqual(replay.main(), 0)
+            finally:
+                sys.argv = argv
+            lines = output.getvalue().splitlines()
+            self.assertIn("Step 5:", lines)
+            name, ((x, y), heading) = sorted(states[0].items())[0]
+            self.assertEqual(lines[2], f"- {name}, ({x},{y}) {heading}")
+
+    def test_invalid(self):
+        """Test that bad intervals and steps before the recording are refused."""
+        for interval in (0, 'sometimes'):
+            with self.assertRaises(ValueError):
+                ReplayWriter('run.dcel', interval)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.dcel')
+            record(ReplayWriter(path))
+            with self.assertRaises(ValueError):
+                Replay(path).state(-1)
+
+
+if __name__ == '__main__':
+    unittest.main()
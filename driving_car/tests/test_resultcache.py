@@ -0,0 +1,125 @@
+import sys
+import os
+import json
+import tempfile
+import threading
+import unittest
+
+# Add the parent directory to Python path to import the simulation modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resultcache import ResultCache, scenario_key
+from simulation import copy_fleet, get_outcome, simulate
+from benchmark import random_scenario
+from tests.test_simulation import make_fleet
+
+
+class ScenarioKeyTest(unittest.TestCase):
+    def test_equivalent_scenarios_share_a_key(self):
+        """Test that command splitting and default timings do not change the key."""
+        fleet = make_fleet([("A", (1, 2), 'N', "FFRFF"), ("B", (5, 5), 'W', "FLF")])
+        split = copy_fleet(fleet)
+        split[0]['commands'] = ["FF", "R", "FF"]
+        split[1]['start'] = 0
+        split[1]['period'] = 1
+        split[1]['pauses'] = []
+        self.assertEqual(scenario_key(split), scenario_key(fleet))
+
+    def test_changes_change_the_key(self):
+        """Test that every input a result depends on is part of the key."""
+        fleet = make_fleet([("A", (1, 2), 'N', "FFRFF"), ("B", (5, 5), 'W', "FLF")])
+        key = scenario_key(fleet)
+        changed = [
+            make_fleet([("A", (1, 2), 'N', "FFRFL"), ("B", (5, 5), 'W', "FLF")]),
+            make_fleet([("A", (1, 3), 'N', "FFRFF"), ("B", (5, 5), 'W', "FLF")]),
+            make_fleet([("A", (1, 2), 'E', "FFRFF"), ("B", (5, 5), 'W', "FLF")]),
+            make_fleet([("B", (5, 5), 'W', "FLF"), ("A", (1, 2), 'N', "FFRFF")]),
+            make_fleet([("A", (1, 2), 'N', "FFRFF"), ("B", (5, 5), 'W', "FLF")], field_bounds=(12, 10)),
+            make_fleet([("A", (1, 2), 'N', "FFRFF"), ("B", (5, 5), 'W', "FLF")], speeds=[2, 1]),
+            make_fleet([("A", (1, 2), 'N', "FFRFF"), ("B", (5, 5), 'W', "FLF")], footprints=['truck', None]),
+            [dict(fleet[0], period=2), fleet[1]],
+        ]
+        keys = {scenario_key(other) for other in changed}
+        keys.update(scenario_key(fleet, engine) for engine in ('reference', 'two_phase'))
+        keys.add(scenario_key(fleet, collision_policy='ghost'))
+        keys.add(scenario_key(fleet, boundary_policy='wrap'))
+        self.assertNotIn(key, keys)
+        self.assertEqual(len(keys), len(changed) + 4)
+
+    def test_program_with_separators(self):
+        """Test that a program holding line and field separators cannot pass for another car."""
+        fleet = make_fleet([("A", (1, 2), 'N', "FF"), ("B", (5, 5), 'W', "FLF")])
+        car = fleet[1]['car']
+        line = f"B|5,5|W|{tuple(car.field_bounds)}|1|{car.footprint}|0|1|[]|FLF"
+        self.assertNotEqual(scenario_key(make_fleet([("A", (1, 2), 'N', "FF\n" + line)])), scenario_key(fleet))
+
+
+class ResultCacheTest(unittest.TestCase):
+    def test_hit_returns_the_full_result(self):
+        """Test that a hit returns the same result and final states as running the scenario."""
+        fleet = random_scenario(40, 30, 8, seed=2)
+        expected_fleet = copy_fleet(fleet)
+        expected = simulate(expected_fleet, verbose=False)
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResultCache(directory)
+            for _ in range(2):
+                cached_fleet = copy_fleet(fleet)
+                result = cache.simulate(cached_fleet)
+                self.assertEqual(result, expected)
+                self.assertEqual(get_outcome(cached_fleet, result), get_outcome(expected_fleet, expected))
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+            self.assertEqual(os.listdir(directory), [scenario_key(fleet) + '.json'])
+
+    def test_bad_entries_are_misses(self):
+        """Test that unreadable files and entries of another key are run again."""
+        fleet = make_fleet([("A", (1, 2), 'N', "FFRFF")])
+        key = scenario_key(fleet)
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResultCache(directory)
+            with open(cache.path(key), 'w') as cache_file:
+                cache_file.write('{"version": 1, "key": "')
+            self.assertIsNone(cache.get(key))
+            with open(cache.path(key), 'w') as cache_file:
+                json.dump({'version': 1, 'key': 'other'}, cache_file)
+            self.assertIsNone(cache.get(key))
+            self.assertEqual(cache.simulate(fleet)['steps'], 5)
+            self.assertIsNotNone(cache.get(key))
+
+    def test_least_recently_used_are_evicted(self):
+        """Test that the cache stays within its size by deleting the entries used longest ago."""
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResultCache(directory, max_bytes=4000)
+            entry = {'version': 1, 'padding': 'x' * 900}
+            for index, key in enumerate('abcd'):
+                cache.put(key, dict(entry, key=key))
+                os.utime(cache.path(key), (index, index))
+            # Reading an entry makes it the most recently used
+            self.assertIsNotNone(cache.get('a'))
+            cache.put('e', dict(entry, key='e'))
+            self.assertEqual(sorted(os.listdir(directory)), ['a.json', 'c.json', 'd.json', 'e.json'])
+            self.assertLessEqual(cache.size, 4000)
+            self.assertEqual(cache.evicted, 1)
+
+    def test_concurrent_writers(self):
+        """Test that workers writing the same keys at once leave only complete entries."""
+        fleets = [random_scenario(20, 20, 6, seed=seed) for seed in range(4)]
+        with tempfile.TemporaryDirectory() as directory:
+            def work():
+                cache = ResultCache(directory)
+                for fleet in fleets:
+                    cache.simulate(copy_fleet(fleet))
+
+            threads = [threading.Thread(target=work) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(sorted(os.listdir(directory)), sorted(scenario_key(fleet) + '.json' for fleet in fleets))
+            cache = ResultCache(directory)
+            for fleet in fleets:
+                self.assertEqual(cache.simulate(copy_fleet(fleet)), simulate(copy_fleet(fleet), verbose=False))
+            self.assertEqual(cache.hits, len(fleets))
+
+
+if __name__ == '__main__':
+    unittest.main()
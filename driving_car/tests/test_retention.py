@@ -0,0 +1,108 @@
+import sys
+import os
+import tempfile
+import unittest
+
+# Add the parent directory to Python path to import the simulation modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fleet import FleetEngine
+from retention import Retention
+from simulation import simulate
+from benchmark import random_scenario
+from tests.test_simulation import make_fleet, StateLog, source_engine, run_observed
+
+
+def run_with(retention, seed=1):
+    """Run a random fleet with a source and a sink, keeping a full state log next to the retention."""
+    engine = source_engine(random_scenario(8, 40, 12, seed=seed), count=12)
+    return engine, run_observed(engine, retention)[1]
+
+
+class RetentionTest(unittest.TestCase):
+    def test_full_keeps_every_tick(self):
+        """Test that the full policy keeps every tick, growing past its preallocated rows."""
+        retention = Retention('full', ticks=4)
+        engine, log = run_with(retention)
+        self.assertEqual(retention.steps(), sorted(log.states))
+        for step_number, state in log.states.items():
+            with self.subTest(step=step_number):
+                self.assertEqual(retention.state_at(step_number), state)
+        self.assertEqual(retention.history("SB"),
+                         [(step_number, *state["SB"]) for step_number, state in sorted(log.states.items())
+                          if "SB" in state])
+
+    def test_ring_keeps_last_ticks(self):
+        """Test that the ring keeps the last ticks in a fixed amount of memory."""
+        retention = Retention('ring', ticks=5)
+        engine, log = run_with(retention)
+        nbytes = retention.nbytes()
+        self.assertEqual(retention.steps(), sorted(log.states)[-5:])
+        last = engine.step_number
+        self.assertEqual(retention.state_at(last), log.states[last])
+        with self.assertRaises(ValueError):
+            retention.state_at(last - 5)
+        self.assertEqual(retention.nbytes(), nbytes)
+
+    def test_ring_forgets_cars_gone_before_its_rows(self):
+        """Test that a long ring run keeps the tenancies of recent cars only."""
+        retention = Retention('ring', ticks=5)
+        engine = FleetEngine([], boundary_policy='despawn')
+        engine.add_source((0, 0), 'E', "F" * 4, every=1, field_bounds=(3, 1))
+        log = StateLog()
+        engine.add_observer(retention)
+        engine.add_observer(log)
+        engine.run(max_ticks=1000)
+        self.assertLess(len(retention.tenancies.cars), 200)
+        for step_number in retention.steps():
+            self.assertEqual(retention.state_at(step_number), log.states[step_number])
+
+    def test_sampled_keeps_every_kth_tick(self):
+        """Test that sampling keeps the first tick of every period."""
+        retention = Retention('sampled', every=10)
+        engine, log = run_with(retention)
+        self.assertEqual(retention.steps(), list(range(0, engine.step_number + 1, 10)))
+        self.assertEqual(retention.state_at(20), log.states[20])
+
+    def test_sampled_with_scheduler_gaps(self):
+        """Test that sampling keeps the first tick of a period when its first steps are skipped."""
+        fleet = make_fleet([("A", (0, 0), 'E', "FFFF")])
+        fleet[0]['period'] = 4
+        retention = Retention('sampled', every=3)
+        simulate(fleet, verbose=False, retention=retention)
+        # The car acts on ticks 1, 5, 9 and 13; no tick of the period 6-8 runs
+        self.assertEqual(retention.steps(), [0, 5, 9, 13])
+
+    def test_none_keeps_nothing(self):
+        """Test that the none policy allocates nothing."""
+        retention = Retention('none')
+        run_with(retention)
+        self.assertEqual(retention.steps(), [])
+        self.assertEqual(retention.nbytes(), 0)
+        self.assertEqual(retention.tenancies.cars, [])
+
+    def test_full_spilled_to_disk(self):
+        """Test that the full policy can spill to disk and reads back the same history."""
+        with tempfile.TemporaryDirectory() as directory:
+            retention = Retention('full', path=os.path.join(directory, 'run'), chunk_ticks=8)
+            engine, log = run_with(retention)
+            self.assertEqual(retention.nbytes(), 0)
+            for step_number, state in log.states.items():
+                with self.subTest(step=step_number):
+                    self.assertEqual(retention.state_at(step_number), state)
+
+    def test_invalid_settings(self):
+        """Test that unknown policies, bad sizes and spilling a ring are refused."""
+        with self.assertRaises(ValueError):
+            Retention('recent')
+        with self.assertRaises(ValueError):
+            Retention('ring', ticks=0)
+        with self.assertRaises(ValueError):
+            Retention('ring', path='run')
+        with self.assertRaises(ValueError):
+            simulate(make_fleet([("A", (0, 0), 'E', "F")]), engine='reference', verbose=False,
+                     retention=Retention('full'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import sys
+import os
+import unittest
+
+# Add the parent directory to Python path to import the simulation modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from car import Car
+from road_graph import RoadGraph, run_graph_engine
+
+
+def make_cars(specs):
+    """Build car entries from (name, (x, y), direction, commands) tuples."""
+    return [{'car': Car(name, position, direction), 'name': name, 'position': position,
+             'facing': direction, 'commands': [commands]}
+            for name, position, direction, commands in specs]
+
+
+# An L-shaped road: (0,0) .. (4,0) along the bottom, then (4,1) .. (4,4) up
+L_ROAD = [(x, 0) for x in range(5)] + [(4, y) for y in range(1, 5)]
+
+
+class RoadGraphTest(unittest.TestCase):
+    def test_csr_layout(self):
+        """Test that edges are grouped by source node in CSR order."""
+        graph = RoadGraph(3, [(2, 0, 'W'), (0, 1, 'E'), (1, 2, 'N'), (0, 2, 'N')])
+        self.assertEqual(list(graph.offsets), [0, 2, 3, 4])
+        self.assertEqual(sorted(graph.targets[edge] for edge in graph.out_edges(0)), [1, 2])
+        self.assertEqual(graph.targets[graph.next_edge(1, 0)], 2)
+        self.assertEqual(graph.next_edge(1, 1), -1)
+
+    def test_from_cells(self):
+        """Test that drivable cells become nodes linked to their neighbours."""
+        graph = RoadGraph.from_cells(L_ROAD)
+        self.assertEqual(graph.num_nodes, 9)
+        self.assertEqual(graph.num_edges, 16)
+        self.assertEqual(graph.node_at(4, 2), L_ROAD.index((4, 2)))
+        self.assertEqual(graph.node_at(2, 2), -1)
+
+    def test_memory_per_node(self):
+        """Test that a street grid stays well under 100 bytes per node."""
+        graph = RoadGraph.from_cells((x, y) for x in range(100) for y in range(100))
+        graph.node_at(0, 0)
+        self.assertLess(graph.nbytes() / graph.num_nodes, 100)
+
+
+class GraphEngineTest(unittest.TestCase):
+    def test_turns_only_at_intersections(self):
+        """Test that a car follows the road and cannot turn where there is no road."""
+        cars = make_cars([("A", (0, 0), 'E', "FLFFFLFF")])
+        result = run_graph_engine(RoadGraph.from_cells(L_ROAD), cars)
+        # L at (1,0) is rejected; the car reaches the corner and turns left onto the vertical road
+        self.assertEqual(result['boundary_events'], [(2, "A", (1, 0))])
+        self.assertEqual(result['boundary_violated_cars'], ["A"])
+        self.assertEqual(cars[0]['car'].get_car_position(), (4, 2))
+        self.assertEqual(cars[0]['car'].get_facing(), 'N')
+
+    def test_collision_at_node(self):
+        """Test that two cars reaching the same node collide and stop."""
+        cars = make_cars([("A", (0, 0), 'E', "FFFF"), ("B", (4, 4), 'S', "FFF")])
+        result = run_graph_engine(RoadGraph.from_cells(L_ROAD), cars)
+        self.assertEqual(result['collision_events'], [])
+
+        cars = make_cars([("A", (0, 0), 'E', "FFFF"), ("B", (4, 4), 'S', "FFFF")])
+        result = run_graph_engine(RoadGraph.from_cells(L_ROAD), cars)
+        self.assertEqual(result['collision_events'], [(4, "A", "B", (4, 0))])
+        self.assertEqual(result['collided_cars'], {"A", "B"})
+
+    def test_collision_on_long_edge(self):
+        """Test that cars are tracked along the interior of long edges."""
+        graph = RoadGraph(2, [(0, 1, 'E', 5), (1, 0, 'W', 5)], coordinates=[(0, 0), (5, 0)])
+        cars = make_cars([("A", (0, 0), 'E', "FFFFF"), ("B", (5, 0), 'W', "FFFFF")])
+        result = run_graph_engine(graph, cars)
+        # The two directions are separate lanes: the cars pass each other
+        self.assertEqual(result['collision_events'], [])
+        self.assertEqual(cars[0]['car'].get_car_position(), (5, 0))
+
+        # B loses a tick on a rejected turn and runs into A one tick along the edge
+        cars = make_cars([("A", (0, 0), 'E', "F"), ("B", (0, 0), 'E', "LF")])
+        result = run_graph_engine(graph, cars)
+        self.assertEqual(result['collision_events'], [(2, "A", "B", (1, 0))])
+
+    def test_turn_restrictions(self):
+        """Test that a banned turn is rejected at the intersection."""
+        # A plus-shaped crossing at (1,1); from the west arm only straight on is allowed
+        cells = [(0, 1), (1, 1), (2, 1), (1, 0), (1, 2)]
+        plain = RoadGraph.from_cells(cells)
+        node = {cell: plain.node_at(*cell) for cell in cells}
+        edges = [(source, plain.targets[edge], plain.headings[edge])
+                 for source in range(plain.num_nodes) for edge in plain.out_edges(source)]
+        graph = RoadGraph(plain.num_nodes, edges, coordinates=sorted(cells),
+                          turns=[(node[(0, 1)], node[(1, 1)], node[(2, 1)])])
+        cars = make_cars([("A", (0, 1), 'E', "FLF")])
+        result = run_graph_engine(graph, cars)
+        self.assertEqual(result['boundary_events'], [(2, "A", (1, 1))])
+        self.assertEqual(cars[0]['car'].get_car_position(), (2, 1))
+
+        cars = make_cars([("A", (0, 1), 'E', "FLF")])
+        run_graph_engine(plain, cars)
+        self.assertEqual(cars[0]['car'].get_car_position(), (1, 2))
+
+    def test_car_off_road(self):
+        """Test that a car must start on a road."""
+        with self.assertRaises(ValueError):
+            run_graph_engine(RoadGraph.from_cells(L_ROAD), make_cars([("A", (2, 2), 'N', "F")]))
+
+
+if __name__ == '__main__':
+    unittest.main()
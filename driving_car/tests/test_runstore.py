@@ -0,0 +1,101 @@
+import sys
+import os
+import sqlite3
+import tempfile
+import unittest
+
+# Add the parent directory to Python path to import the simulation modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from runstore import RunStore, EVENT_INDEXES
+from simulation import simulate
+from tests.test_simulation import make_fleet
+
+
+def crash_fleet():
+    """Build a fleet where B and C collide on step 1 and A leaves the field on step 2."""
+    return make_fleet([("A", (8, 0), 'E', "FF"), ("B", (0, 0), 'E', "FF"), ("C", (2, 0), 'W', "FF"),
+                       ("D", (5, 5), 'N', "RF")])
+
+
+def truck_of(car_name):
+    return 'truck' if car_name == "C" else 'car'
+
+
+class RunStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.store = RunStore()
+
+    def tearDown(self):
+        self.store.close()
+
+    def add(self, fleet, **options):
+        result = simulate(fleet, verbose=False)
+        return self.store.add_run(fleet, result, class_of=truck_of, **options)
+
+    def test_run_round_trip(self):
+        """Test that metadata, final states, collisions and violations of a run are stored."""
+        fleet = crash_fleet()
+        run_id = self.add(fleet, name="crash", metadata={'seed': 7})
+        run = self.store.run(run_id)
+        self.assertEqual((run['name'], run['engine'], run['steps'], run['cars'], run['metadata']),
+                         ("crash", 'step', 2, 4, {'seed': 7}))
+        self.assertEqual(self.store.final_states(run_id),
+                         {car_data['name']: (car_data['car'].get_car_position(), car_data['car'].get_facing())
+                          for car_data in fleet})
+        self.assertEqual(self.store.collisions(run_id=run_id),
+                         [(run_id, 1, "B", "C", (1, 0)), (run_id, 1, "C", "B", (1, 0))])
+        self.assertEqual(self.store.violations(run_id=run_id), [(run_id, 2, "A", (10, 0))])
+        with self.assertRaises(ValueError):
+            self.store.run(run_id + 1)
+
+    def test_filters(self):
+        """Test filtering events by car, class, step and cell across runs."""
+        first = self.add(crash_fleet())
+        quiet = self.add(make_fleet([("B", (0, 0), 'E', "FF"), ("C", (5, 5), 'W', "FF")]))
+        late = self.add(make_fleet([("B", (0, 0), 'E', "FFFF"), ("C", (6, 0), 'W', "FFFF")]))
+        self.assertEqual(self.store.runs_with('collisions', car_class='truck'), [first, late])
+        self.assertEqual(self.store.runs_with('collisions', car_class='truck', max_step=2), [first])
+        self.assertEqual(self.store.runs_with('collisions', car="B", cell=(3, 0)), [late])
+        self.assertEqual(self.store.runs_with('violations'), [first])
+        self.assertEqual(self.store.runs_with('collisions', car_class='bus'), [])
+        self.assertEqual([event[:3] for event in self.store.collisions(car_class='truck')],
+                         [(first, 1, "C"), (late, 3, "C")])
+        self.assertNotIn(quiet, self.store.runs_with('collisions'))
+        with self.assertRaises(ValueError):
+            self.store.runs_with('cars')
+
+    def test_bulk_rebuilds_indexes(self):
+        """Test that runs added in bulk are indexed once the bulk ends."""
+        with self.store.bulk():
+            self.assertEqual(self.index_names(), [])
+            run_id = self.add(crash_fleet())
+        self.assertEqual(self.index_names(), sorted(index_name for index_name, _, _ in EVENT_INDEXES))
+        plan = self.store.connection.execute(
+            'EXPLAIN QUERY PLAN SELECT * FROM collisions WHERE car = ? AND run_id = ?', ("B", run_id)).fetchall()
+        self.assertIn('collisions_car', str(plan))
+
+    def index_names(self):
+        return sorted(name for name, in self.store.connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name IN ('collisions', 'violations')"))
+
+    def test_reopen(self):
+        """Test that a store file keeps its runs, and that unknown schema versions are refused."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'runs.db')
+            store = RunStore(path)
+            run_id = store.add_run(crash_fleet(), simulate(crash_fleet(), verbose=False))
+            store.close()
+            store = RunStore(path)
+            self.assertEqual(store.runs_with('violations'), [run_id])
+            store.connection.execute('PRAGMA user_version = 99')
+            store.close()
+            with self.assertRaises(ValueError):
+                RunStore(path)
+            connection = sqlite3.connect(path)
+            self.assertEqual(connection.execute('SELECT COUNT(*) FROM runs').fetchone(), (1,))
+            connection.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import sys
+import os
+import unittest
+
+# Add the parent directory to Python path to import the simulation modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fleet import FleetEngine
+from scheduler import EventScheduler, next_tick
+from simulation import simulate, copy_fleet, get_outcome
+from benchmark import random_scenario
+from tests.test_simulation import make_fleet
+
+
+class SchedulerTest(unittest.TestCase):
+    def test_pop_due_groups_cars_by_tick(self):
+        """Test that cars due on the same tick are popped together in slot order."""
+        scheduler = EventScheduler()
+        scheduler.schedule(3, 5)
+        scheduler.schedule(1, 5)
+        scheduler.schedule(2, 2)
+        scheduler.schedule(2, 7)  # replaces the entry for tick 2
+        self.assertEqual(scheduler.pop_due(), (5, [1, 3]))
+        self.assertEqual(scheduler.pop_due(), (7, [2]))
+        self.assertEqual(scheduler.pop_due(), (None, []))
+
+    def test_next_tick_skips_pauses(self):
+        """Test that pause windows push the next tick past their end."""
+        self.assertEqual(next_tick(4, 2, []), 6)
+        self.assertEqual(next_tick(4, 2, [(5, 3)]), 8)
+        self.assertEqual(next_tick(4, 1, [(5, 2), (7, 1)]), 8)
+
+    def test_default_timing_matches_reference(self):
+        """Test that the scheduler with start 0 and period 1 reproduces the lockstep engine."""
+        for seed in range(10):
+            with self.subTest(seed=seed):
+                fleet = random_scenario(30, 40, 10, seed=seed)
+                for car_data in fleet:
+                    car_data['start'] = 0
+                    car_data['period'] = 1
+                reference = copy_fleet(fleet)
+                expected = get_outcome(reference, simulate(reference, 'reference', verbose=False))
+                self.assertEqual(get_outcome(fleet, simulate(fleet, 'step', verbose=False)), expected)
+
+    def test_start_offsets_and_half_rate(self):
+        """Test delayed release and half-rate ticking."""
+        fleet = make_fleet([("A", (0, 0), 'E', "FFF"), ("B", (0, 0), 'N', "FFF")])
+        fleet[1]['start'] = 1000
+        fleet[0]['period'] = 2
+        engine = FleetEngine(fleet)
+        result = engine.run()
+        self.assertEqual(result['collision_results'], [])
+        self.assertEqual(result['steps'], 1003)
+        self.assertEqual(fleet[0]['car'].get_car_position(), (3, 0))
+
+        # B is released one tick later and runs into A, which only moves on odd ticks
+        fleet = make_fleet([("A", (0, 0), 'E', "FFF"), ("B", (0, 0), 'E', "FFF")])
+        fleet[0]['period'] = 2
+        fleet[1]['start'] = 1
+        result = FleetEngine(fleet).run()
+        self.assertEqual(result['collision_events'], [(2, "A", "B", (1, 0))])
+
+    def test_invalid_timing(self):
+        """Test that periods below one and negative start ticks are refused, also on spawn."""
+        for key, value in (('period', 0), ('period', -1), ('start', -2)):
+            with self.subTest(key=key, value=value):
+                fleet = make_fleet([("A", (0, 0), 'E', "FFF")])
+                fleet[0][key] = value
+                with self.assertRaises(ValueError):
+                    FleetEngine(fleet)
+                engine = FleetEngine(make_fleet([("B", (5, 5), 'N', "FF")]))
+                with self.assertRaises(ValueError):
+                    engine.spawn(fleet[0])
+                self.assertNotIn("A", engine.slots)
+
+    def test_pause_waiting_car_is_an_obstacle(self):
+        """Test that a paused car keeps its cell and stops a car running into it."""
+        fleet = make_fleet([("A", (1, 0), 'N', "LLFF"), ("B", (0, 0), 'E', "FFF")])
+        fleet[0]['pauses'] = [(1, 5)]
+        result = FleetEngine(fleet).run()
+        self.assertEqual(result['collision_events'], [(1, "A", "B", (1, 0))])
+
+        fleet = make_fleet([("A", (5, 5), 'N', "FFFF")])
+        engine = FleetEngine(fleet)
+        engine.step()
+        engine.pause("A", 10)
+        result = engine.run()
+        self.assertEqual(result['steps'], 14)
+        self.assertEqual(fleet[0]['car'].get_car_position(), (5, 9))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import sys
+import os
+import unittest
+
+# Add the parent directory to Python path to import the simulation modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from segments import compile_segments, first_contact, first_meeting, position_at, FOREVER
+
+
+class SegmentSolverTest(unittest.TestCase):
+    def test_compile_straight_runs(self):
+        """Test that F runs become one segment each and turns are stationary."""
+        segments, turns, violations = compile_segments((0, 0), 'E', "FFFLFF", (10, 10))
+        self.assertEqual(segments, [
+            (0, 3, 0, 0, 1, 0),
+            (3, 4, 3, 0, 0, 0),
+            (4, 6, 3, 0, 0, 1),
+            (6, FOREVER, 3, 2, 0, 0),
+        ])
+        self.assertEqual(turns, [(0, 1), (4, 0)])
+        self.assertEqual(violations, [])
+        self.assertEqual(position_at(segments, 5), (3, 1))
+
+    def test_compile_clips_run_at_wall(self):
+        """Test that the first rejected move of a run is found without stepping."""
+        segments, turns, violations = compile_segments((7, 0), 'E', "F" * 10000, (10, 10))
+        self.assertEqual(violations, [(3, 10000, (10, 0))])
+        self.assertEqual(position_at(segments, 10000), (9, 0))
+
+    def test_head_on_meeting_and_swap(self):
+        """Test the closed-form meeting and swapping times of two runs."""
+        # Same cell: (0,0)->E and (4,0)->W meet at (2,0) after step 2
+        self.assertEqual(first_contact((0, 10, 0, 0, 1, 0), (0, 10, 4, 0, -1, 0)), (2, 'cell'))
+        # Odd gap: the cars exchange cells during step 2
+        self.assertEqual(first_contact((0, 10, 0, 0, 1, 0), (0, 10, 3, 0, -1, 0)), (2, 'swap'))
+        self.assertIsNone(first_contact((0, 10, 0, 0, 1, 0), (0, 10, 3, 0, -1, 0), swaps=False))
+
+    def test_crossing_and_parked_cars(self):
+        """Test crossing runs and a run ending on a parked car."""
+        self.assertEqual(first_contact((0, 20, 0, 5, 1, 0), (0, 20, 5, 0, 0, 1)), (5, 'cell'))
+        self.assertIsNone(first_contact((0, 20, 0, 5, 1, 0), (0, 20, 5, 1, 0, 1)))
+        parked = [(0, FOREVER, 9000, 0, 0, 0)]
+        runner = [(0, 10000, 0, 0, 1, 0), (10000, FOREVER, 10000, 0, 0, 0)]
+        self.assertEqual(first_meeting(runner, parked), (9000, 'cell', (9000, 0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,245 @@
+import sys
+import os
+import unittest
+
+# Add the parent directory to Python path to import the simulation modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from car import Car
+from fleet import FleetEngine, DESPAWNED
+from simulation import COMPASS, ENGINES, simulate, copy_fleet, get_outcome
+from benchmark import random_scenario, highway_scenario
+
+
+def make_fleet(specs, field_bounds=(10, 10), speeds=None, footprints=None):
+    """Build car entries from (name, (x, y), direction, commands) tuples."""
+    fleet = []
+    for index, (name, position, direction, commands) in enumerate(specs):
+        car = Car(name, position, direction, field_bounds, speeds[index] if speeds else 1,
+                  footprints[index] if footprints else None)
+        fleet.append({'car': car, 'name': name, 'position': position,
+                      'facing': direction, 'commands': [commands]})
+    return fleet
+
+
+class StateLog(object):
+    """Observer that keeps the state of the cars on the field after every tick."""
+
+    def __init__(self):
+        self.states = {}
+
+    def snapshot(self, engine):
+        self.states[engine.step_number] = {
+            engine.names[slot]: ((engine.xs[slot], engine.ys[slot]), COMPASS[engine.headings[slot]])
+            for slot in range(engine.size) if engine.status[slot] != DESPAWNED}
+
+    def place(self, engine, slots):
+        self.snapshot(engine)
+
+    def observe(self, engine, moved, old_xs, old_ys):
+        self.snapshot(engine)
+
+
+def source_engine(fleet, count, size=12, row=None, **options):
+    """Build a fleet engine with a source sending `count` cars east across a size x size field.
+
+    The source sits on the west edge of row `row` (the middle row by
+    default). Its cars drive two cells past the far edge, where the default
+    'despawn' boundary policy removes them.
+    """
+    options.setdefault('boundary_policy', 'despawn')
+    engine = FleetEngine(fleet, **options)
+    row = size // 2 if row is None else row
+    engine.add_source((0, row), 'E', "F" * (size + 2), every=3, field_bounds=(size, size), count=count)
+    return engine
+
+
+def run_observed(engine, *observers):
+    """Run an engine with observers and a StateLog, then close the observers; return (result, log)."""
+    log = StateLog()
+    for observer in observers + (log,):
+        engine.add_observer(observer)
+    result = engine.run()
+    for observer in observers:
+        observer.close()
+    return result, log
+
+
+class SimulationEngineTest(unittest.TestCase):
+    def assert_engines_agree(self, fleet, engine):
+        """Run the reference engine and `engine` on copies of a fleet and compare outcomes."""
+        reference = copy_fleet(fleet)
+        candidate = copy_fleet(fleet)
+        expected = get_outcome(reference, simulate(reference, 'reference', verbose=False))
+        actual = get_outcome(candidate, simulate(candidate, engine, verbose=False))
+        self.assertEqual(actual, expected)
+        return candidate
+
+    def test_step_engine_collision(self):
+        """Test that colliding cars stop and the collision is reported once."""
+        fleet = make_fleet([("A", (1, 2), 'N', "FFRFFFFRRL"), ("B", (7, 8), 'W', "FFLFFFFFFF")])
+        result = simulate(fleet, 'step', verbose=False)
+        self.assertEqual(result['collision_results'], [
+            "A, collides with B at (5,4) at step 7",
+            "B, collides with A at (5,4) at step 7",
+        ])
+        self.assertEqual(result['collision_events'], [(7, "A", "B", (5, 4))])
+        self.assertEqual(fleet[0]['car'].get_car_position(), (5, 4))
+        self.assertEqual(fleet[1]['car'].get_car_position(), (5, 4))
+
+    def test_step_engine_boundary_violation(self):
+        """Test that a move off the field is reported and skipped."""
+        fleet = make_fleet([("A", (0, 0), 'S', "FLF")])
+        result = simulate(fleet, 'step', verbose=False)
+        self.assertEqual(result['boundary_violated_cars'], ["A"])
+        self.assertEqual(result['boundary_events'], [(1, "A", (0, -1))])
+        self.assertEqual(fleet[0]['car'].get_car_position(), (1, 0))
+
+    def test_two_phase_parked_and_chain_collisions(self):
+        """Test the two-phase engine on parked cars and collision chains."""
+        fleet = make_fleet([
+            ("A", (0, 0), 'E', "FF"),          # parks at (2,0) after step 2
+            ("B", (2, 3), 'S', "FFFFF"),       # reaches (2,0) at step 3
+            ("C", (5, 0), 'W', "FFFLF"),       # reaches (2,0) at step 3 as well
+            ("D", (4, 4), 'N', "LLFFFF"),      # runs into nobody
+            ("E", (0, 0), 'N', "R"),           # starts on A's start cell
+        ])
+        self.assert_engines_agree(fleet, 'two_phase')
+
+    def test_two_phase_matches_step_engine_on_random_scenarios(self):
+        """Test that the two-phase engine reproduces the reference engine exactly."""
+        for seed in range(30):
+            with self.subTest(seed=seed):
+                self.assert_engines_agree(random_scenario(40, 60, 12, seed=seed), 'two_phase')
+
+    def test_segment_engine_matches_step_engine_on_random_scenarios(self):
+        """Test that the analytic segment collision phase reproduces the reference engine exactly."""
+        for seed in range(30):
+            with self.subTest(seed=seed):
+                self.assert_engines_agree(random_scenario(40, 60, 12, seed=seed, forward_bias=0.8), 'segments')
+        self.assert_engines_agree(highway_scenario(30, 500), 'segments')
+
+    def test_step_engine_matches_reference_on_random_scenarios(self):
+        """Test that the active-set step engine reproduces the reference engine exactly."""
+        for seed in range(30):
+            with self.subTest(seed=seed):
+                self.assert_engines_agree(random_scenario(40, 60, 12, seed=seed), 'step')
+
+    def test_empty_program(self):
+        """Test that every engine parks a car with an empty command input on its start cell."""
+        fleet = make_fleet([("A", (2, 2), 'E', ""), ("B", (0, 2), 'E', "FFF"), ("C", (5, 5), 'N', "RF")])
+        fleet[0]['commands'] = ['']
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                candidate = self.assert_engines_agree(fleet, engine)
+                self.assertEqual(candidate[0]['car'].get_car_position(), (2, 2))
+                self.assertEqual(candidate[0]['car'].get_facing(), 'E')
+                self.assertEqual(candidate[1]['car'].get_car_position(), (2, 2))
+
+    def test_parked_cars_sharing_a_start_cell(self):
+        """Test that the step engine reports cars with empty programs parked on one cell, as the reference does."""
+        fleet = make_fleet([("A", (1, 1), 'N', ""), ("B", (1, 1), 'E', ""), ("C", (5, 5), 'N', "F")])
+        candidate = self.assert_engines_agree(fleet, 'step')
+        self.assertEqual(candidate[0]['car'].get_car_position(), (1, 1))
+        result = simulate(copy_fleet(fleet), 'step', verbose=False)
+        self.assertEqual(result['collision_events'], [(1, "A", "B", (1, 1))])
+
+    def test_parked_cars_sharing_a_start_cell_in_every_engine(self):
+        """Test that every engine reports cars parked together from the start on step 1."""
+        fleet = make_fleet([("A", (1, 1), 'N', ""), ("B", (1, 1), 'E', ""), ("C", (5, 5), 'N', "F")])
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                self.assert_engines_agree(fleet, engine)
+                result = simulate(copy_fleet(fleet), engine, verbose=False)
+                self.assertEqual(result['collision_events'], [(1, "A", "B", (1, 1))])
+
+    def test_empty_command_sequences_are_skipped(self):
+        """Test that every engine runs the commands after an empty command input."""
+        fleet = make_fleet([("A", (2, 2), 'E', ""), ("B", (6, 6), 'S', "")])
+        fleet[0]['commands'] = ['', 'LFRF']
+        fleet[1]['commands'] = ['FF', '', 'F']
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                candidate = self.assert_engines_agree(fleet, engine)
+                self.assertEqual(candidate[0]['car'].get_car_position(), (3, 3))
+                self.assertEqual(candidate[1]['car'].get_car_position(), (6, 3))
+
+    def test_step_engine_stops_when_all_cars_stop(self):
+        """Test that the active set empties and the run ends before the longest program."""
+        fleet = make_fleet([("A", (0, 0), 'E', "F"), ("B", (2, 0), 'W', "FFFFFFFFFF")])
+        result = simulate(fleet, 'step', verbose=False)
+        self.assertEqual(result['collision_events'], [(1, "A", "B", (1, 0))])
+        self.assertEqual(result['steps'], 1)
+
+
+class SweptCollisionTest(unittest.TestCase):
+    def test_fast_car_hits_car_inside_its_sweep(self):
+        """Test that a fast car stops on a car standing in the middle of its sweep."""
+        fleet = make_fleet([("A", (0, 0), 'E', "FF"), ("B", (2, 0), 'N', "LL")], speeds=[3, 1])
+        result = simulate(fleet, 'step', verbose=False)
+        self.assertEqual(result['collision_events'], [(1, "A", "B", (2, 0))])
+        self.assertEqual(fleet[0]['car'].get_car_position(), (2, 0))
+
+    def test_fast_car_stops_before_cars_past_its_stop(self):
+        """Test that a fast car stopped by a car in its sweep does not hit cars further along it."""
+        fleet = make_fleet([("A", (0, 0), 'E', "F"), ("B", (2, 0), 'N', ""), ("C", (3, 0), 'N', "")],
+                           speeds=[3, 1, 1])
+        result = simulate(fleet, 'step', verbose=False)
+        self.assertEqual(result['collision_events'], [(1, "A", "B", (2, 0))])
+        self.assertEqual(result['collided_cars'], {"A", "B"})
+        self.assertEqual(fleet[0]['car'].get_car_position(), (2, 0))
+
+    def test_crossing_sweeps_collide(self):
+        """Test that two fast cars whose sweeps cross in the same step collide."""
+        fleet = make_fleet([("A", (0, 2), 'E', "F"), ("B", (2, 0), 'N', "F")], speeds=[4, 4])
+        result = simulate(fleet, 'step', verbose=False)
+        self.assertEqual(result['collision_events'], [(1, "A", "B", (2, 2))])
+        self.assertEqual(fleet[0]['car'].get_car_position(), (2, 2))
+        self.assertEqual(fleet[1]['car'].get_car_position(), (2, 2))
+
+    def test_fast_car_boundary_violation(self):
+        """Test that the first invalid cell of a sweep is reported."""
+        fleet = make_fleet([("A", (6, 0), 'E', "FF")], speeds=[3])
+        result = simulate(fleet, 'step', verbose=False)
+        self.assertEqual(result['boundary_events'], [(2, "A", (10, 0))])
+        self.assertEqual(fleet[0]['car'].get_car_position(), (9, 0))
+
+    def test_two_phase_rejects_fast_cars(self):
+        """Test that the two-phase engines refuse cars they cannot simulate."""
+        fleet = make_fleet([("A", (0, 0), 'E', "F")], speeds=[2])
+        with self.assertRaises(ValueError):
+            simulate(fleet, 'two_phase', verbose=False)
+
+
+class FootprintTest(unittest.TestCase):
+    def test_car_runs_into_trailer(self):
+        """Test that a car entering a truck's trailer cell collides with the truck."""
+        fleet = make_fleet([("A", (2, 2), 'E', "FF"), ("B", (3, 4), 'S', "FF")], footprints=['truck', None])
+        result = simulate(fleet, 'step', verbose=False)
+        self.assertEqual(result['collision_events'], [(2, "A", "B", (3, 2))])
+        self.assertEqual(fleet[0]['car'].get_car_position(), (4, 2))
+
+    def test_turning_footprint_sweeps_into_car(self):
+        """Test that a truck turning its trailer onto a parked car collides."""
+        fleet = make_fleet([("A", (5, 5), 'E', "RF"), ("B", (5, 6), 'N', "L")], footprints=['truck', None])
+        result = simulate(fleet, 'step', verbose=False)
+        self.assertEqual(result['collision_events'], [(1, "A", "B", (5, 6))])
+        self.assertEqual(fleet[0]['car'].get_facing(), 'S')
+
+    def test_fast_truck_stops_on_first_contested_anchor(self):
+        """Test that a fast truck stops where its footprint first touches another car."""
+        fleet = make_fleet([("A", (1, 0), 'E', "F"), ("B", (4, 0), 'N', "L")], speeds=[4, 1],
+                           footprints=['truck', None])
+        result = simulate(fleet, 'step', verbose=False)
+        self.assertEqual(result['collision_events'], [(1, "A", "B", (4, 0))])
+        self.assertEqual(fleet[0]['car'].get_footprint_cells(), [(4, 0), (3, 0)])
+
+    def test_footprint_boundary_in_step_engine(self):
+        """Test that the step engine rejects a turn that swings the footprint off the field."""
+        fleet = make_fleet([("A", (0, 0), 'N', "RF")], footprints=[((0, 0), (0, 1))])
+        result = simulate(fleet, 'step', verbose=False)
+        self.assertEqual(result['boundary_events'], [(1, "A", (0, -1))])
+        self.assertEqual(fleet[0]['car'].get_car_position(), (0, 1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import sys
+import os
+import signal
+import tempfile
+import unittest
+
+# Add the parent directory to Python path to import the simulation modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fleet import FleetEngine
+from simulation import copy_fleet
+from snapshot import Snapshotter, capture, write_snapshot, save_snapshot, load_snapshot
+from benchmark import random_scenario
+from tests.test_simulation import make_fleet, source_engine, run_observed
+
+
+def scenario(boundary_policy='despawn', collision_policy='stop'):
+    """Build an engine with random cars, a source and a few slow, late and multi-cell cars."""
+    fleet = random_scenario(40, 80, 14, seed=5)
+    fleet[0]['period'] = 3
+    fleet[1]['start'] = 4
+    fleet[2]['pauses'] = [(6, 5)]
+    fleet += make_fleet([("TRUCK", (7, 7), 'N', "FFRFFLFF")], field_bounds=(14, 14), footprints=['truck'])
+    return source_engine(fleet, count=12, size=14, row=6, collision_policy=collision_policy, boundary_policy=boundary_policy)
+
+
+def finish(engine):
+    """Run an engine to the end, returning its result and the states after every later step."""
+    result, log = run_observed(engine)
+    return result, log.states
+
+
+class SnapshotTest(unittest.TestCase):
+    def test_resume_is_exact(self):
+        """Test that a run restored at any of several steps ends exactly like an uninterrupted run."""
+        for boundary_policy, collision_policy in (('despawn', 'stop'), ('stop', 'later'), ('clamp', 'ghost')):
+            expected_result, expected_states = finish(scenario(boundary_policy, collision_policy))
+            for stop in (0, 1, 7, 20, 45):
+                with tempfile.TemporaryDirectory() as directory, \
+                        self.subTest(boundary_policy=boundary_policy, step=stop):
+                    path = os.path.join(directory, 'run.snapshot')
+                    engine = scenario(boundary_policy, collision_policy)
+                    engine.run(max_ticks=stop)
+                    save_snapshot(engine, path)
+                    result, states = finish(load_snapshot(path))
+                    self.assertEqual(result, expected_result)
+                    self.assertEqual(states, {step_number: state for step_number, state in expected_states.items()
+                                              if step_number >= engine.step_number})
+
+    def test_final_states_written_back(self):
+        """Test that a restored run writes the final states back to its cars."""
+        fleet = make_fleet([("A", (0, 0), 'E', "FFLF"), ("B", (5, 5), 'N', "RFF")])
+        expected = copy_fleet(fleet)
+        FleetEngine(expected).run()
+        engine = FleetEngine(fleet)
+        engine.step()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.snapshot')
+            save_snapshot(engine, path)
+            restored = load_snapshot(path)
+        restored.run()
+        self.assertEqual([(car_data['name'], car_data['car'].get_car_position(), car_data['car'].get_facing())
+                          for car_data in restored.cars_with_commands],
+                         [(car_data['name'], car_data['car'].get_car_position(), car_data['car'].get_facing())
+                          for car_data in expected])
+
+    def test_periodic_snapshots(self):
+        """Test that the snapshotter writes every period, and that the last snapshot resumes exactly."""
+        expected_result, _ = finish(scenario())
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.snapshot')
+            snapshotter = Snapshotter(path, every=10, signals=())
+            engine = scenario()
+            engine.add_observer(snapshotter)
+            engine.run()
+            snapshotter.close()
+            self.assertEqual(snapshotter.written, engine.step_number // 10)
+            restored = load_snapshot(path)
+            self.assertEqual(restored.step_number, engine.step_number // 10 * 10)
+            self.assertEqual(restored.run(), expected_result)
+            self.assertFalse(os.path.exists(path + '.tmp'))
+
+    def test_snapshot_on_signal(self):
+        """Test that SIGTERM snapshots the state at the end of the step and stops the run."""
+        expected_result, _ = finish(scenario())
+        previous = signal.getsignal(signal.SIGTERM)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.snapshot')
+            snapshotter = Snapshotter(path)
+            engine = scenario()
+            engine.add_observer(snapshotter)
+            engine.run(max_ticks=12)
+            os.kill(os.getpid(), signal.SIGTERM)
+            with self.assertRaises(SystemExit):
+                engine.run()
+            self.assertIs(signal.getsignal(signal.SIGTERM), previous)
+            restored = load_snapshot(path)
+            self.assertEqual(restored.step_number, 13)
+            self.assertEqual(restored.run(), expected_result)
+
+    def test_capture_outlives_spawn_and_despawn(self):
+        """Test that spawning and despawning after a capture leave the captured active set alone."""
+        fleet = random_scenario(40, 80, 14, seed=5)
+        expected_result = FleetEngine(copy_fleet(fleet)).run()
+        engine = FleetEngine(fleet)
+        engine.run(max_ticks=5)
+        state = capture(engine)
+        active = list(engine.active)
+        engine.spawn(make_fleet([("LATE", (13, 13), 'W', "FFF")], field_bounds=(14, 14))[0])
+        engine.despawn(engine.names[active[0]])
+        self.assertEqual(state['active'], active)
+        self.assertNotEqual(engine.active, active)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.snapshot')
+            write_snapshot(path, state)
+            self.assertEqual(load_snapshot(path).run(), expected_result)
+
+    def test_not_a_snapshot(self):
+        """Test that other files and bad periods are refused."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.snapshot')
+            with open(path, 'wb') as snapshot_file:
+                snapshot_file.write(b'Step 1: A - F')
+            with self.assertRaises(ValueError):
+                load_snapshot(path)
+        with self.assertRaises(ValueError):
+            Snapshotter('run.snapshot', every=0, signals=())
+
+
+if __name__ == '__main__':
+    unittest.main()
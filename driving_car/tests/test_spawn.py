@@ -0,0 +1,126 @@
+import sys
+import os
+import unittest
+
+# Add the parent directory to Python path to import the simulation modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from car import Car
+from fleet import FleetEngine, DESPAWNED
+from simulation import simulate
+from tests.test_simulation import make_fleet
+
+
+class SpawnTest(unittest.TestCase):
+    def test_source_and_sink_keep_memory_flat(self):
+        """Test that a long source-to-sink run reuses a handful of slots."""
+        engine = FleetEngine([], boundary_policy='despawn')
+        engine.add_source((0, 0), 'E', "F" * 20, every=2, field_bounds=(10, 1))
+        result = engine.run(max_ticks=2000)
+        self.assertEqual(result['steps'], 2000)
+        self.assertEqual(engine.spawned, 1000)
+        self.assertEqual(engine.despawned, 995)
+        self.assertEqual(result['collision_events'], [])
+        self.assertEqual(result['boundary_events'], [])
+        self.assertEqual(len(engine.xs), 8)
+        self.assertEqual(len(engine.slots), 5)
+
+    def test_despawned_slot_is_reused(self):
+        """Test that a despawned car's slot goes to the next spawn."""
+        engine = FleetEngine(make_fleet([("A", (0, 0), 'E', "FFFF"), ("B", (0, 5), 'E', "FFFF")]))
+        engine.step()
+        engine.despawn("A")
+        self.assertEqual(engine.status[0], DESPAWNED)
+        self.assertNotIn((1, 0), engine.occupancy)
+        slot = engine.spawn({'car': Car("C", (1, 0), 'E', (10, 10)), 'commands': ["F"]})
+        self.assertEqual(slot, 0)
+        result = engine.run()
+        self.assertEqual(engine.cars[0].get_car_position(), (2, 0))
+        self.assertEqual(engine.cars[1].get_car_position(), (4, 5))
+        self.assertEqual(result['collision_events'], [])
+
+    def test_despawn_before_start(self):
+        """Test that a car still waiting for its start tick can be despawned."""
+        fleet = make_fleet([("A", (0, 0), 'E', "FF"), ("B", (3, 0), 'W', "FFF")])
+        fleet[1]['start'] = 5
+        engine = FleetEngine(fleet)
+        engine.step()
+        engine.despawn("B")
+        result = engine.run()
+        self.assertEqual(engine.status[1], DESPAWNED)
+        self.assertEqual(result['collision_events'], [])
+        self.assertEqual(engine.cars[0].get_car_position(), (2, 0))
+        self.assertNotIn((3, 0), engine.occupancy)
+
+    def test_spawn_with_start(self):
+        """Test that a spawned car with a later start tick waits off the field, like a starting car."""
+        fleet = make_fleet([("A", (0, 0), 'E', "FFFFFF"), ("B", (3, 2), 'S', "FF")])
+        fleet[1]['start'] = 3
+        expected = FleetEngine(fleet).run()
+        engine = FleetEngine(make_fleet([("A", (0, 0), 'E', "FFFFFF")]))
+        engine.step()
+        engine.spawn(dict(make_fleet([("B", (3, 2), 'S', "FF")])[0], start=3))
+        self.assertNotIn((3, 2), engine.occupancy)
+        self.assertEqual(engine.run(), expected)
+        self.assertEqual(engine.cars[1].get_car_position(), (3, 0))
+
+    def test_source_skips_taken_names(self):
+        """Test that a source does not reuse the name of a user car."""
+        engine = FleetEngine(make_fleet([("SA", (5, 5), 'N', "F")]))
+        engine.add_source((0, 0), 'E', "FF", every=1, field_bounds=(10, 10), count=1)
+        engine.run()
+        self.assertEqual(sorted(engine.slots), ['SA', 'SB'])
+
+    def test_source_cars_in_a_reused_slot_keep_their_collisions(self):
+        """Test that every source car reusing a slot gets its own name and its own collision."""
+        engine = FleetEngine(make_fleet([("A", (2, 0), 'N', "")], field_bounds=(6, 1)), collision_policy='ghost',
+                             boundary_policy='despawn')
+        engine.add_source((0, 0), 'E', "FFFFFF", every=2, field_bounds=(6, 1), count=10)
+        result = engine.run()
+        self.assertLess(len(engine.xs), 10)
+        names = [car2_name if car1_name == "A" else car1_name for _, car1_name, car2_name, _ in result['collision_events']]
+        self.assertEqual(len(names), 10)
+        self.assertEqual(len(set(names)), 10)
+        self.assertEqual(len(result['collision_results']), 20)
+
+    def test_spawned_car_collides(self):
+        """Test that a spawned car is an obstacle from the tick it appears."""
+        engine = FleetEngine(make_fleet([("A", (3, 0), 'W', "FFF")]))
+        engine.spawn({'car': Car("B", (1, 0), 'N', (10, 10)), 'commands': ["L"]})
+        result = engine.run()
+        self.assertEqual(result['collision_events'], [(2, "A", "B", (1, 0))])
+
+    def test_blocked_source_skips_tick(self):
+        """Test that a source does not spawn onto a taken cell."""
+        engine = FleetEngine(make_fleet([("A", (0, 0), 'N', "LRF")]))
+        engine.add_source((0, 0), 'E', "F", every=2, field_bounds=(10, 10), count=1)
+        engine.run(max_ticks=3)
+        self.assertEqual(engine.sources[0]['blocked'], 1)
+        self.assertEqual(engine.spawned, 0)
+        engine.run()
+        self.assertEqual(engine.spawned, 1)
+        self.assertEqual(engine.sources, [])
+
+    def test_source_with_scheduler(self):
+        """Test that sources spawn on their ticks when timed cars use the scheduler."""
+        fleet = make_fleet([("A", (5, 5), 'N', "LL")])
+        fleet[0]['period'] = 10
+        engine = FleetEngine(fleet)
+        engine.add_source((0, 0), 'E', "FF", every=3, field_bounds=(10, 10), count=2, prefix='Q')
+        result = engine.run()
+        self.assertEqual(engine.spawned, 2)
+        self.assertEqual(result['steps'], 11)
+        self.assertEqual(engine.slots, {"A": 0, "QA": 1, "QB": 2})
+        self.assertEqual(engine.cars[1].get_car_position(), (2, 0))
+
+    def test_sink_policy(self):
+        """Test that the despawn boundary policy removes cars leaving the field."""
+        fleet = make_fleet([("A", (8, 0), 'E', "FFF")])
+        result = simulate(fleet, 'step', verbose=False, boundary_policy='despawn')
+        self.assertEqual(result['boundary_violated_cars'], [])
+        self.assertEqual(result['steps'], 2)
+        self.assertEqual(fleet[0]['car'].get_car_position(), (9, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
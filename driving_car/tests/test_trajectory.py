@@ -0,0 +1,83 @@
+import sys
+import os
+import json
+import tempfile
+import unittest
+from array import array
+
+# Add the parent directory to Python path to import the simulation modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fleet import FleetEngine
+from trajectory import TrajectoryRecorder, TrajectoryFile, TYPECODES
+from benchmark import random_scenario
+from tests.test_simulation import make_fleet, source_engine, run_observed
+
+
+def read_array(directory, chunk, name):
+    """Read a chunk array the way numpy.memmap would, from the sidecar description alone."""
+    description = chunk['arrays'][name]
+    values = array(TYPECODES[description['dtype'][2:]])
+    count = 1
+    for length in description['shape']:
+        count *= length
+    with open(os.path.join(directory, chunk['file']), 'rb') as chunk_file:
+        chunk_file.seek(description['offset'])
+        values.frombytes(chunk_file.read(count * values.itemsize))
+    return values
+
+
+class TrajectoryRecorderTest(unittest.TestCase):
+    def test_recording_matches_run(self):
+        """Test that every tick of a run with spawning, despawning and growth reads back."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run')
+            _, log = run_observed(source_engine(random_scenario(6, 30, 12, seed=4), count=10),
+                                  TrajectoryRecorder(path, chunk_ticks=7))
+
+            recording = TrajectoryFile(path)
+            self.assertGreater(len(recording.chunks), 3)
+            self.assertGreater(len({chunk['width'] for chunk in recording.chunks}), 1)
+            for step_number, state in log.states.items():
+                with self.subTest(step=step_number):
+                    self.assertEqual(recording.state_at(step_number), state)
+            for name in ("A", "SB"):
+                self.assertEqual(recording.trajectory(name),
+                                 [(step_number, *state[name]) for step_number, state in sorted(log.states.items())
+                                  if name in state])
+
+    def test_sidecar_describes_arrays(self):
+        """Test that the sidecar's dtype, offset and shape locate the arrays in the chunk files."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run')
+            engine = FleetEngine(make_fleet([("A", (0, 0), 'E', "FFF"), ("B", (5, 5), 'N', "RF")]))
+            recorder = TrajectoryRecorder(path, chunk_ticks=3)
+            engine.add_observer(recorder)
+            engine.run()
+            recorder.close()
+            with open(path + '.json') as sidecar_file:
+                chunks = json.load(sidecar_file)['chunks']
+            self.assertEqual([chunk['ticks'] for chunk in chunks], [3, 1])
+            self.assertEqual(chunks[0]['arrays']['xs']['shape'], [3, 2])
+            self.assertEqual(list(read_array(directory, chunks[0], 'steps')), [0, 1, 2])
+            self.assertEqual(list(read_array(directory, chunks[0], 'xs')), [0, 5, 1, 5, 2, 6])
+            self.assertEqual(list(read_array(directory, chunks[1], 'headings')), [1, 1])
+
+    def test_state_before_recording(self):
+        """Test that steps before the first row are refused."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run')
+            engine = FleetEngine(make_fleet([("A", (0, 0), 'E', "FF")]))
+            engine.step()
+            recorder = TrajectoryRecorder(path)
+            engine.add_observer(recorder)
+            engine.run()
+            recorder.close()
+            recording = TrajectoryFile(path)
+            self.assertEqual(recording.state_at(2), {"A": ((2, 0), 'E')})
+            with self.assertRaises(ValueError):
+                recording.state_at(0)
+
+
+if __name__ == '__main__':
+    unittest.main()
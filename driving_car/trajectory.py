@@ -0,0 +1,298 @@
+"""
+Driving Car Simulation - Trajectory Spill
+
+Records full fleet trajectories to disk for runs whose history does not fit
+in memory. A TrajectoryRecorder is a fleet engine observer that appends one
+row per tick (the state of every slot) to memory-mapped chunk files of
+`chunk_ticks` rows; only the chunk being written is mapped, so memory stays
+bounded by the chunk size however long the run is.
+
+A recording at `path` is made of chunk files ``path.00000.bin``,
+``path.00001.bin``, ... and a JSON sidecar ``path.json`` that describes
+every array of every chunk by dtype, byte offset and shape:
+
+- steps  (ticks,)        step number of each row
+- xs, ys (ticks, width)  cell of the car in each slot
+- headings (ticks, width) heading index into COMPASS
+- status (ticks, width)  fleet status code; DESPAWNED slots hold no car
+
+so a chunk array reads as
+``numpy.memmap(chunk_file, dtype, mode='r', offset=offset, shape=shape)``
+without loading the file. Integers use the native byte order and the
+engine's array item sizes, so rows are copied straight from the engine's
+arrays. width is the engine's slot capacity when the chunk was opened; a
+chunk is closed early when the engine grows. The sidecar also lists which
+car held which slot over which steps.
+
+TrajectoryFile reads a recording back with the standard library.
+"""
+
+import json
+import mmap
+import os
+import sys
+from array import array
+from bisect import bisect_right
+
+from fleet import DESPAWNED
+from simulation import COMPASS
+
+FORMAT_VERSION = 1
+BYTE_ORDER = '<' if sys.byteorder == 'little' else '>'
+
+# Chunk arrays as (name, engine typecode, per-slot); 8-byte arrays first to keep them aligned
+CHUNK_ARRAYS = (('steps', 'q', False), ('xs', 'l', True), ('ys', 'l', True), ('headings', 'b', True),
+                ('status', 'b', True))
+# Typecodes to read integers of a given size with
+TYPECODES = {'1': 'b', '2': 'h', '4': 'i', '8': 'q'}
+
+
+def dtype_of(typecode):
+    """Return the NumPy dtype string of an array typecode."""
+    return f"{BYTE_ORDER}i{array(typecode).itemsize}"
+
+
+def chunk_layout(ticks, width):
+    """Return ({name: (offset, shape)}, total bytes) of a chunk of `ticks` rows of `width` slots."""
+    layout = {}
+    offset = 0
+    for name, typecode, per_slot in CHUNK_ARRAYS:
+        shape = (ticks, width) if per_slot else (ticks,)
+        layout[name] = (offset, shape)
+        offset += array(typecode).itemsize * ticks * (width if per_slot else 1)
+    return layout, offset
+
+
+def copy_row(views, row, engine):
+    """Copy the engine's per-slot arrays into row `row` of a chunk layout."""
+    width = views['width']
+    start = row * width
+    views['steps'][row] = engine.step_number
+    views['xs'][start:start + width] = engine.xs
+    views['ys'][start:start + width] = engine.ys
+    views['headings'][start:start + width] = engine.headings
+    views['status'][start:start + width] = engine.status
+
+
+def row_state(views, row, tenancies):
+    """Return {name: ((x, y), heading)} of the cars of `tenancies` on the field in a row."""
+    width = views['width']
+    state = {}
+    for name, slot, first_step, last_step in tenancies:
+        index = row * width + slot
+        if slot < width and views['status'][index] != DESPAWNED:
+            state[name] = ((views['xs'][index], views['ys'][index]), COMPASS[views['headings'][index]])
+    return state
+
+
+def car_trajectory(rows, tenancies):
+    """Return [(step, (x, y), heading)] of a car over (views, row, step) rows, given its tenancies."""
+    trajectory = []
+    for views, row, step_number in rows:
+        for name, slot, first_step, last_step in tenancies:
+            if first_step <= step_number and (last_step is None or step_number <= last_step):
+                index = row * views['width'] + slot
+                if trajectory and trajectory[-1][0] == step_number:
+                    # A spawn rewrote the tick's row in a new chunk
+                    trajectory.pop()
+                trajectory.append((step_number, (views['xs'][index], views['ys'][index]),
+                                   COMPASS[views['headings'][index]]))
+    return trajectory
+
+
+class SlotTenancies(object):
+    """Which car held which slot over which steps: [name, slot, first_step, last_step or None]."""
+
+    def __init__(self, cars=()):
+        self.cars = [list(car) for car in cars]
+        self.open = {car[1]: car for car in self.cars if car[3] is None}
+
+    def place(self, engine, slots):
+        """Start the tenancies of cars placed on the field."""
+        for slot in slots:
+            self.end(slot, engine.step_number)
+            tenancy = [engine.names[slot], slot, engine.step_number, None]
+            self.cars.append(tenancy)
+            self.open[slot] = tenancy
+
+    def remove(self, engine, slot):
+        """End the tenancy of a despawned car."""
+        self.end(slot, engine.step_number - 1 if engine.stepping else engine.step_number)
+
+    def end(self, slot, last_step):
+        """Close a slot's tenancy at `last_step`, if it has an open one."""
+        tenancy = self.open.pop(slot, None)
+        if tenancy is not None:
+            tenancy[3] = last_step
+
+    def prune(self, first_step):
+        """Drop the tenancies that ended before `first_step`."""
+        self.cars = [car for car in self.cars if car[3] is None or car[3] >= first_step]
+
+    def covering(self, step_number):
+        """Return the tenancies covering a step."""
+        return [tuple(car) for car in self.cars
+                if car[2] <= step_number and (car[3] is None or step_number <= car[3])]
+
+    def of(self, car_name):
+        """Return the tenancies of a car."""
+        return [tuple(car) for car in self.cars if car[0] == car_name]
+
+
+class TrajectoryRecorder(object):
+    """Observer that spills every tick of a fleet run to memory-mapped chunk files."""
+
+    def __init__(self, path, chunk_ticks=1024):
+        if chunk_ticks < 1:
+            raise ValueError(f"Chunks must hold at least one tick. Invalid chunk size: '{chunk_ticks}'")
+        self.path = path
+        self.chunk_ticks = chunk_ticks
+        self.chunks = []
+        self.tenancies = SlotTenancies()
+        self.file = None
+        self.map = None
+        self.views = None
+        self.width = 0
+        self.row = 0
+
+    def open_chunk(self, width):
+        """Close the current chunk and map a new one of `width` slots."""
+        self.close_chunk()
+        number = len(self.chunks)
+        file_name = f"{os.path.basename(self.path)}.{number:05d}.bin"
+        layout, size = chunk_layout(self.chunk_ticks, width)
+        self.file = open(os.path.join(os.path.dirname(self.path), file_name), 'w+b')
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        memory = memoryview(self.map)
+        self.views = {}
+        for name, typecode, per_slot in CHUNK_ARRAYS:
+            offset, shape = layout[name]
+            length = array(typecode).itemsize * shape[0] * (width if per_slot else 1)
+            self.views[name] = memory[offset:offset + length].cast(typecode)
+        self.views['width'] = width
+        self.chunks.append({'file': file_name, 'ticks': 0, 'width': width})
+        self.width = width
+        self.row = 0
+
+    def close_chunk(self):
+        """Unmap the current chunk, keeping the rows written so far."""
+        if self.map is None:
+            return
+        for name, _, _ in CHUNK_ARRAYS:
+            self.views[name].release()
+        self.views = None
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+        self.map = self.file = None
+        self.chunks[-1]['ticks'] = self.row
+        self.save_sidecar()
+
+    def write_row(self, engine):
+        """Append the state of every slot on the engine's current tick."""
+        width = len(engine.xs)
+        if self.map is None or self.row == self.chunk_ticks or width != self.width:
+            self.open_chunk(width)
+        copy_row(self.views, self.row, engine)
+        self.row += 1
+
+    def place(self, engine, slots):
+        """Start tenancies for cars placed on the field and write them into the current row."""
+        self.tenancies.place(engine, slots)
+        if self.map is not None and self.row and self.views['steps'][self.row - 1] == engine.step_number \
+                and len(engine.xs) == self.width:
+            # Cars spawned after the tick's row was written
+            self.row -= 1
+        self.write_row(engine)
+
+    def remove(self, engine, slot):
+        """End the tenancy of a despawned car."""
+        self.tenancies.remove(engine, slot)
+
+    def observe(self, engine, moved, old_xs, old_ys):
+        """Write the row of the engine's current tick."""
+        self.write_row(engine)
+
+    def close(self):
+        """Unmap the last chunk and write the sidecar."""
+        self.close_chunk()
+        self.save_sidecar()
+
+    def save_sidecar(self):
+        """Describe the chunks written so far in the JSON sidecar."""
+        chunks = []
+        for chunk in self.chunks:
+            layout, _ = chunk_layout(self.chunk_ticks, chunk['width'])
+            arrays = {}
+            for name, typecode, per_slot in CHUNK_ARRAYS:
+                offset, shape = layout[name]
+                arrays[name] = {'dtype': dtype_of(typecode), 'offset': offset,
+                                'shape': [chunk['ticks']] + list(shape[1:])}
+            chunks.append(dict(chunk, arrays=arrays))
+        sidecar = {'version': FORMAT_VERSION, 'chunk_ticks': self.chunk_ticks, 'chunks': chunks,
+                   'cars': [{'name': name, 'slot': slot, 'first_step': first_step, 'last_step': last_step}
+                            for name, slot, first_step, last_step in self.tenancies.cars]}
+        with open(self.path + '.json', 'w') as sidecar_file:
+            json.dump(sidecar, sidecar_file, indent=1)
+
+
+class TrajectoryFile(object):
+    """Read-only access to a recording made by TrajectoryRecorder."""
+
+    def __init__(self, path):
+        with open(path + '.json') as sidecar_file:
+            self.sidecar = json.load(sidecar_file)
+        if self.sidecar['version'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported trajectory format version: {self.sidecar['version']}")
+        self.directory = os.path.dirname(path)
+        self.tenancies = SlotTenancies((car['name'], car['slot'], car['first_step'], car['last_step'])
+                                       for car in self.sidecar['cars'])
+        self.chunks = [chunk for chunk in self.sidecar['chunks'] if chunk['ticks']]
+        self.first_steps = []
+        self.loaded = {}
+        for number, chunk in enumerate(self.chunks):
+            self.first_steps.append(self.load(number)['steps'][0])
+
+    def load(self, number):
+        """Return {name: array} of a chunk, mapping its file on first use."""
+        views = self.loaded.get(number)
+        if views is None:
+            chunk = self.chunks[number]
+            with open(os.path.join(self.directory, chunk['file']), 'rb') as chunk_file:
+                memory = memoryview(mmap.mmap(chunk_file.fileno(), 0, access=mmap.ACCESS_READ))
+            views = {}
+            for name, _, per_slot in CHUNK_ARRAYS:
+                description = chunk['arrays'][name]
+                if description['dtype'][0] != BYTE_ORDER:
+                    raise ValueError(f"Trajectory chunk {chunk['file']} was written with the other byte order")
+                typecode = TYPECODES[description['dtype'][2:]]
+                length = array(typecode).itemsize * description['shape'][0] * (chunk['width'] if per_slot else 1)
+                views[name] = memory[description['offset']:description['offset'] + length].cast(typecode)
+            views['width'] = chunk['width']
+            self.loaded[number] = views
+        return views
+
+    def find(self, step_number):
+        """Return (chunk arrays, row) of the last row recorded at or before a step."""
+        number = bisect_right(self.first_steps, step_number) - 1
+        if number < 0:
+            raise ValueError(f"Step {step_number} is before the start of the recording")
+        views = self.load(number)
+        return views, bisect_right(views['steps'], step_number) - 1
+
+    def state_at(self, step_number):
+        """Return {name: ((x, y), heading)} of the cars on the field after a step."""
+        views, row = self.find(step_number)
+        return row_state(views, row, self.tenancies.covering(step_number))
+
+    def rows(self):
+        """Yield (chunk arrays, row, step) for every recorded row, in order."""
+        for number in range(len(self.chunks)):
+            views = self.load(number)
+            for row, step_number in enumerate(views['steps']):
+                yield views, row, step_number
+
+    def trajectory(self, car_name):
+        """Return [(step, (x, y), heading)] for every recorded row of a car's tenancies."""
+        return car_trajectory(self.rows(), self.tenancies.of(car_name))
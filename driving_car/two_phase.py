@@ -0,0 +1,360 @@
+"""
+Driving Car Simulation - Two-Phase Engine
+
+Phase one computes every car's collision-free trajectory once. Phase two
+hash-joins the (cell, step) visits of all cars to find the earliest
+collision, truncates the cars involved (they stop, as in the step engine)
+and repeats until no collision is left. The outcome is identical to
+``simulation.run_reference_engine``.
+"""
+
+import heapq
+from bisect import bisect_right
+
+from simulation import COMPASS, VECTORS, new_result, add_collision, add_boundary_violation, get_program
+from segments import compile_segments, truncate_segments, first_meeting, position_at, heading_at, bounding_box
+
+# Car entry keys that only the fleet engine understands
+UNSUPPORTED_KEYS = ('start', 'period', 'pauses')
+
+
+def check_supported(car_data):
+    """Raise ValueError for a car entry the two-phase engines cannot run."""
+    for key in UNSUPPORTED_KEYS:
+        if key in car_data:
+            raise ValueError(f"The two-phase engines do not support '{key}'. Use the step engine instead.")
+    if car_data['car'].speed != 1:
+        raise ValueError("The two-phase engines only support cars with speed 1. Use the step engine instead.")
+    if len(car_data['car'].footprint) > 1:
+        raise ValueError("The two-phase engines only support single-cell cars. Use the step engine instead.")
+
+
+def compile_trajectory(position, direction, program, field_bounds=None):
+    """Compute the free trajectory of a car that never collides.
+
+    Returns (path, headings, violations) where path[s - 1] and headings[s - 1]
+    are the cell and heading index after step s, and violations lists
+    (step, rejected_cell) for every forward move that would leave the field.
+    """
+    x, y = position
+    heading = COMPASS.index(direction)
+    path = []
+    headings = []
+    violations = []
+    for step_number, command in enumerate(program, 1):
+        if command == 'R':
+            heading = (heading + 1) % 4
+        elif command == 'L':
+            heading = (heading - 1) % 4
+        elif command == 'F':
+            dx, dy = VECTORS[heading]
+            new_x = x + dx
+            new_y = y + dy
+            if new_x < 0 or new_y < 0 or (field_bounds and (new_x >= field_bounds[0] or new_y >= field_bounds[1])):
+                violations.append((step_number, (new_x, new_y)))
+            else:
+                x, y = new_x, new_y
+        else:
+            # Car.move raises for unknown commands, which the step engine reports as a violation
+            violations.append((step_number, (x, y)))
+        path.append((x, y))
+        headings.append(heading)
+    return path, headings, violations
+
+
+class TwoPhaseEngine(object):
+    """Free trajectories plus a (cell, step) hash join for collisions."""
+
+    def __init__(self, cars_with_commands, verbose=False, fragment_cache=None):
+        for car_data in cars_with_commands:
+            check_supported(car_data)
+        self.cars_with_commands = cars_with_commands
+        self.verbose = verbose
+        # A fragments.FragmentCache to compile the trajectories from, shared between engines
+        self.fragment_cache = fragment_cache
+        self.names = [car_data['car'].get_car_name() for car_data in cars_with_commands]
+        self.paths = []
+        # Start cells, where cars with an empty program stay parked
+        self.origins = []
+        self.headings = []
+        self.violations = []
+        self.end = []
+        self.visits = {}
+        self.occupants = {}
+        self.parked = {}
+
+    def compile(self):
+        """Phase one: compute each car's collision-free trajectory."""
+        for car_data in self.cars_with_commands:
+            path, headings, violations = self.compile_car(car_data)
+            self.origins.append(car_data['car'].get_car_position())
+            self.paths.append(path)
+            self.headings.append(headings)
+            self.violations.append(violations)
+            self.end.append(len(path))
+
+    def compile_car(self, car_data):
+        """Return the (path, headings, violations) of a car's free trajectory."""
+        car = car_data['car']
+        if self.fragment_cache is None:
+            return compile_trajectory(car.get_car_position(), car.get_facing(), get_program(car_data),
+                                      car.field_bounds)
+        from fragments import compile_fragments
+        return compile_fragments(car.get_car_position(), car.get_facing(), car_data['commands'], car.field_bounds,
+                                 self.fragment_cache)
+
+    def build_index(self):
+        """Index every (cell, step) visit and every car's parking cell."""
+        for index, path in enumerate(self.paths):
+            for step_number, cell in enumerate(path, 1):
+                self.visits.setdefault(cell, []).append((step_number, index))
+                self.occupants.setdefault((cell, step_number), []).append(index)
+            self.parked.setdefault(self.parking_cell(index), set()).add(index)
+        for cell_visits in self.visits.values():
+            cell_visits.sort()
+
+    def initial_candidates(self):
+        """Return (step, cell) pairs where a collision may happen on the free trajectories."""
+        candidates = [(step_number, cell) for (cell, step_number), cars in self.occupants.items() if len(cars) > 1]
+        for index, path in enumerate(self.paths):
+            candidates.extend(self.arrivals(self.parking_cell(index), len(path), index))
+        if any(self.paths):
+            candidates.extend((1, cell) for cell in self.shared_origins())
+        return candidates
+
+    def shared_origins(self):
+        """Return the start cells shared by cars that never move; they collide on step 1 if there is one."""
+        counts = {}
+        for index, end in enumerate(self.end):
+            if not end:
+                counts[self.origins[index]] = counts.get(self.origins[index], 0) + 1
+        return [cell for cell, count in counts.items() if count > 1]
+
+    def parking_cell(self, index):
+        """Return the cell a car stops on, its start cell if it never moves."""
+        end = self.end[index]
+        return self.paths[index][end - 1] if end else self.origins[index]
+
+    def arrivals(self, cell, after_step, parked_car):
+        """Candidates created by a car parked on `cell` after `after_step`."""
+        cell_visits = self.visits.get(cell, [])
+        start = bisect_right(cell_visits, (after_step, len(self.paths)))
+        return [(step_number, cell) for step_number, index in cell_visits[start:] if index != parked_car]
+
+    def cars_at(self, cell, step_number):
+        """Return the cars on `cell` after `step_number`, given the current truncations."""
+        movers = [index for index in self.occupants.get((cell, step_number), []) if step_number <= self.end[index]]
+        waiting = [index for index in self.parked.get(cell, ()) if self.end[index] < step_number]
+        return movers, waiting
+
+    def resolve(self, result, candidates, until_step=None):
+        """Phase two: process collision candidates in step order, truncating collided cars."""
+        heapq.heapify(candidates)
+        while candidates:
+            step_number = candidates[0][0]
+            if until_step is not None and step_number > until_step:
+                break
+            cells = set()
+            while candidates and candidates[0][0] == step_number:
+                cells.add(heapq.heappop(candidates)[1])
+
+            pairs = []
+            for cell in cells:
+                movers, waiting = self.cars_at(cell, step_number)
+                # Cars that were all parked here already met when the last of them arrived,
+                # except cars parked here from the start, which meet on step 1 as in the reference engine
+                if not movers and (step_number > 1 or not any(self.paths)) or len(movers) + len(waiting) < 2:
+                    continue
+                group = sorted(movers + waiting)
+                for i in range(len(group)):
+                    for j in range(i + 1, len(group)):
+                        pairs.append((group[i], group[j], cell))
+            if not pairs:
+                continue
+
+            pairs.sort()
+            collided = set()
+            for i, j, cell in pairs:
+                self.collide(result, i, j, cell, step_number)
+                collided.update((i, j))
+            for index in sorted(collided):
+                result['collided_cars'].add(self.names[index])
+                if self.end[index] > step_number:
+                    candidates.extend(self.truncate(index, step_number))
+            heapq.heapify(candidates)
+
+    def collide(self, result, i, j, cell, step_number):
+        """Record the collision of cars i < j on a cell."""
+        add_collision(result, self.names[i], self.names[j], cell, step_number, self.verbose)
+
+    def truncate(self, index, step_number):
+        """Stop a car after `step_number` and return the candidates its new parking cell creates."""
+        self.parked[self.parking_cell(index)].discard(index)
+        self.end[index] = step_number
+        cell = self.paths[index][step_number - 1]
+        self.parked.setdefault(cell, set()).add(index)
+        return self.arrivals(cell, step_number, index)
+
+    def finish(self, result):
+        """Write final states back to the cars and collect boundary violations."""
+        violations = []
+        for index, car_data in enumerate(self.cars_with_commands):
+            car = car_data['car']
+            last = self.end[index] - 1
+            # A car with an empty program stays as it started
+            if last >= 0:
+                car.position = self.paths[index][last]
+                car.direction = COMPASS[self.headings[index][last]]
+            for step_number, cell in self.violations[index]:
+                if step_number > self.end[index]:
+                    break
+                violations.append((step_number, index, cell))
+        for step_number, index, cell in sorted(violations):
+            add_boundary_violation(result, self.names[index], cell, step_number)
+        result['steps'] = max(len(path) for path in self.paths) if self.paths else 0
+        return result
+
+    def run(self):
+        """Run both phases and return the simulation result."""
+        result = new_result()
+        self.compile()
+        self.build_index()
+        self.resolve(result, self.initial_candidates())
+        return self.finish(result)
+
+
+class SegmentEngine(TwoPhaseEngine):
+    """Two-phase engine whose collision phase solves segment pairs analytically.
+
+    Trajectories are compiled into straight run segments, so the cost of
+    checking two interacting cars depends on their number of segments rather
+    than on the number of steps they drive.
+    """
+
+    def __init__(self, cars_with_commands, verbose=False):
+        super(SegmentEngine, self).__init__(cars_with_commands, verbose)
+        self.segments = []
+        self.turns = []
+        self.boxes = []
+        self.versions = []
+        self.met = set()
+
+    def compile(self):
+        """Phase one: compile each car's collision-free trajectory into run segments."""
+        for car_data in self.cars_with_commands:
+            car = car_data['car']
+            program = get_program(car_data)
+            segments, turns, violations = compile_segments(
+                car.get_car_position(), car.get_facing(), program, car.field_bounds)
+            self.segments.append(segments)
+            self.turns.append(turns)
+            self.violations.append(violations)
+            self.boxes.append(bounding_box(segments))
+            self.end.append(len(program))
+            self.versions.append(0)
+
+    def event(self, i, j, lo):
+        """Return the heap entry for the next meeting of cars i and j at or after step `lo`."""
+        meeting = first_meeting(self.segments[i], self.segments[j], lo)
+        if meeting is None:
+            return None
+        step_number, kind, cell = meeting
+        return (step_number, i, j, self.versions[i], self.versions[j], cell)
+
+    def initial_events(self):
+        """Sweep and prune over the trajectory bounding boxes to find interacting pairs."""
+        events = []
+        order = sorted(range(len(self.segments)), key=lambda index: self.boxes[index][0])
+        sweep = []
+        for index in order:
+            min_x, min_y, max_x, max_y = self.boxes[index]
+            sweep = [other for other in sweep if self.boxes[other][2] >= min_x]
+            for other in sweep:
+                box = self.boxes[other]
+                if box[1] <= max_y and min_y <= box[3]:
+                    event = self.event(min(index, other), max(index, other), 1)
+                    if event is not None:
+                        events.append(event)
+            sweep.append(index)
+        return events
+
+    def resolve(self, result, events, until_step=None):
+        """Phase two: pop pair meetings in step order, truncating collided cars."""
+        heapq.heapify(events)
+        while events:
+            step_number = events[0][0]
+            if until_step is not None and step_number > until_step:
+                break
+            meetings = {}
+            while events and events[0][0] == step_number:
+                _, i, j, version_i, version_j, cell = heapq.heappop(events)
+                if (version_i, version_j) == (self.versions[i], self.versions[j]) and (i, j) not in self.met:
+                    meetings[(i, j)] = cell
+            if not meetings:
+                continue
+
+            pairs = sorted((i, j, cell) for (i, j), cell in meetings.items())
+            collided = set()
+            for i, j, cell in pairs:
+                add_collision(result, self.names[i], self.names[j], cell, step_number, self.verbose)
+                self.met.add((i, j))
+                collided.update((i, j))
+            truncated = []
+            for index in sorted(collided):
+                result['collided_cars'].add(self.names[index])
+                if self.end[index] > step_number:
+                    self.end[index] = step_number
+                    self.segments[index] = truncate_segments(self.segments[index], step_number)
+                    self.versions[index] += 1
+                    truncated.append(index)
+            for index in truncated:
+                for event in self.reschedule(index, step_number + 1):
+                    heapq.heappush(events, event)
+
+    def reschedule(self, index, lo):
+        """Recompute the next meetings of a truncated car with every car that can reach its cell."""
+        x, y = position_at(self.segments[index], lo)
+        events = []
+        for other, (min_x, min_y, max_x, max_y) in enumerate(self.boxes):
+            if other == index or not (min_x <= x <= max_x and min_y <= y <= max_y):
+                continue
+            i, j = min(index, other), max(index, other)
+            if (i, j) in self.met:
+                continue
+            event = self.event(i, j, lo)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def finish(self, result):
+        """Write final states back to the cars and collect boundary violations."""
+        violations = []
+        for index, car_data in enumerate(self.cars_with_commands):
+            car = car_data['car']
+            car.position = position_at(self.segments[index], self.end[index])
+            car.direction = COMPASS[heading_at(self.turns[index], self.end[index])]
+            for first_step, last_step, cell in self.violations[index]:
+                for step_number in range(first_step, min(last_step, self.end[index]) + 1):
+                    violations.append((step_number, index, cell))
+        for step_number, index, cell in sorted(violations):
+            add_boundary_violation(result, self.names[index], cell, step_number)
+        result['steps'] = max(self.end) if self.end else 0
+        return result
+
+    def run(self):
+        """Run both phases and return the simulation result."""
+        result = new_result()
+        self.compile()
+        self.resolve(result, self.initial_events())
+        return self.finish(result)
+
+
+def run_two_phase_engine(cars_with_commands, verbose=False, collision_phase='hash'):
+    """Run the two-phase engine on a list of cars.
+
+    collision_phase selects the (cell, step) hash join ('hash') or the
+    analytic segment-pair solver ('segments').
+    """
+    if collision_phase == 'segments':
+        return SegmentEngine(cars_with_commands, verbose).run()
+    return TwoPhaseEngine(cars_with_commands, verbose).run()